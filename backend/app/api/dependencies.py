@@ -38,3 +38,8 @@ async def get_current_user(
         )
     
     return response.data[0]
+
+
+async def get_current_user_id(current_user = Depends(get_current_user)) -> str:
+    """Id of the authenticated user, for endpoints that only scope queries by it"""
+    return current_user["id"]
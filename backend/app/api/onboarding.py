@@ -1,202 +1,177 @@
 # Onboarding API endpoints for medical profile
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
+from postgrest.exceptions import APIError
+from typing import Any, Dict, Optional
 class OnboardingAnswerRequest(BaseModel):
     user_id: str
     answer: dict
 
+class OnboardingBulkAnswerRequest(BaseModel):
+    user_id: str
+    answers: Dict[str, Any]  # field -> free-text answer (or structured rows for related fields)
+
 class OnboardingSkipRequest(BaseModel):
     user_id: str
 from app.core.database import get_supabase
 ## ORM model imports removed; only Supabase client is used
-from app.core.profile_scoring import calculate_profile_completion, CRITICAL_FIELDS, IMPORTANT_FIELDS, ENHANCEMENT_FIELDS
-from typing import Optional
-import re
+from app.core.profile_scoring import CRITICAL_FIELDS, IMPORTANT_FIELDS, ENHANCEMENT_FIELDS, RELATED_FIELDS
+from app.core.profile_store import (
+    fetch_profile_with_related, refresh_completion_score, strip_related, stored_completion_score,
+    write_related_records, bootstrap_onboarding, PROFILE_FIELDS
+)
+from app.core.onboarding_parsers import parse_answer
+from app.core.tracing import span
 
 router = APIRouter()
 
-@router.get("/onboarding/profile", summary="Get user medical profile and completion score")
-def get_profile(user_id: str, supabase=Depends(get_supabase)):
-    # Fetch medical profile from Supabase using UUID user_id
-    profile_resp = supabase.table("user_medical_profiles").select("*").eq("user_id", user_id).execute()
-    profile = profile_resp.data[0] if profile_resp.data else None
+
+def _next_question(profile, answered_none=()):
+    # Related fields are embedded lists (see fetch_profile_with_related), so an
+    # empty table reads as unanswered just like an empty column, unless the
+    # session records that the user answered "none"
+    for field in CRITICAL_FIELDS + IMPORTANT_FIELDS + ENHANCEMENT_FIELDS:
+        if not profile.get(field) and field not in answered_none:
+            return field
+    return None
+
+
+def _answered_none(session: Optional[dict]) -> list:
+    return list((session or {}).get("answered_none") or [])
+
+
+def _apply_answers(supabase, user_id: str, parsed: dict, last_question: Optional[str], session: dict) -> dict:
+    """
+    Persist parsed answers with one profile update and one related-table RPC,
+    then recompute the score and advance the session in a single update each.
+    Related fields answered "none" (parsed to []) are recorded on the session.
+    """
+    columns = {f: v for f, v in parsed.items() if f in PROFILE_FIELDS and v is not None}
+    related = {f: v for f, v in parsed.items() if f in RELATED_FIELDS and v}
+    answered_none = _answered_none(session)
+    answered_none += [f for f, v in parsed.items() if f in RELATED_FIELDS and v == [] and f not in answered_none]
+    if columns:
+        update_resp = supabase.table("user_medical_profiles").update(columns).eq("user_id", user_id).execute()
+        if not update_resp.data:
+            raise HTTPException(status_code=404, detail="Profile not found")
+    if related:
+        try:
+            write_related_records(supabase, user_id, related, {})
+        except APIError as e:
+            if e.code == "P0002":
+                raise HTTPException(status_code=404, detail="Profile not found")
+            raise HTTPException(status_code=400, detail=f"Saving answers failed: {e.message}")
+
+    with span("onboarding.refresh_score"):
+        profile = refresh_completion_score(supabase, user_id=user_id)
     if not profile:
-        # Auto-create empty medical profile for user (UUID)
-        insert_resp = supabase.table("user_medical_profiles").insert({"user_id": user_id}).execute()
-        profile = insert_resp.data[0]
-    score = calculate_profile_completion(profile)
-    # Ensure onboarding session exists and is active
-    session_resp = supabase.table("onboarding_sessions").select("*").eq("user_id", user_id).execute()
+        raise HTTPException(status_code=404, detail="Profile not found")
+    score = stored_completion_score(profile)
+    next_field = _next_question(profile, answered_none)
+    session_update = {"progress": score, "current_step": next_field, "answered_none": answered_none}
+    if last_question:
+        session_update["last_question"] = last_question
+    if score >= 70:
+        session_update["is_active"] = False
+    session_resp = supabase.table("onboarding_sessions").update(session_update).eq("user_id", user_id).execute()
     session = session_resp.data[0] if session_resp.data else None
-    if not session or not session.get("is_active", False):
-        # Create a new onboarding session if missing or inactive
-        insert_resp = supabase.table("onboarding_sessions").insert({"user_id": user_id, "is_active": True}).execute()
-        session = insert_resp.data[0]
-    # Determine next question
-    next_question = session.get("current_step")
-    if not next_question:
-        # If current_step is not set, pick the first unanswered field
-        for field in CRITICAL_FIELDS + IMPORTANT_FIELDS + ENHANCEMENT_FIELDS:
-            if not profile.get(field):
-                next_question = field
-                supabase.table("onboarding_sessions").update({"current_step": next_question}).eq("user_id", user_id).execute()
-                break
-    return {"profile": profile, "completion_score": score, "next_question": next_question}
+    return {
+        "profile": strip_related(profile),
+        "completion_score": score,
+        "session": session,
+        "next_question": next_field
+    }
+
+def _bootstrap(supabase, user_id: str) -> tuple:
+    try:
+        return bootstrap_onboarding(supabase, user_id)
+    except APIError as e:
+        if e.code == "23503":  # no such user in profiles
+            raise HTTPException(status_code=404, detail="User not found")
+        raise HTTPException(status_code=400, detail=f"Onboarding bootstrap failed: {e.message}")
+
+@router.get("/onboarding/profile", summary="Get user medical profile and completion score")
+def get_profile(user_id: str, supabase=Depends(get_supabase)):
+    # Reads only once the profile exists; a first call from a client that never calls
+    # POST /onboarding/bootstrap creates it through the same idempotent RPC
+    profile = fetch_profile_with_related(supabase, user_id=user_id)
+    if profile:
+        session_resp = supabase.table("onboarding_sessions").select("current_step, answered_none").eq("user_id", user_id).execute()
+        session = session_resp.data[0] if session_resp.data else {}
+    else:
+        profile, session = _bootstrap(supabase, user_id)
+    next_question = session.get("current_step") or _next_question(profile, _answered_none(session))
+    return {"profile": strip_related(profile), "completion_score": stored_completion_score(profile), "next_question": next_question}
+
+@router.post("/onboarding/bootstrap", summary="Create or return medical profile and active onboarding session (idempotent)")
+def bootstrap(user_id: str, supabase=Depends(get_supabase)):
+    profile, session = _bootstrap(supabase, user_id)
+    # An unset current_step means "first unanswered field"; submit_answer falls back the same way
+    next_question = session.get("current_step") or _next_question(profile, _answered_none(session))
+    return {
+        "profile": strip_related(profile),
+        "completion_score": stored_completion_score(profile),
+        "session": session,
+        "next_question": next_question
+    }
 
 @router.post("/onboarding/start", summary="Start onboarding session")
 def start_onboarding(user_id: str, supabase=Depends(get_supabase)):
-    session_resp = supabase.table("onboarding_sessions").select("*").eq("user_id", user_id).execute()
-    session = session_resp.data[0] if session_resp.data else None
-    if session and session["is_active"]:
-        return {"session": session}
-    insert_resp = supabase.table("onboarding_sessions").insert({"user_id": user_id, "is_active": True}).execute()
-    session = insert_resp.data[0]
+    _, session = _bootstrap(supabase, user_id)
     return {"session": session}
 
 @router.post("/onboarding/answer", summary="Submit onboarding answer and update profile")
 def submit_answer(request: OnboardingAnswerRequest, supabase=Depends(get_supabase)):
     user_id = request.user_id
     answer = request.answer
-    profile_resp = supabase.table("user_medical_profiles").select("*").eq("user_id", user_id).execute()
-    profile = profile_resp.data[0] if profile_resp.data else None
+    profile = fetch_profile_with_related(supabase, user_id=user_id)
     session_resp = supabase.table("onboarding_sessions").select("*").eq("user_id", user_id).execute()
     session = session_resp.data[0] if session_resp.data else None
     if not session or not session["is_active"]:
         raise HTTPException(status_code=400, detail="No active onboarding session")
 
-    def extract_field(field, answer):
-        if field == 'age':
-            m = re.search(r'(\d{1,3})', str(answer.get('age', answer.get('response', ''))))
-            return int(m.group(1)) if m else None
-        if field == 'biological_sex':
-            val = str(answer.get('biological_sex', answer.get('response', '')).lower())
-            if 'male' in val:
-                return 'male'
-            if 'female' in val:
-                return 'female'
-            if 'other' in val:
-                return 'other'
-            return None
-        return answer.get(field)
-
-    def get_next_question(profile):
-        # Helper to check related table existence
-        def has_related(table, profile_id):
-            resp = supabase.table(table).select("id").eq("profile_id", profile_id).execute()
-            return bool(resp.data)
-
-        for field in CRITICAL_FIELDS:
-            if field == 'chronic_conditions':
-                if not has_related('chronic_conditions', profile['id']):
-                    return field
-            elif field == 'medications':
-                if not has_related('medications', profile['id']):
-                    return field
-            elif field == 'allergies':
-                if not has_related('allergies', profile['id']):
-                    return field
-            else:
-                if not profile.get(field):
-                    return field
-        for field in IMPORTANT_FIELDS:
-            if field == 'surgical_history':
-                if not has_related('surgical_history', profile['id']):
-                    return field
-            elif field == 'family_history':
-                if not has_related('family_history', profile['id']):
-                    return field
-            else:
-                if not profile.get(field):
-                    return field
-        for field in ENHANCEMENT_FIELDS:
-            if field == 'lab_values':
-                if not has_related('lab_values', profile['id']):
-                    return field
-            else:
-                if not profile.get(field):
-                    return field
-        return None
-
-    current_field = session.get("current_step") or get_next_question(profile)
+    current_field = session.get("current_step") or _next_question(profile, _answered_none(session))
+    parsed = {}
     if current_field:
-        value = extract_field(current_field, answer)
-        if value is not None:
-            supabase.table("user_medical_profiles").update({current_field: value}).eq("user_id", user_id).execute()
-        supabase.table("onboarding_sessions").update({"last_question": current_field}).eq("user_id", user_id).execute()
-
-    profile_resp = supabase.table("user_medical_profiles").select("*").eq("user_id", user_id).execute()
-    profile = profile_resp.data[0] if profile_resp.data else None
-    score = calculate_profile_completion(profile)
-    supabase.table("onboarding_sessions").update({"progress": score}).eq("user_id", user_id).execute()
-    if score >= 70:
-        supabase.table("onboarding_sessions").update({"is_active": False}).eq("user_id", user_id).execute()
+        parsed[current_field] = parse_answer(current_field, answer.get(current_field, answer.get('response')))
+    return _apply_answers(supabase, user_id, parsed, current_field, session)
 
-    next_field = get_next_question(profile)
-    supabase.table("onboarding_sessions").update({"current_step": next_field}).eq("user_id", user_id).execute()
+@router.post("/onboarding/answers", summary="Submit many onboarding answers at once (field -> free text)")
+def submit_answers(request: OnboardingBulkAnswerRequest, supabase=Depends(get_supabase)):
+    user_id = request.user_id
+    unknown = [f for f in request.answers if f not in PROFILE_FIELDS + RELATED_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
     session_resp = supabase.table("onboarding_sessions").select("*").eq("user_id", user_id).execute()
     session = session_resp.data[0] if session_resp.data else None
-    return {
-        "profile": profile,
-        "completion_score": score,
-        "session": session,
-        "next_question": next_field
-    }
+    if not session or not session["is_active"]:
+        raise HTTPException(status_code=400, detail="No active onboarding session")
+
+    with span("onboarding.parse_answers", {"onboarding.fields": len(request.answers)}) as sp:
+        parsed = {field: parse_answer(field, raw) for field, raw in request.answers.items()}
+        sp.set_attribute("onboarding.unparsed", sum(1 for v in parsed.values() if v is None))
+    last_question = next(reversed(request.answers), None)
+    result = _apply_answers(supabase, user_id, parsed, last_question, session)
+    result["parsed"] = {f: v for f, v in parsed.items() if v is not None}
+    result["unparsed"] = [f for f, v in parsed.items() if v is None]
+    return result
 
 @router.post("/onboarding/skip", summary="Skip current onboarding question")
 def skip_question(request: OnboardingSkipRequest, supabase=Depends(get_supabase)):
     user_id = request.user_id
     session_resp = supabase.table("onboarding_sessions").select("*").eq("user_id", user_id).execute()
     session = session_resp.data[0] if session_resp.data else None
-    profile_resp = supabase.table("user_medical_profiles").select("*").eq("user_id", user_id).execute()
-    profile = profile_resp.data[0] if profile_resp.data else None
+    profile = fetch_profile_with_related(supabase, user_id=user_id)
     if not session or not session["is_active"]:
         raise HTTPException(status_code=400, detail="No active onboarding session")
-    def get_next_question(profile):
-        def has_related(table, profile_id):
-            resp = supabase.table(table).select("id").eq("profile_id", profile_id).execute()
-            return bool(resp.data)
-
-        for field in CRITICAL_FIELDS:
-            if field == 'chronic_conditions':
-                if not has_related('chronic_conditions', profile['id']):
-                    return field
-            elif field == 'medications':
-                if not has_related('medications', profile['id']):
-                    return field
-            elif field == 'allergies':
-                if not has_related('allergies', profile['id']):
-                    return field
-            else:
-                if not profile.get(field):
-                    return field
-        for field in IMPORTANT_FIELDS:
-            if field == 'surgical_history':
-                if not has_related('surgical_history', profile['id']):
-                    return field
-            elif field == 'family_history':
-                if not has_related('family_history', profile['id']):
-                    return field
-            else:
-                if not profile.get(field):
-                    return field
-        for field in ENHANCEMENT_FIELDS:
-            if field == 'lab_values':
-                if not has_related('lab_values', profile['id']):
-                    return field
-            else:
-                if not profile.get(field):
-                    return field
-        return None
-    next_field = get_next_question(profile)
+    next_field = _next_question(profile, _answered_none(session))
     supabase.table("onboarding_sessions").update({"current_step": next_field}).eq("user_id", user_id).execute()
     session_resp = supabase.table("onboarding_sessions").select("*").eq("user_id", user_id).execute()
     session = session_resp.data[0] if session_resp.data else None
-    # Also return updated profile and completion_score for frontend state sync
-    profile_resp = supabase.table("user_medical_profiles").select("*").eq("user_id", user_id).execute()
-    profile = profile_resp.data[0] if profile_resp.data else None
-    score = calculate_profile_completion(profile)
+    # Also return profile and stored completion_score for frontend state sync
+    score = stored_completion_score(profile)
     return {
-        "profile": profile,
+        "profile": strip_related(profile),
         "completion_score": score,
         "session": session,
         "next_question": next_field
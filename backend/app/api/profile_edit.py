@@ -1,10 +1,70 @@
 # Manual editing endpoints for medical profile
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from pydantic import BaseModel
+from postgrest.exceptions import APIError
+from typing import List, Optional, Union
+from app.api.dependencies import get_current_user_id
 from app.core.database import get_supabase
-from app.core.profile_scoring import CRITICAL_FIELDS, IMPORTANT_FIELDS, ENHANCEMENT_FIELDS
+from app.core.fhir_import import import_fhir, is_ndjson, INVALID_INPUT_ERRORS
+from app.core.profile_scoring import CRITICAL_FIELDS, IMPORTANT_FIELDS, ENHANCEMENT_FIELDS, RELATED_FIELDS
+from app.core.profile_store import (
+    fetch_full_profile, refresh_completion_score, strip_related, stored_completion_score,
+    write_related_records, PROFILE_FIELDS
+)
+
+
+class RelatedRecordsUpsert(BaseModel):
+    # Rows without "id" are inserted; rows with "id" update only the keys they carry
+    chronic_conditions: List[dict] = []
+    medications: List[dict] = []
+    allergies: List[dict] = []
+    surgical_history: List[dict] = []
+    family_history: List[dict] = []
+    lab_values: List[dict] = []
+
+class RelatedRecordsDelete(BaseModel):
+    chronic_conditions: List[Union[int, str]] = []
+    medications: List[Union[int, str]] = []
+    allergies: List[Union[int, str]] = []
+    surgical_history: List[Union[int, str]] = []
+    family_history: List[Union[int, str]] = []
+    lab_values: List[Union[int, str]] = []
 
 router = APIRouter()
 
+
+def _bulk_write_related(supabase, user_id: str, upserts: dict, deletes: dict) -> dict:
+    # One RPC: profile_id resolved once, one statement per table, single transaction
+    try:
+        result = write_related_records(supabase, user_id, upserts, deletes)
+    except APIError as e:
+        if e.code == "P0002":
+            raise HTTPException(status_code=404, detail="Profile not found")
+        raise HTTPException(status_code=400, detail=f"Bulk write failed: {e.message}")
+    profile = refresh_completion_score(supabase, user_id=user_id)
+    return {
+        "records": result.get("records", {}),
+        "deleted": result.get("deleted", {}),
+        "completion_score": stored_completion_score(profile),
+    }
+
+@router.get("/profile/full", summary="Profile, all related records and completion score in one read")
+def get_full_profile(
+    fields: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id),
+    supabase=Depends(get_supabase)
+):
+    selected = None
+    if fields:
+        selected = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in selected if f not in PROFILE_FIELDS + RELATED_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    result = fetch_full_profile(supabase, user_id, selected)
+    if not result:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return result
+
 @router.put("/profile/edit", summary="Edit medical profile fields")
 def edit_profile(user_id: int, updates: dict, supabase=Depends(get_supabase)):
     profile_resp = supabase.table("user_medical_profiles").select("*").eq("user_id", user_id).execute()
@@ -13,9 +73,8 @@ def edit_profile(user_id: int, updates: dict, supabase=Depends(get_supabase)):
         raise HTTPException(status_code=404, detail="Profile not found")
     update_fields = {k: v for k, v in updates.items() if k in CRITICAL_FIELDS + IMPORTANT_FIELDS + ENHANCEMENT_FIELDS}
     supabase.table("user_medical_profiles").update(update_fields).eq("user_id", user_id).execute()
-    updated_profile_resp = supabase.table("user_medical_profiles").select("*").eq("user_id", user_id).execute()
-    updated_profile = updated_profile_resp.data[0] if updated_profile_resp.data else None
-    return {"profile": updated_profile}
+    updated_profile = refresh_completion_score(supabase, profile_id=profile["id"])
+    return {"profile": strip_related(updated_profile)}
 
 @router.post("/profile/add-condition", summary="Add chronic condition")
 def add_condition(user_id: int, condition: dict, supabase=Depends(get_supabase)):
@@ -25,11 +84,14 @@ def add_condition(user_id: int, condition: dict, supabase=Depends(get_supabase))
         raise HTTPException(status_code=404, detail="Profile not found")
     condition_data = {"profile_id": profile["id"], **condition}
     insert_resp = supabase.table("chronic_conditions").insert(condition_data).execute()
+    refresh_completion_score(supabase, profile_id=profile["id"])
     return {"condition": insert_resp.data[0] if insert_resp.data else None}
 
 @router.delete("/profile/delete-condition/{condition_id}", summary="Delete chronic condition")
 def delete_condition(user_id: int, condition_id: int, supabase=Depends(get_supabase)):
     delete_resp = supabase.table("chronic_conditions").delete().eq("id", condition_id).execute()
+    if delete_resp.data:
+        refresh_completion_score(supabase, profile_id=delete_resp.data[0]["profile_id"])
     return {"deleted": True}
 
 @router.post("/profile/add-medication", summary="Add medication")
@@ -40,11 +102,14 @@ def add_medication(user_id: int, medication: dict, supabase=Depends(get_supabase
         raise HTTPException(status_code=404, detail="Profile not found")
     med_data = {"profile_id": profile["id"], **medication}
     insert_resp = supabase.table("medications").insert(med_data).execute()
+    refresh_completion_score(supabase, profile_id=profile["id"])
     return {"medication": insert_resp.data[0] if insert_resp.data else None}
 
 @router.delete("/profile/delete-medication/{medication_id}", summary="Delete medication")
 def delete_medication(user_id: int, medication_id: int, supabase=Depends(get_supabase)):
     delete_resp = supabase.table("medications").delete().eq("id", medication_id).execute()
+    if delete_resp.data:
+        refresh_completion_score(supabase, profile_id=delete_resp.data[0]["profile_id"])
     return {"deleted": True}
 
 @router.post("/profile/add-allergy", summary="Add allergy")
@@ -55,11 +120,42 @@ def add_allergy(user_id: int, allergy: dict, supabase=Depends(get_supabase)):
         raise HTTPException(status_code=404, detail="Profile not found")
     allergy_data = {"profile_id": profile["id"], **allergy}
     insert_resp = supabase.table("allergies").insert(allergy_data).execute()
+    refresh_completion_score(supabase, profile_id=profile["id"])
     return {"allergy": insert_resp.data[0] if insert_resp.data else None}
 
 @router.delete("/profile/delete-allergy/{allergy_id}", summary="Delete allergy")
 def delete_allergy(user_id: int, allergy_id: int, supabase=Depends(get_supabase)):
     delete_resp = supabase.table("allergies").delete().eq("id", allergy_id).execute()
+    if delete_resp.data:
+        refresh_completion_score(supabase, profile_id=delete_resp.data[0]["profile_id"])
     return {"deleted": True}
 
-# Similar endpoints can be added for surgical history, family history, lab values
+@router.post("/profile/bulk-upsert", summary="Insert/update many related records (all six history tables)")
+def bulk_upsert_related(
+    records: RelatedRecordsUpsert,
+    user_id: str = Depends(get_current_user_id),
+    supabase=Depends(get_supabase)
+):
+    return _bulk_write_related(supabase, user_id, records.dict(), {})
+
+@router.post("/profile/bulk-delete", summary="Delete many related records by id (all six history tables)")
+def bulk_delete_related(
+    ids: RelatedRecordsDelete,
+    user_id: str = Depends(get_current_user_id),
+    supabase=Depends(get_supabase)
+):
+    return _bulk_write_related(supabase, user_id, {}, ids.dict())
+
+@router.post("/profile/import-fhir", summary="Import history from a FHIR Bundle or NDJSON file (streamed, batched, deduplicated)")
+def import_fhir_records(
+    file: UploadFile = File(...),
+    user_id: str = Depends(get_current_user_id),
+    supabase=Depends(get_supabase)
+):
+    # Every resource in the file is imported for this user, whatever its subject reference
+    try:
+        return import_fhir(supabase, file.file, ndjson=is_ndjson(file.filename or ""), user_id=user_id)
+    except APIError as e:
+        raise HTTPException(status_code=400, detail=f"Import failed: {e.message}")
+    except INVALID_INPUT_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Invalid FHIR file: {e}")
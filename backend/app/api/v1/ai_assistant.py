@@ -1,15 +1,31 @@
 from app.core.config import settings
-import httpx
-from fastapi import APIRouter, Depends, HTTPException, status
+from app.core.http_client import get_http_client
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from app.core.database import get_supabase
+from app.core.security import decode_token
 from app.api.dependencies import get_current_user
+from app.core.conditional import make_etag, not_modified
+from app.core.responses import fast_json
+from app.core.document_index import retrieve_context
+from app.core.idempotency import IDEMPOTENCY_HEADER, idempotent, request_fingerprint
+from app.core.llm_usage import QuotaExceeded, choose_model, ledger, usage_summary
+from app.core.message_archive import load_archived_messages, merge_messages, rehydrate_chat
+from app.core.patient_context import context_digest
+from app.core.tracing import span, start_span, traced
 from app.schemas.chat import (
     ChatCreate, ChatResponse, MessageCreate, MessageResponse, ChatListResponse, MessageListResponse
 )
 from app.schemas.auth import UserResponse
+from app.schemas.usage import UsageResponse
 from app.schemas.user import UserUpdate
+from collections import deque
 from datetime import datetime
-from typing import List
+from typing import List, Optional
+import asyncio
+import json
+import logging
+import time
 
 router = APIRouter()
 
@@ -17,6 +33,8 @@ OPENROUTER_MODEL = settings.OPENROUTER_MODEL
 OPENROUTER_API_KEY = settings.OPENROUTER_API_KEY
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 
+CHAT_LIST_COLUMNS = "id, title, created_at, last_message_at, last_message_preview, last_sender, message_count"
+
 # --- Chat Endpoints ---
 
 @router.post("/chats", response_model=ChatResponse)
@@ -44,19 +62,31 @@ async def create_chat(
 
 @router.get("/chats", response_model=ChatListResponse)
 async def list_chats(
+    request: Request,
+    response: Response,
     supabase=Depends(get_supabase),
     current_user=Depends(get_current_user)
 ):
-    response = supabase.table("chats").select("*").eq("user_id", current_user["id"]).order("last_message_at", desc=True).execute()
-    chats = [
-        ChatResponse(
-            id=row["id"],
-            title=row.get("title"),
-            created_at=row["created_at"],
-            last_message_at=row.get("last_message_at"),
-        ) for row in response.data
-    ]
-    return ChatListResponse(chats=chats)
+    # Version = chat count + newest activity, read without loading the list
+    version = (
+        supabase.table("chats").select("last_message_at", count="exact")
+        .eq("user_id", current_user["id"])
+        .order("last_message_at", desc=True, nullsfirst=False)
+        .limit(1)
+        .execute()
+    )
+    latest = version.data[0].get("last_message_at") if version.data else None
+    cached = not_modified(request, response, make_etag("chats", current_user["id"], version.count, latest))
+    if cached:
+        return cached
+    # One index range scan (user_id, last_message_at); preview, sender and count are denormalized on chats
+    chats_resp = (
+        supabase.table("chats").select(CHAT_LIST_COLUMNS)
+        .eq("user_id", current_user["id"])
+        .order("last_message_at", desc=True, nullsfirst=False)
+        .execute()
+    )
+    return fast_json(ChatListResponse, {"chats": chats_resp.data}, response)
 
 @router.delete("/chats/{chat_id}", status_code=204)
 async def delete_chat(
@@ -76,6 +106,8 @@ async def delete_chat(
 @router.get("/chats/{chat_id}/messages", response_model=MessageListResponse)
 async def get_messages(
     chat_id: str,
+    request: Request,
+    response: Response,
     supabase=Depends(get_supabase),
     current_user=Depends(get_current_user)
 ):
@@ -83,29 +115,50 @@ async def get_messages(
     chat = supabase.table("chats").select("*").eq("id", chat_id).eq("user_id", current_user["id"]).execute()
     if not chat.data:
         raise HTTPException(status_code=404, detail="Chat not found")
-    response = supabase.table("messages").select("*").eq("chat_id", chat_id).order("created_at").execute()
-    messages = [
-        MessageResponse(
-            id=row["id"],
-            chat_id=row["chat_id"],
-            sender=row["sender"],
-            content=row["content"],
-            created_at=row["created_at"],
-        ) for row in response.data
-    ]
-    return MessageListResponse(messages=messages)
+    archived_at = chat.data[0].get("archived_at")
+    # Version = last activity + message count (head request, no rows loaded) + archive state
+    count_resp = supabase.table("messages").select("id", count="exact", head=True).eq("chat_id", chat_id).execute()
+    etag = make_etag("messages", chat_id, chat.data[0].get("last_message_at"), count_resp.count, archived_at)
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+    messages_resp = supabase.table("messages").select("*").eq("chat_id", chat_id).order("created_at").execute()
+    messages = messages_resp.data or []
+    if archived_at:
+        # Cold chat: older messages live in one compressed blob, loaded on demand
+        archived = await run_in_threadpool(load_archived_messages, supabase, chat_id, archived_at)
+        messages = merge_messages(archived, messages)
+    return fast_json(MessageListResponse, {"messages": messages}, response)
 
 @router.post("/chats/{chat_id}/messages", response_model=MessageResponse)
 async def post_message(
     chat_id: str,
     message: MessageCreate,
     supabase=Depends(get_supabase),
-    current_user=Depends(get_current_user)
+    current_user=Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
 ):
+    # A retried request with the same Idempotency-Key gets the first reply instead of a second LLM call
+    return await idempotent(
+        supabase, idempotency_key, current_user["id"], "ai.post_message",
+        request_fingerprint(chat_id, message.content),
+        lambda: _post_message(chat_id, message, supabase, current_user),
+    )
+
+
+async def _post_message(chat_id: str, message: MessageCreate, supabase, current_user) -> MessageResponse:
     # Only allow posting to own chats
     chat = supabase.table("chats").select("*").eq("id", chat_id).eq("user_id", current_user["id"]).execute()
     if not chat.data:
         raise HTTPException(status_code=404, detail="Chat not found")
+    # Quota first, so a rejected request stores nothing
+    try:
+        model = await _chat_model(supabase, current_user["id"])
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    # An archived chat becomes hot again before it gets new messages
+    if chat.data[0].get("archived_at"):
+        await run_in_threadpool(rehydrate_chat, supabase, chat_id)
     # Store user message
     msg_data = {
         "chat_id": chat_id,
@@ -117,14 +170,17 @@ async def post_message(
     if not msg_resp.data:
         raise HTTPException(status_code=500, detail="Failed to store message")
     # user_msg = msg_resp.data[0]
-    # Fetch user profile for context
-    user_profile = supabase.table("profiles").select("*").eq("id", current_user["id"]).single().execute().data
+    # User profile (already loaded by get_current_user) carries the precomputed medical digest
+    user_profile = current_user
+    await run_in_threadpool(context_digest, supabase, user_profile)
     # Fetch recent chat history (last 10 messages)
     history_resp = supabase.table("messages").select("*").eq("chat_id", chat_id).order("created_at", desc=True).limit(10).execute()
     history = list(reversed(history_resp.data)) if history_resp.data else []
+    # Relevant excerpts from the user's digitized documents (in-memory index)
+    document_context = await run_in_threadpool(retrieve_context, supabase, current_user["id"], message.content)
     # Prepare LLM prompt
-    prompt = _build_llm_prompt(user_profile, history)
-    ai_content = await _call_openrouter_llm(prompt)
+    prompt = _build_llm_prompt(user_profile, history, document_context)
+    ai_content = await _call_openrouter_llm(prompt, current_user["id"], model)
     # Store AI message
     ai_msg_data = {
         "chat_id": chat_id,
@@ -132,9 +188,8 @@ async def post_message(
         "content": ai_content,
         "created_at": datetime.utcnow().isoformat(),
     }
+    # chats.last_message_at / preview / count are kept by the messages_track_chat trigger
     ai_msg_resp = supabase.table("messages").insert(ai_msg_data).execute()
-    # Update chat last_message_at
-    supabase.table("chats").update({"last_message_at": datetime.utcnow().isoformat()}).eq("id", chat_id).execute()
     if not ai_msg_resp.data:
         raise HTTPException(status_code=500, detail="Failed to store AI message")
     ai_msg = ai_msg_resp.data[0]
@@ -146,30 +201,276 @@ async def post_message(
         created_at=ai_msg["created_at"]
     )
 
+@router.get("/usage", response_model=UsageResponse)
+async def get_usage(
+    days: int = Query(30, ge=1, le=366),
+    supabase=Depends(get_supabase),
+    current_user=Depends(get_current_user)
+):
+    """The user's LLM usage per day and model (from llm_usage_daily) and today's quota state"""
+    summary = await run_in_threadpool(usage_summary, supabase, current_user["id"], days)
+    return fast_json(UsageResponse, summary)
+
+logger = logging.getLogger(__name__)
+
+# --- WebSocket Chat ---
+
+# Open sockets in this worker (capped by WS_MAX_CONNECTIONS_PER_WORKER)
+_active_sockets = 0
+HISTORY_SIZE = 10
+MAX_MESSAGE_CHARS = 4000
+
+
+@router.websocket("/chats/{chat_id}/ws")
+async def chat_socket(websocket: WebSocket, chat_id: str, supabase=Depends(get_supabase)):
+    """
+    Streaming chat over one socket per chat
+
+    - First frame must be {"type": "auth", "token": "<access token>"} (within
+      WS_AUTH_TIMEOUT_SECONDS); the token never goes in the URL, which access logs record
+    - Authenticates, loads the profile, checks ownership and loads history once,
+      then sends {"type": "ready"}; failures close with 1008 (auth) or 1011 (server error)
+    - Client sends {"type": "message", "content": "..."}; server replies with
+      {"type": "token"} frames, then {"type": "done", "message": {...}}
+    - Server sends {"type": "ping"} when idle; client may send {"type": "ping"} too
+    - Messages are handled one at a time; frames sent meanwhile wait in the socket buffer
+    """
+    global _active_sockets
+    if _active_sockets >= settings.WS_MAX_CONNECTIONS_PER_WORKER:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+    # Reserve the slot before the first await so concurrent handshakes cannot all pass the check
+    _active_sockets += 1
+    try:
+        await _serve_chat_socket(websocket, chat_id, supabase)
+    except WebSocketDisconnect:
+        pass
+    except Exception:
+        logger.exception(f"Chat socket for chat {chat_id} failed")
+        try:
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        except Exception:
+            pass  # already closed, or the transport is gone
+    finally:
+        _active_sockets -= 1
+
+
+async def _authenticate_socket(websocket: WebSocket) -> Optional[str]:
+    """User id from the {"type": "auth"} first frame, or None"""
+    try:
+        frame = await asyncio.wait_for(websocket.receive_json(), timeout=settings.WS_AUTH_TIMEOUT_SECONDS)
+    except (asyncio.TimeoutError, json.JSONDecodeError):
+        return None
+    if not isinstance(frame, dict) or frame.get("type") != "auth" or not isinstance(frame.get("token"), str):
+        return None
+    payload = decode_token(frame["token"])
+    if not payload or payload.get("type") != "access" or not payload.get("sub"):
+        return None
+    return payload["sub"]
+
+
+async def _serve_chat_socket(websocket: WebSocket, chat_id: str, supabase):
+    await websocket.accept()
+    user_id = await _authenticate_socket(websocket)
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    def load_state():
+        profile_resp = supabase.table("profiles").select("*").eq("id", user_id).execute()
+        chat_resp = supabase.table("chats").select("id, archived_at").eq("id", chat_id).eq("user_id", user_id).execute()
+        if not profile_resp.data or not chat_resp.data:
+            return None, None
+        if chat_resp.data[0].get("archived_at"):
+            rehydrate_chat(supabase, chat_id)
+        history_resp = supabase.table("messages").select("*").eq("chat_id", chat_id).order("created_at", desc=True).limit(HISTORY_SIZE).execute()
+        context_digest(supabase, profile_resp.data[0])
+        return profile_resp.data[0], list(reversed(history_resp.data or []))
+
+    user_profile, recent = await run_in_threadpool(load_state)
+    if user_profile is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.send_json({"type": "ready"})
+    history = deque(recent, maxlen=HISTORY_SIZE)
+    idle = 0
+    while True:
+        try:
+            data = await asyncio.wait_for(websocket.receive_json(), timeout=settings.WS_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            idle += settings.WS_HEARTBEAT_SECONDS
+            if idle >= settings.WS_IDLE_TIMEOUT_SECONDS:
+                await websocket.close(code=status.WS_1000_NORMAL_CLOSURE)
+                return
+            await websocket.send_json({"type": "ping"})
+            continue
+        except json.JSONDecodeError:
+            await websocket.send_json({"type": "error", "detail": "Invalid JSON"})
+            continue
+        idle = 0
+        if not isinstance(data, dict):
+            await websocket.send_json({"type": "error", "detail": "Frames must be JSON objects"})
+            continue
+        kind = data.get("type")
+        if kind == "ping":
+            await websocket.send_json({"type": "pong"})
+            continue
+        if kind != "message":
+            continue
+        content = str(data.get("content") or "").strip()
+        if not content or len(content) > MAX_MESSAGE_CHARS:
+            await websocket.send_json({"type": "error", "detail": "Message must be 1-4000 characters"})
+            continue
+
+        with span("chat.ws_message", {"chat.message_chars": len(content)}):
+            await _answer_socket_message(websocket, supabase, chat_id, user_id, user_profile, history, content)
+
+
+async def _answer_socket_message(websocket: WebSocket, supabase, chat_id: str, user_id: str, user_profile, history, content: str):
+    """Store the message, stream the reply as token frames, store the reply"""
+    try:
+        model = await _chat_model(supabase, user_id)
+    except QuotaExceeded as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        return
+    user_msg = await run_in_threadpool(_insert_message, supabase, chat_id, "user", content)
+    if user_msg is None:
+        await websocket.send_json({"type": "error", "detail": "Failed to store message"})
+        return
+    history.append(user_msg)
+
+    document_context = await run_in_threadpool(retrieve_context, supabase, user_id, content)
+    prompt = _build_llm_prompt(user_profile, list(history), document_context)
+    parts = []
+    try:
+        async for piece in _stream_openrouter_llm(prompt, user_id, model):
+            parts.append(piece)
+            await websocket.send_json({"type": "token", "content": piece})
+    except Exception as e:
+        if isinstance(e, WebSocketDisconnect):
+            raise
+        await websocket.send_json({"type": "error", "detail": f"LLM call failed: {str(e)}"})
+        return
+
+    ai_msg = await run_in_threadpool(_insert_message, supabase, chat_id, "ai", "".join(parts))
+    if ai_msg is None:
+        await websocket.send_json({"type": "error", "detail": "Failed to store AI message"})
+        return
+    history.append(ai_msg)
+    await websocket.send_json({"type": "done", "message": MessageResponse(**ai_msg).model_dump(mode="json")})
+
+
+def _insert_message(supabase, chat_id: str, sender: str, content: str):
+    resp = supabase.table("messages").insert({
+        "chat_id": chat_id,
+        "sender": sender,
+        "content": content,
+        "created_at": datetime.utcnow().isoformat(),
+    }).execute()
+    return resp.data[0] if resp.data else None
+
 # --- Helper Functions ---
 
-def _build_llm_prompt(user_profile, history):
+@traced("chat.build_prompt")
+def _build_llm_prompt(user_profile, history, document_context=None):
     profile_str = f"User Info:\nName: {user_profile.get('name')}\nAge: {user_profile.get('age')}\nGender: {user_profile.get('gender')}\nPhone: {user_profile.get('phone')}\nEmergency Contact: {user_profile.get('emergency_contact')}\n"
+    if user_profile.get("context_digest"):
+        profile_str += f"\nMedical summary:\n{user_profile['context_digest']}\n"
+    if document_context:
+        excerpts = "\n".join([
+            f"[{chunk.get('title') or 'Document'}] {chunk['content']}" for chunk in document_context
+        ])
+        profile_str += f"\nRelevant excerpts from the user's medical documents:\n{excerpts}\n"
     chat_history = "\n".join([
         f"{msg['sender'].capitalize()}: {msg['content']}" for msg in history
     ])
     return f"{profile_str}\nChat History:\n{chat_history}\nUser: {history[-1]['content'] if history else ''}\nAI:"
 
-async def _call_openrouter_llm(prompt: str) -> str:
+def _openrouter_request(prompt: str, model: str = OPENROUTER_MODEL, stream: bool = False):
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
     }
     payload = {
-        "model": OPENROUTER_MODEL,
+        "model": model,
         "messages": [
             {"role": "system", "content": "You are an AI Medical Assistant. Answer user medical queries in a helpful, safe, and user-specific way."},
             {"role": "user", "content": prompt},
         ],
         "max_tokens": 512,
+        "usage": {"include": True},  # token counts and cost in the response (last chunk when streaming)
     }
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=60)
-        resp.raise_for_status()
-        data = resp.json()
-        return data["choices"][0]["message"]["content"]
+    if stream:
+        payload["stream"] = True
+    return headers, payload
+
+async def _chat_model(supabase, user_id: str) -> str:
+    """OpenRouter model for this user's next reply (daily quota may downgrade it); raises QuotaExceeded"""
+    return await run_in_threadpool(choose_model, supabase, user_id, OPENROUTER_MODEL, settings.LLM_FALLBACK_MODEL)
+
+async def _call_openrouter_llm(prompt: str, user_id: str, model: str = OPENROUTER_MODEL) -> str:
+    headers, payload = _openrouter_request(prompt, model)
+    client = get_http_client()
+    started, usage, outcome = time.perf_counter(), {}, "error"
+    try:
+        with span("llm.completion", {"llm.model": model, "llm.prompt_chars": len(prompt)}) as sp:
+            resp = await client.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=60)
+            resp.raise_for_status()
+            data = resp.json()
+            usage = data.get("usage") or {}
+            sp.set_attributes({
+                "llm.prompt_tokens": usage.get("prompt_tokens", 0),
+                "llm.completion_tokens": usage.get("completion_tokens", 0),
+            })
+        content = data["choices"][0]["message"]["content"]
+        outcome = "ok"
+        return content
+    finally:
+        ledger.record(
+            user_id, "chat", model, usage.get("prompt_tokens"), usage.get("completion_tokens"),
+            (time.perf_counter() - started) * 1000, outcome, usage.get("cost"),
+        )
+
+async def _stream_openrouter_llm(prompt: str, user_id: str, model: str = OPENROUTER_MODEL):
+    """Yield content deltas from an OpenRouter streaming (SSE) completion"""
+    headers, payload = _openrouter_request(prompt, model, stream=True)
+    client = get_http_client()
+    sp = start_span("llm.stream", {"llm.model": model, "llm.prompt_chars": len(prompt)})
+    started, chunks, usage, first_token_ms, outcome = time.perf_counter(), 0, {}, None, "error"
+    try:
+        async with client.stream("POST", OPENROUTER_API_URL, headers=headers, json=payload, timeout=60) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: "):
+                    continue  # SSE comments / keep-alives
+                data = line[len("data: "):]
+                if data.strip() == "[DONE]":
+                    break
+                event = json.loads(data)
+                if event.get("usage"):
+                    usage = event["usage"]
+                    sp.set_attributes({
+                        "llm.prompt_tokens": usage.get("prompt_tokens", 0),
+                        "llm.completion_tokens": usage.get("completion_tokens", 0),
+                    })
+                delta = event["choices"][0].get("delta", {}).get("content") if event.get("choices") else None
+                if delta:
+                    if not chunks:
+                        first_token_ms = (time.perf_counter() - started) * 1000
+                        sp.set_attribute("llm.first_token_ms", round(first_token_ms, 1))
+                    chunks += 1
+                    yield delta
+        outcome = "ok"
+    except BaseException as e:
+        if not isinstance(e, Exception):
+            outcome = "cancelled"  # client went away mid-stream; tokens are unknown without the final chunk
+        sp.record_exception(e)
+        raise
+    finally:
+        sp.set_attribute("llm.chunks", chunks)
+        sp.end()
+        ledger.record(
+            user_id, "chat_stream", model, usage.get("prompt_tokens"), usage.get("completion_tokens"),
+            (time.perf_counter() - started) * 1000, outcome, usage.get("cost"), first_token_ms,
+        )
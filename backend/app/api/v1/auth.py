@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Request, Response
 
 from app.schemas.auth import (
     UserRegister, UserLogin, AuthResponse, Token, 
@@ -6,11 +6,10 @@ from app.schemas.auth import (
 )
 from app.schemas.user import UserUpdate
 from app.core.database import get_supabase
-from app.core.security import (
-    get_password_hash, verify_password,
-    create_access_token, create_refresh_token, decode_token
-)
+from app.core.security import get_password_hash, verify_password, decode_token
+from app.core.token_store import issue_token_pair, rotate_refresh_token, revoke_family, revoke_user_tokens
 from app.api.dependencies import get_current_user
+from app.core.conditional import make_etag, not_modified
 from datetime import datetime
 import uuid
 
@@ -97,9 +96,8 @@ async def register(user_data: UserRegister, supabase = Depends(get_supabase)):
         
         created_user = response.data[0]
         
-        # Generate tokens
-        access_token = create_access_token(data={"sub": user_id, "email": user_data.email})
-        refresh_token = create_refresh_token(data={"sub": user_id})
+        # Generate tokens (starts a new refresh-token family)
+        tokens = issue_token_pair(supabase, user_id, user_data.email)
         
         # Prepare response
         user_response = UserResponse(
@@ -113,10 +111,7 @@ async def register(user_data: UserRegister, supabase = Depends(get_supabase)):
             created_at=created_user["created_at"]
         )
         
-        token_response = Token(
-            access_token=access_token,
-            refresh_token=refresh_token
-        )
+        token_response = Token(**tokens)
         
         return AuthResponse(user=user_response, token=token_response)
         
@@ -154,9 +149,8 @@ async def login(credentials: UserLogin, supabase = Depends(get_supabase)):
             detail="Incorrect email or password"
         )
     
-    # Generate tokens
-    access_token = create_access_token(data={"sub": user["id"], "email": user["email"]})
-    refresh_token = create_refresh_token(data={"sub": user["id"]})
+    # Generate tokens (starts a new refresh-token family)
+    tokens = issue_token_pair(supabase, user["id"], user["email"])
     
     # Prepare response
     user_response = UserResponse(
@@ -170,10 +164,7 @@ async def login(credentials: UserLogin, supabase = Depends(get_supabase)):
         created_at=user["created_at"]
     )
     
-    token_response = Token(
-        access_token=access_token,
-        refresh_token=refresh_token
-    )
+    token_response = Token(**tokens)
     
     return AuthResponse(user=user_response, token=token_response)
 
@@ -184,7 +175,9 @@ async def refresh_token(token_data: TokenRefresh, supabase = Depends(get_supabas
     Refresh access token using refresh token
     
     - Validates refresh token
-    - Issues new access token
+    - Rotates it: the presented refresh token is consumed and a new pair is issued
+    - Replaying a consumed refresh token revokes its whole family (401)
+    - 409 when the same token was just refreshed concurrently (retry with the newer one)
     """
     
     payload = decode_token(token_data.refresh_token)
@@ -197,36 +190,92 @@ async def refresh_token(token_data: TokenRefresh, supabase = Depends(get_supabas
     
     user_id = payload.get("sub")
     
-    # Verify user still exists
-    response = supabase.table("profiles").select("email").eq("id", user_id).execute()
+    if "fam" not in payload:
+        # Issued before token families: verify the user once and move it into a new family
+        response = supabase.table("profiles").select("email").eq("id", user_id).execute()
+        if not response.data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        return Token(**issue_token_pair(supabase, user_id, response.data[0]["email"]))
+    
+    result = rotate_refresh_token(supabase, payload)
     
-    if not response.data:
+    if result["status"] == "raced":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Refresh token was just used; retry with the latest token"
+        )
+    if result["status"] == "reused":
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token reuse detected; session revoked"
+        )
+    if result["status"] != "rotated":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
         )
     
-    user = response.data[0]
+    return Token(**result["tokens"])
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(token_data: TokenRefresh, supabase = Depends(get_supabase)):
+    """
+    Logout this session
     
-    # Generate new tokens
-    access_token = create_access_token(data={"sub": user_id, "email": user["email"]})
-    new_refresh_token = create_refresh_token(data={"sub": user_id})
+    - Revokes the refresh token's family and every access token issued with it
+    """
+    payload = decode_token(token_data.refresh_token)
     
-    return Token(
-        access_token=access_token,
-        refresh_token=new_refresh_token
-    )
+    if payload is None or payload.get("type") != "refresh":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token"
+        )
+    
+    if "fam" in payload:
+        revoke_family(supabase, payload["fam"])
+    else:
+        revoke_user_tokens(supabase, payload["sub"])
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post("/logout-all", status_code=status.HTTP_204_NO_CONTENT)
+async def logout_all(supabase = Depends(get_supabase), current_user = Depends(get_current_user)):
+    """
+    Logout everywhere
+    
+    - Requires authentication
+    - Revokes every token of the user issued up to now, on all devices
+    """
+    revoke_user_tokens(supabase, current_user["id"])
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_profile(supabase = Depends(get_supabase), current_user = Depends(get_current_user)):
+async def get_current_user_profile(
+    request: Request,
+    response: Response,
+    supabase = Depends(get_supabase),
+    current_user = Depends(get_current_user)
+):
     """
     Get current user profile
     
     - Requires authentication
     - Returns user information
+    - Supports If-None-Match (304 when unchanged)
     """
-    
+    etag = make_etag(*(current_user.get(k) for k in (
+        "id", "updated_at", "email", "name", "age", "gender", "phone", "emergency_contact"
+    )))
+    cached = not_modified(request, response, etag)
+    if cached:
+        return cached
+
     return UserResponse(
         id=current_user["id"],
         email=current_user["email"],
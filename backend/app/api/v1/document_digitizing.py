@@ -1,20 +1,40 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, File, UploadFile, HTTPException, Header, Depends, Request, Response, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, ORJSONResponse
+import asyncio
 import io
 import os
+import re
+import subprocess
 import tempfile
+import time
+import logging
+import uuid
+import weakref
+from contextlib import contextmanager
+from typing import List, Optional
+import httpx
+from pydantic import BaseModel
+from postgrest.exceptions import APIError
 from PIL import Image
 import tesserocr
 import requests
+from app.api.dependencies import get_current_user_id
 from app.core.config import settings
+from app.core.conditional import make_etag, not_modified
+from app.core.document_index import index_document, invalidate_user_index
+from app.core.idempotency import IDEMPOTENCY_HEADER, idempotent, request_fingerprint
+from app.core.llm_usage import QuotaExceeded, choose_model, ledger
+from app.core.tracing import span, instrument_supabase
 from supabase import create_client, Client
 import openai
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # Delete document endpoint
 @router.delete("/{doc_id}")
-def delete_document(doc_id: str, user_id: str = Depends(lambda: "00000000-0000-0000-0000-000000000000")):
+def delete_document(doc_id: str, user_id: str = Depends(get_current_user_id)):
     # Fetch document to get storage path
     res = supabase.table("medical_documents").select("*").eq("id", doc_id).eq("user_id", user_id).single().execute()
     doc = res.data if hasattr(res, 'data') else res.get('data', None)
@@ -26,20 +46,34 @@ def delete_document(doc_id: str, user_id: str = Depends(lambda: "00000000-0000-0
         # Extract storage path from URL
         storage_path = file_url.split(f"/{BUCKET_NAME}/")[-1]
         supabase.storage.from_(BUCKET_NAME).remove([storage_path])
-    # Remove from table
+    # Remove from table (document_chunks rows cascade)
     supabase.table("medical_documents").delete().eq("id", doc_id).eq("user_id", user_id).execute()
+    invalidate_user_index(user_id)
     return {"detail": "Document deleted."}
 
 @router.get("/list")
-def list_documents(user_id: str = Depends(lambda: "00000000-0000-0000-0000-000000000000")):
+def list_documents(
+    request: Request,
+    response: Response,
+    user_id: str = Depends(get_current_user_id)
+):
+    # Version = document count + newest upload, read without loading extracted text
+    version = (
+        supabase.table("medical_documents").select("created_at", count="exact")
+        .eq("user_id", user_id).order("created_at", desc=True).limit(1).execute()
+    )
+    latest = version.data[0].get("created_at") if version.data else None
+    cached = not_modified(request, response, make_etag("documents", user_id, version.count, latest))
+    if cached:
+        return cached
     # Fetch all documents for the user
     res = supabase.table("medical_documents").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
     docs = res.data if hasattr(res, 'data') else res.get('data', [])
-    return {"documents": docs}
+    return ORJSONResponse({"documents": docs}, headers=dict(response.headers))
 
 
 @router.get("/{doc_id}")
-def get_document(doc_id: str, user_id: str = Depends(lambda: "00000000-0000-0000-0000-000000000000")):
+def get_document(doc_id: str, user_id: str = Depends(get_current_user_id)):
     # Fetch a specific document by id for the user
     res = supabase.table("medical_documents").select("*").eq("id", doc_id).eq("user_id", user_id).single().execute()
     doc = res.data if hasattr(res, 'data') else res.get('data', None)
@@ -51,68 +85,374 @@ def get_document(doc_id: str, user_id: str = Depends(lambda: "00000000-0000-0000
 SUPABASE_URL = settings.SUPABASE_URL
 SUPABASE_SERVICE_ROLE_KEY = settings.SUPABASE_SERVICE_ROLE_KEY
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+instrument_supabase(supabase)
 
 # Set OpenAI API key
 openai.api_key = os.getenv("OPENAI_API_KEY")
+EXPLANATION_MODEL = "gpt-3.5-turbo"
 
 BUCKET_NAME = "medical_documents"
 MAX_FILE_SIZE_MB = 5
 ALLOWED_TYPES = ["image/jpeg", "image/png", "application/pdf"]
+# Leading bytes each allowed type must start with
+FILE_SIGNATURES = {
+    "image/jpeg": b"\xff\xd8\xff",
+    "image/png": b"\x89PNG\r\n\x1a\n",
+    "application/pdf": b"%PDF-",
+}
 
 
 def compress_image(image: Image.Image, max_size_mb=5) -> bytes:
     # Compress image to fit under max_size_mb
-    # Convert RGBA to RGB to avoid JPEG alpha channel error
-    if image.mode == "RGBA":
-        image = image.convert("RGB")
-    quality = 85
-    output = io.BytesIO()
-    image.save(output, format="JPEG", quality=quality)
-    while output.tell() > max_size_mb * 1024 * 1024 and quality > 10:
-        quality -= 5
+    with span("document.compress_image", {"image.width": image.width, "image.height": image.height}) as sp:
+        # Convert RGBA to RGB to avoid JPEG alpha channel error
+        if image.mode == "RGBA":
+            image = image.convert("RGB")
+        quality = 85
         output = io.BytesIO()
         image.save(output, format="JPEG", quality=quality)
-    return output.getvalue()
+        while output.tell() > max_size_mb * 1024 * 1024 and quality > 10:
+            quality -= 5
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=quality)
+        sp.set_attributes({"jpeg.quality": quality, "bytes.out": output.tell()})
+        return output.getvalue()
 
 
 def extract_text_from_image(image_bytes: bytes) -> str:
     image = Image.open(io.BytesIO(image_bytes))
-    return tesserocr.image_to_text(image)
+    return _ocr_image(image)
+
+
+def _ocr_image(image: Image.Image, page: int = None) -> str:
+    with span("document.ocr", {"image.width": image.width, "image.height": image.height}) as sp:
+        text = tesserocr.image_to_text(image)
+        sp.set_attribute("ocr.chars", len(text))
+        if page is not None:
+            sp.set_attribute("pdf.page", page)
+        return text
 
 
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
-    # Save PDF to temp file, use tesseract via poppler-utils (pdftoppm)
+def extract_text_from_pdf(pdf_bytes: bytes, pages: Optional[list] = None) -> str:
     with tempfile.NamedTemporaryFile(suffix=".pdf") as temp_pdf:
         temp_pdf.write(pdf_bytes)
         temp_pdf.flush()
-        # Convert PDF pages to images
-        from pdf2image import convert_from_path
-        images = convert_from_path(temp_pdf.name)
-        text = ""
-        for img in images:
-            text += tesserocr.image_to_text(img)
-        return text
+        return extract_text_from_pdf_path(temp_pdf.name, pages)
+
+
+def _pdf_text_layer(pdf_path: str) -> List[str]:
+    """
+    Embedded text of every page via poppler's pdftotext (one process for the whole
+    file; pages are separated by form feeds). Empty list if pdftotext is unavailable
+    or fails, so every page falls back to OCR.
+    """
+    with span("document.pdf_text_layer", {"bytes.in": os.path.getsize(pdf_path)}) as sp:
+        try:
+            result = subprocess.run(
+                ["pdftotext", "-layout", "-enc", "UTF-8", pdf_path, "-"],
+                capture_output=True, timeout=60, check=True,
+            )
+        except (OSError, subprocess.SubprocessError):
+            sp.set_attribute("pdf.text_layer", False)
+            return []
+        texts = result.stdout.decode("utf-8", errors="replace").split("\f")
+        # Every page ends with a form feed; drop what follows the last one
+        texts = texts[:-1] if len(texts) > 1 else texts
+        sp.set_attribute("pdf.pages", len(texts))
+        return texts
+
+
+def _has_text_layer(text: str) -> bool:
+    return sum(c.isalnum() for c in text) >= settings.PDF_TEXT_MIN_CHARS
+
+
+def extract_pdf_pages(pdf_path: str) -> List[dict]:
+    """
+    Per-page extraction: the embedded text layer where it has usable text, otherwise
+    rasterize just that page and OCR it. Returns one dict per page:
+    {"page", "method": "text" | "ocr", "chars", "ms", "text"}.
+    """
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    texts = _pdf_text_layer(pdf_path)
+    try:
+        page_count = pdfinfo_from_path(pdf_path)["Pages"]
+    except Exception:
+        if not texts:
+            raise
+        page_count = len(texts)
+
+    pages = []
+    for page in range(1, page_count + 1):
+        start = time.perf_counter()
+        text = texts[page - 1] if page <= len(texts) else ""
+        with span("document.pdf_page", {"pdf.page": page}) as sp:
+            if _has_text_layer(text):
+                method = "text"
+            else:
+                method = "ocr"
+                # One page at a time keeps memory at a single bitmap
+                images = convert_from_path(pdf_path, dpi=settings.PDF_OCR_DPI, first_page=page, last_page=page)
+                text = "".join(_ocr_image(image, page) for image in images)
+            sp.set_attributes({"pdf.method": method, "pdf.chars": len(text)})
+        pages.append({
+            "page": page,
+            "method": method,
+            "chars": len(text),
+            "ms": round((time.perf_counter() - start) * 1000, 1),
+            "text": text,
+        })
+    return pages
 
 
-def generate_explanation_llm(text: str) -> str:
+def extract_text_from_pdf_path(pdf_path: str, pages: Optional[list] = None) -> str:
+    """Text of the whole PDF; per-page method/timing (without text) is appended to `pages` if given"""
+    extracted = extract_pdf_pages(pdf_path)
+    if pages is not None:
+        pages.extend({k: v for k, v in p.items() if k != "text"} for p in extracted)
+    return "".join(p["text"] for p in extracted)
+
+
+def extract_text_from_file(path: str, content_type: str, pages: Optional[list] = None) -> str:
+    if content_type.startswith("image/"):
+        with Image.open(path) as image:
+            return _ocr_image(image)
+    if content_type == "application/pdf":
+        return extract_text_from_pdf_path(path, pages)
+    return ""
+
+
+@contextmanager
+def download_to_tempfile(storage_path: str, max_bytes: int):
+    """
+    Stream a storage object to a temp file (never held in memory as a whole).
+    Yields (path, size); raises HTTPException if missing or larger than max_bytes.
+    """
+    url = f"{SUPABASE_URL}/storage/v1/object/authenticated/{BUCKET_NAME}/{storage_path}"
+    headers = {"Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}", "apikey": SUPABASE_SERVICE_ROLE_KEY}
+    suffix = os.path.splitext(storage_path)[-1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        size = 0
+        with span("document.storage_download") as sp, httpx.stream("GET", url, headers=headers, timeout=60) as resp:
+            if resp.status_code == 404 or resp.status_code == 400:
+                raise HTTPException(status_code=404, detail="Uploaded file not found in storage.")
+            resp.raise_for_status()
+            for chunk in resp.iter_bytes(64 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=400, detail=f"File too large (max {MAX_FILE_SIZE_MB} MB).")
+                tmp.write(chunk)
+            sp.set_attribute("bytes", size)
+        tmp.flush()
+        yield tmp.name, size
+
+
+def generate_explanation_llm(text: str, user_id: str) -> str:
     prompt = f"""
 You are a medical assistant. Summarize and explain the following medical document in simple terms for a patient to understand:
 
 {text}
 """
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=300,
-        temperature=0.5,
+    model = choose_model(supabase, user_id, EXPLANATION_MODEL)
+    started, usage, outcome = time.perf_counter(), {}, "error"
+    try:
+        with span("llm.explain", {"llm.model": model, "llm.input_chars": len(text)}) as sp:
+            response = openai.ChatCompletion.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=300,
+                temperature=0.5,
+            )
+            usage = response.get("usage") or {}
+            sp.set_attributes({
+                "llm.prompt_tokens": usage.get("prompt_tokens", 0),
+                "llm.completion_tokens": usage.get("completion_tokens", 0),
+            })
+            explanation = response.choices[0].message.content.strip()
+        outcome = "ok"
+        return explanation
+    finally:
+        ledger.record(
+            user_id, "document_explain", model, usage.get("prompt_tokens"), usage.get("completion_tokens"),
+            (time.perf_counter() - started) * 1000, outcome,
+        )
+
+
+def _prepare_upload_bytes(contents: bytes, content_type: str) -> bytes:
+    if content_type.startswith("image/"):
+        return compress_image(Image.open(io.BytesIO(contents)), max_size_mb=MAX_FILE_SIZE_MB)
+    return contents
+
+
+def _storage_path(user_id: str, filename: str) -> str:
+    # Unique per upload, so two files with the same name never overwrite each other
+    safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(filename or "")) or "document"
+    return f"{user_id}/{uuid.uuid4().hex}-{safe_name}"
+
+
+def _path_of(file_url: str) -> str:
+    return file_url.split(f"/{BUCKET_NAME}/", 1)[-1]
+
+
+def _store_file(user_id: str, filename: str, content_type: str, upload_bytes: bytes) -> Optional[str]:
+    """Upload to Supabase Storage; returns the public file URL or None on failure"""
+    storage_path = _storage_path(user_id, filename)
+    with span("document.storage_upload", {"bytes": len(upload_bytes), "content_type": content_type}):
+        res = supabase.storage.from_(BUCKET_NAME).upload(
+            storage_path,
+            upload_bytes,
+            {"content-type": content_type}
+        )
+    if not hasattr(res, "key") or not res.key:
+        return None
+    return f"{SUPABASE_URL}/storage/v1/object/public/{BUCKET_NAME}/{storage_path}"
+
+
+def extract_text_from_bytes(upload_bytes: bytes, content_type: str, pages: Optional[list] = None) -> str:
+    if content_type.startswith("image/"):
+        return extract_text_from_image(upload_bytes)
+    if content_type == "application/pdf":
+        return extract_text_from_pdf(upload_bytes, pages)
+    return ""
+
+
+def _document_response(doc: dict, pages=None) -> JSONResponse:
+    return JSONResponse({
+        "id": doc.get("id"),
+        "file_url": doc.get("file_url"),
+        "extracted_text": doc.get("extracted_text"),
+        "explanation": doc.get("explanation"),
+        "pages": pages or None,
+    })
+
+
+def _processed_document(user_id: str, storage_path: str) -> Optional[dict]:
+    resp = supabase.table("medical_documents").select("id, file_url, extracted_text, explanation") \
+        .eq("user_id", user_id).eq("storage_path", storage_path).execute()
+    return resp.data[0] if resp.data else None
+
+
+def _finalize_document(background_tasks, user_id, file_url, storage_path, content_type, file_size, title, extracted_text, pages=None):
+    # LLM explanation, medical_documents insert and retrieval indexing (shared by both upload flows)
+    try:
+        explanation = generate_explanation_llm(extracted_text, user_id)
+    except QuotaExceeded as e:
+        return JSONResponse(status_code=429, content={"error": str(e)})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={
+            "error": f"LLM explanation failed: {str(e)}"
+        })
+
+    # Store in Supabase table with error handling
+    data = {
+        "user_id": user_id,
+        "file_url": file_url,
+        "storage_path": storage_path,
+        "file_type": content_type,
+        "file_size": file_size,
+        "extracted_text": extracted_text,
+        "explanation": explanation,
+        "title": title,
+    }
+    try:
+        insert_resp = supabase.table("medical_documents").insert(data).execute()
+    except APIError as e:
+        existing = _processed_document(user_id, storage_path) if e.code == "23505" else None
+        if existing is None:
+            return JSONResponse(status_code=500, content={"error": f"Database insert failed: {e.message}"})
+        return _document_response(existing)  # a concurrent call for the same object won
+    except Exception as e:
+        return JSONResponse(status_code=500, content={
+            "error": f"Database insert failed: {str(e)}"
+        })
+
+    # Index the OCR text for AI assistant retrieval after the response is sent
+    if insert_resp.data and extracted_text:
+        background_tasks.add_task(
+            index_document, supabase, user_id, insert_resp.data[0]["id"], title, extracted_text
+        )
+
+    return _document_response({**data, "id": insert_resp.data[0]["id"] if insert_resp.data else None}, pages)
+
+
+class SignedUploadRequest(BaseModel):
+    filename: str
+    content_type: str
+    size: int
+
+class ProcessDocumentRequest(BaseModel):
+    path: str
+    content_type: str
+    title: Optional[str] = None
+
+
+@router.post("/upload-url")
+def create_upload_url(
+    request: SignedUploadRequest,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Step 1 of the direct upload flow: issue a signed URL so the client uploads
+    the file straight to Supabase Storage (PUT to signed_url). Then call /process.
+    """
+    if request.content_type not in ALLOWED_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported file type.")
+    if request.size > MAX_FILE_SIZE_MB * 1024 * 1024:
+        raise HTTPException(status_code=400, detail="File too large (max 5 MB).")
+    storage_path = _storage_path(user_id, request.filename)
+    try:
+        signed = supabase.storage.from_(BUCKET_NAME).create_signed_upload_url(storage_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create upload URL: {str(e)}")
+    return {"path": storage_path, "signed_url": signed["signed_url"], "token": signed["token"]}
+
+
+@router.post("/process")
+def process_uploaded_document(
+    request: ProcessDocumentRequest,
+    background_tasks: BackgroundTasks,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Step 2 of the direct upload flow: OCR + explain a file already in storage.
+    The object is streamed to a temp file only for OCR; it is never re-uploaded.
+    Processing a path again returns the document already created for it.
+    """
+    # Only objects issued by /upload-url to this user: "<user_id>/<hex>-<safe name>"
+    if not re.fullmatch(rf"{re.escape(user_id)}/[A-Za-z0-9._-]+", request.path) or ".." in request.path:
+        raise HTTPException(status_code=403, detail="Not allowed to process this file.")
+    if request.content_type not in ALLOWED_TYPES:
+        raise HTTPException(status_code=400, detail="Unsupported file type.")
+    existing = _processed_document(user_id, request.path)
+    if existing is not None:
+        return _document_response(existing)
+    file_url = f"{SUPABASE_URL}/storage/v1/object/public/{BUCKET_NAME}/{request.path}"
+    title = request.title or request.path.split("/", 1)[-1].split("-", 1)[-1]
+
+    pages = []
+    with download_to_tempfile(request.path, MAX_FILE_SIZE_MB * 1024 * 1024) as (local_path, size):
+        # The declared type comes from the client; the bytes must agree, as for /upload
+        signature = FILE_SIGNATURES[request.content_type]
+        with open(local_path, "rb") as f:
+            if not f.read(len(signature)).startswith(signature):
+                raise HTTPException(status_code=400, detail="File content does not match its type.")
+        try:
+            extracted_text = extract_text_from_file(local_path, request.content_type, pages)
+        except Exception as e:
+            return JSONResponse(status_code=500, content={
+                "error": f"OCR extraction failed: {str(e)}"
+            })
+
+    return _finalize_document(
+        background_tasks, user_id, file_url, request.path, request.content_type, size, title, extracted_text, pages
     )
-    return response.choices[0].message.content.strip()
 
 
 @router.post("/upload")
 async def upload_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    user_id: str = Depends(lambda: "demo-user-id")  # Replace with real auth
+    user_id: str = Depends(get_current_user_id),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
 ):
     if file.content_type not in ALLOWED_TYPES:
         raise HTTPException(status_code=400, detail="Unsupported file type.")
@@ -120,66 +460,164 @@ async def upload_document(
     if len(contents) > MAX_FILE_SIZE_MB * 1024 * 1024:
         raise HTTPException(status_code=400, detail="File too large (max 5 MB).")
 
+    # A retried upload with the same Idempotency-Key returns the first document instead of a duplicate
+    return await idempotent(
+        supabase, idempotency_key, user_id, "documents.upload",
+        request_fingerprint(file.filename, file.content_type, contents),
+        lambda: run_in_threadpool(_upload_document, background_tasks, user_id, file.filename, file.content_type, contents),
+    )
+
+
+def _upload_document(background_tasks, user_id: str, filename: str, content_type: str, contents: bytes) -> JSONResponse:
     # Compress if image
-    if file.content_type.startswith("image/"):
-        compressed = compress_image(Image.open(io.BytesIO(contents)), max_size_mb=MAX_FILE_SIZE_MB)
-        upload_bytes = compressed
-    else:
-        upload_bytes = contents
+    upload_bytes = _prepare_upload_bytes(contents, content_type)
 
     # Upload to Supabase Storage
-    file_ext = os.path.splitext(file.filename)[-1]
-    storage_path = f"{user_id}/{file.filename}"
-    res = supabase.storage.from_(BUCKET_NAME).upload(
-        storage_path,
-        upload_bytes,
-        {"content-type": file.content_type},
-        upsert=True
-    )
-    if not hasattr(res, "key") or not res.key:
+    file_url = _store_file(user_id, filename, content_type, upload_bytes)
+    if file_url is None:
         raise HTTPException(status_code=500, detail="Failed to upload file to storage.")
-    file_url = f"{SUPABASE_URL}/storage/v1/object/public/{BUCKET_NAME}/{storage_path}"
 
-    # Robust OCR extraction
+    # Text layer / OCR extraction
+    pages = []
     try:
-        if file.content_type.startswith("image/"):
-            extracted_text = extract_text_from_image(upload_bytes)
-        elif file.content_type == "application/pdf":
-            extracted_text = extract_text_from_pdf(upload_bytes)
-        else:
-            extracted_text = ""
+        extracted_text = extract_text_from_bytes(upload_bytes, content_type, pages)
     except Exception as e:
         return JSONResponse(status_code=500, content={
             "error": f"OCR extraction failed: {str(e)}"
         })
 
-    # Robust LLM explanation
+    return _finalize_document(
+        background_tasks, user_id, file_url, _path_of(file_url), content_type, len(upload_bytes), filename,
+        extracted_text, pages
+    )
+
+
+# Per-user limit on files processed concurrently (per worker)
+_user_upload_slots: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+
+
+def _user_semaphore(user_id: str) -> asyncio.Semaphore:
+    semaphore = _user_upload_slots.get(user_id)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(settings.UPLOAD_PER_USER_PARALLELISM)
+        _user_upload_slots[user_id] = semaphore
+    return semaphore
+
+
+async def _validate_upload(file: UploadFile) -> Optional[str]:
+    """Check type, size and file signature without reading the whole body. Returns an error or None."""
+    if file.content_type not in ALLOWED_TYPES:
+        return "Unsupported file type."
+    size = file.size
+    if size is None:
+        await run_in_threadpool(file.file.seek, 0, os.SEEK_END)
+        size = file.file.tell()
+    if size > MAX_FILE_SIZE_MB * 1024 * 1024:
+        return "File too large (max 5 MB)."
+    await file.seek(0)
+    head = await file.read(len(FILE_SIGNATURES[file.content_type]))
+    await file.seek(0)
+    if not head.startswith(FILE_SIGNATURES[file.content_type]):
+        return "File content does not match its type."
+    return None
+
+
+def _remove_stored(storage_paths: list) -> None:
+    # Objects whose document row was never written would otherwise stay in the bucket unreferenced
     try:
-        explanation = generate_explanation_llm(extracted_text)
+        supabase.storage.from_(BUCKET_NAME).remove(storage_paths)
     except Exception as e:
-        return JSONResponse(status_code=500, content={
-            "error": f"LLM explanation failed: {str(e)}"
-        })
+        logger.warning(f"Removing {len(storage_paths)} orphaned upload(s) failed: {e}")
 
-    # Store in Supabase table with error handling
-    data = {
+
+def _process_batch_file(user_id: str, filename: str, content_type: str, contents: bytes, pages: list) -> dict:
+    # Storage upload + OCR + explanation for one file; raises with the failing stage in the message
+    # (the stored object is removed again). Per-page PDF extraction details are appended to `pages`.
+    upload_bytes = _prepare_upload_bytes(contents, content_type)
+    file_url = _store_file(user_id, filename, content_type, upload_bytes)
+    if file_url is None:
+        raise RuntimeError("Failed to upload file to storage.")
+    try:
+        try:
+            extracted_text = extract_text_from_bytes(upload_bytes, content_type, pages)
+        except Exception as e:
+            raise RuntimeError(f"OCR extraction failed: {str(e)}")
+        try:
+            explanation = generate_explanation_llm(extracted_text, user_id)
+        except QuotaExceeded:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"LLM explanation failed: {str(e)}")
+    except Exception:
+        _remove_stored([_path_of(file_url)])
+        raise
+    return {
         "user_id": user_id,
         "file_url": file_url,
-        "file_type": file.content_type,
+        "storage_path": _path_of(file_url),
+        "file_type": content_type,
         "file_size": len(upload_bytes),
         "extracted_text": extracted_text,
         "explanation": explanation,
-        "title": file.filename,
+        "title": filename,
     }
-    try:
-        supabase.table("medical_documents").insert(data).execute()
-    except Exception as e:
-        return JSONResponse(status_code=500, content={
-            "error": f"Database insert failed: {str(e)}"
-        })
 
-    return JSONResponse({
-        "file_url": file_url,
-        "extracted_text": extracted_text,
-        "explanation": explanation,
-    })
+
+@router.post("/upload-batch")
+async def upload_documents_batch(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Upload many documents at once
+
+    - Each file is validated (type, size, signature) before any processing
+    - Files are processed concurrently, at most UPLOAD_PER_USER_PARALLELISM per user
+    - Successful results are inserted into medical_documents in one statement
+    - Returns per-file status; a failing file does not fail the batch
+    """
+    if len(files) > settings.UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {settings.UPLOAD_BATCH_MAX_FILES}).")
+
+    semaphore = _user_semaphore(user_id)
+    results = [{"filename": f.filename, "status": "pending"} for f in files]
+
+    async def handle(i: int, file: UploadFile):
+        error = await _validate_upload(file)
+        if error:
+            results[i].update(status="rejected", error=error)
+            return None
+        async with semaphore:
+            contents = await file.read()
+            pages = []
+            try:
+                row = await run_in_threadpool(_process_batch_file, user_id, file.filename, file.content_type, contents, pages)
+            except Exception as e:
+                results[i].update(status="failed", error=str(e))
+                return None
+        if pages:
+            results[i]["pages"] = pages
+        return i, row
+
+    processed = [r for r in await asyncio.gather(*(handle(i, f) for i, f in enumerate(files))) if r]
+    if processed:
+        try:
+            insert_resp = supabase.table("medical_documents").insert([row for _, row in processed]).execute()
+            inserted = insert_resp.data or []
+        except Exception as e:
+            for i, _ in processed:
+                results[i].update(status="failed", error=f"Database insert failed: {str(e)}")
+            await run_in_threadpool(_remove_stored, [row["storage_path"] for _, row in processed])
+            inserted = []
+        # Bulk insert returns rows in input order
+        for (i, row), doc in zip(processed, inserted):
+            results[i].update(status="ok", id=doc["id"], file_url=row["file_url"], explanation=row["explanation"])
+            if row["extracted_text"]:
+                background_tasks.add_task(index_document, supabase, user_id, doc["id"], row["title"], row["extracted_text"])
+
+    return {
+        "results": results,
+        "succeeded": sum(1 for r in results if r["status"] == "ok"),
+        "failed": sum(1 for r in results if r["status"] != "ok"),
+    }
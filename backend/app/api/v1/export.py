@@ -0,0 +1,42 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.core.database import get_supabase
+from app.api.dependencies import get_current_user
+from app.core.record_export import InvalidCursor, decode_cursor, stream_export
+
+router = APIRouter()
+
+# --- Export Endpoints ---
+
+@router.get("")
+def export_records(
+    cursor: Optional[str] = Query(None, max_length=512),
+    supabase=Depends(get_supabase),
+    current_user=Depends(get_current_user)
+):
+    """
+    Download the current user's complete medical record as a streamed ZIP
+
+    - profile.json, <table>.ndjson for the medical profile, history tables, chats,
+      messages (archived ones included) and documents, plus files/<document id>/...
+    - Large accounts come in parts: when manifest.json has "complete": false, request
+      the next part with ?cursor=<next_cursor>. Repeating a cursor re-sends that part,
+      so a failed download resumes from the last part that completed
+    """
+    part = 1
+    if cursor:
+        try:
+            part = decode_cursor(cursor)["part"]
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        stream_export(supabase, current_user["id"], cursor),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="aarogyan-export-part{part}.zip"',
+            "Cache-Control": "no-store",
+        },
+    )
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, Query
+from app.core.database import get_supabase
+from app.api.dependencies import get_current_user
+from app.schemas.search import SearchResponse
+
+router = APIRouter()
+
+# --- Search Endpoints ---
+
+@router.get("", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=2, max_length=200),
+    scope: str = Query("all", pattern="^(all|documents|messages)$"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    supabase=Depends(get_supabase),
+    current_user=Depends(get_current_user)
+):
+    """
+    Full-text search over the current user's documents and chat messages
+
+    - Ranked (ts_rank_cd), highlighted with <mark>, paginated
+    - Backed by GIN-indexed tsvector columns (see migrations/2026-10-03-full-text-search.sql)
+    """
+    response = supabase.rpc("search_user_content", {
+        "p_user_id": current_user["id"],
+        "p_query": q,
+        "p_scope": scope,
+        "p_limit": limit,
+        "p_offset": offset,
+    }).execute()
+    rows = response.data or []
+    total = rows[0]["total_count"] if rows else 0
+    return SearchResponse(query=q, total=total, limit=limit, offset=offset, hits=rows)
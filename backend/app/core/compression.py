@@ -0,0 +1,91 @@
+# Negotiated response compression (brotli when available, else gzip) above a size threshold
+import gzip
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Already-compressed payloads are passed through untouched
+_SKIP_CONTENT_TYPES = ("image/", "application/pdf", "application/zip", "application/gzip")
+
+
+def _accepted_encodings(accept_encoding: str) -> dict:
+    encodings = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            encodings[name.strip().lower()] = q
+    return encodings
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        initial_message: Message = {}
+        started = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal initial_message, started
+            if message["type"] == "http.response.start":
+                initial_message = message
+                return
+            if message["type"] != "http.response.body" or started:
+                await send(message)
+                return
+
+            started = True
+            headers = MutableHeaders(raw=initial_message["headers"])
+            body = message.get("body", b"")
+            skip = (
+                message.get("more_body", False)  # streaming responses go out as-is
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+                or headers.get("content-type", "").startswith(_SKIP_CONTENT_TYPES)
+            )
+            if not skip:
+                if encoding == "br":
+                    body = brotli.compress(body, quality=self.brotli_quality)
+                else:
+                    body = gzip.compress(body, compresslevel=self.gzip_level)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = {**message, "body": body}
+            await send(initial_message)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,40 @@
+# Conditional GET helpers: cheap version tags, 304 Not Modified and Cache-Control hints
+import hashlib
+from typing import Optional
+from fastapi import Request, Response
+
+CACHE_CONTROL = "private, no-cache"  # clients may keep a copy but must revalidate with If-None-Match
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag from version parts (ids, updated_at, counts, ...)"""
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: ignore the W/ prefix on either side
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Set ETag/Cache-Control on the outgoing response. If the client already has
+    this version, return a 304 response the endpoint should return as-is.
+    """
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
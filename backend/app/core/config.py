@@ -25,12 +25,96 @@ class Settings(BaseSettings):
         JWT_ALGORITHM: str = "HS256"
         ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
         REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+        TOKEN_CACHE_SIZE: int = 4096  # verified tokens kept per worker, 0 disables
+        TOKEN_REVOCATION_SYNC_SECONDS: int = 15  # how often workers pull new revocations
+        TOKEN_REVOCATION_SYNC_OVERLAP_SECONDS: int = 300  # re-read window for late commits and clock skew
+        REFRESH_REUSE_GRACE_SECONDS: int = 10  # a just-used refresh token replayed this soon is a race, not theft
+
+        # Tracing (app/core/tracing.py); no exporters means tracing is off
+        TRACE_EXPORTERS: str = ""  # comma-separated: console, file, otlp
+        TRACE_SAMPLE_RATE: float = 0.05  # fraction of new traces recorded; incoming traceparent flags win
+        TRACE_FILE_PATH: str = "traces.jsonl"
+        TRACE_OTLP_ENDPOINT: Optional[str] = None  # e.g. http://otel-collector:4318/v1/traces
+        TRACE_SERVICE_NAME: str = "aarogyan-api"
+        TRACE_MAX_QUEUE: int = 2048  # finished spans buffered per worker; extra spans are dropped
+        TRACE_BATCH_SIZE: int = 256
+        TRACE_FLUSH_SECONDS: float = 5.0
+
+        # Message archival (app/jobs/archive_messages.py)
+        ARCHIVE_IDLE_DAYS: int = 90  # chats without messages for this long move to cold storage
+        ARCHIVE_ZSTD_LEVEL: int = 9
+        ARCHIVE_CACHE_CHATS: int = 64  # decompressed archives kept in memory per worker
+
+        # Medical-record export (app/core/record_export.py)
+        EXPORT_PART_MAX_MB: int = 512  # a part ends at the next page/file boundary past this much ZIP output
+        EXPORT_PAGE_SIZE: int = 500
+
+        # Idempotency-Key for retried POSTs (app/core/idempotency.py)
+        IDEMPOTENCY_TTL_SECONDS: int = 86400  # completed responses are replayed this long
+        IDEMPOTENCY_LOCK_SECONDS: int = 180  # renewed while the request runs; a claim not renewed this long is presumed dead
+        IDEMPOTENCY_WAIT_SECONDS: int = 60  # a duplicate waits this long for the original, then 409
+        IDEMPOTENCY_POLL_SECONDS: float = 0.5
+
+        # LLM usage ledger and quotas (app/core/llm_usage.py)
+        LLM_USAGE_FLUSH_SECONDS: float = 5  # buffered usage records are written at least this often
+        LLM_USAGE_BATCH_SIZE: int = 200  # ...or as soon as this many are waiting
+        LLM_USAGE_MAX_BUFFER: int = 10000  # oldest records are dropped beyond this while the DB is unreachable
+        LLM_DAILY_TOKEN_BUDGET: int = 0  # prompt + completion tokens per user per UTC day; 0 = no quota
+        LLM_QUOTA_ACTION: str = "downgrade"  # over budget: "downgrade" to LLM_FALLBACK_MODEL, or "reject" (429)
+        LLM_FALLBACK_MODEL: Optional[str] = None  # cheaper OpenRouter model; without it "downgrade" rejects too
+        LLM_QUOTA_REFRESH_SECONDS: int = 60  # how often a worker re-reads a user's usage from the DB
+
+        # Chat WebSocket
+        WS_MAX_CONNECTIONS_PER_WORKER: int = 200
+        WS_HEARTBEAT_SECONDS: int = 25
+        WS_IDLE_TIMEOUT_SECONDS: int = 300
+        WS_AUTH_TIMEOUT_SECONDS: int = 10  # the first frame must authenticate within this
+
+        # PDF text extraction: embedded text layer first, OCR only for pages without one
+        PDF_TEXT_MIN_CHARS: int = 32  # letters/digits a page's text layer needs to skip OCR
+        PDF_OCR_DPI: int = 200
+
+        # Batch document upload
+        UPLOAD_BATCH_MAX_FILES: int = 20
+        UPLOAD_PER_USER_PARALLELISM: int = 3  # files of one user processed concurrently per worker
+
+        # Patient context digest for the AI assistant (app/core/patient_context.py)
+        PATIENT_DIGEST_MAX_CHARS: int = 1500
+
+        # Document retrieval for the AI assistant
+        DOCUMENT_EMBEDDING_MODEL: Optional[str] = None  # sentence-transformers model; hashing vectorizer when unset
+        RETRIEVAL_TOP_K: int = 4
+        RETRIEVAL_TOKEN_BUDGET: int = 600
+        RETRIEVAL_MIN_SCORE: float = 0.1
+        RETRIEVAL_CACHE_USERS: int = 256  # per-user indexes kept in memory per worker
+        RETRIEVAL_CACHE_TTL_SECONDS: int = 300
 
         # API
         API_V1_PREFIX: str = "/api/v1"
         PROJECT_NAME: str = "Aarogyan API"
         DEBUG: bool = True
 
+        # Server (production launcher, see gunicorn_conf.py)
+        PORT: int = 10000
+        WEB_CONCURRENCY: Optional[int] = None  # overrides the CPU/memory derived worker count
+        WORKER_MEMORY_MB: int = 512  # budget per worker, OCR pages are the big consumer
+        MAX_WORKERS: int = 8
+        MAX_REQUESTS: int = 500  # recycle a worker after this many requests
+        MAX_REQUESTS_JITTER: int = 50
+        GRACEFUL_TIMEOUT: int = 30  # seconds to drain in-flight requests on SIGTERM
+        WORKER_TIMEOUT: int = 120
+        KEEPALIVE: int = 5
+
+        # Per-worker pools
+        WORKER_THREADPOOL_SIZE: int = 40  # threads for sync endpoints (OCR, bcrypt, supabase)
+        HTTP_POOL_MAX_CONNECTIONS: int = 20
+        HTTP_POOL_MAX_KEEPALIVE: int = 10
+
+        # Response compression (brotli if installed, else gzip)
+        COMPRESSION_MIN_SIZE: int = 1024
+        GZIP_LEVEL: int = 6
+        BROTLI_QUALITY: int = 4
+
         class Config:
                 env_file = ".env"
                 case_sensitive = True
@@ -2,6 +2,7 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.core.tracing import instrument_supabase
 
 # Supabase client instance
 from supabase import create_client, Client
@@ -10,6 +11,7 @@ supabase: Client = create_client(
     settings.SUPABASE_URL,
     settings.SUPABASE_SERVICE_ROLE_KEY
 )
+instrument_supabase(supabase)
 
 def get_supabase() -> Client:
     """Dependency to get Supabase client"""
@@ -0,0 +1,211 @@
+# Per-user retrieval index over digitized documents (OCR text) for the AI assistant
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def chunk_text(text: str, max_words: int = 120, overlap: int = 20) -> List[str]:
+    """Split text into overlapping word windows"""
+    words = (text or "").split()
+    if not words:
+        return []
+    step = max(1, max_words - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + max_words]))
+        if start + max_words >= len(words):
+            break
+    return chunks
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+@lru_cache(maxsize=65536)
+def _hash_feature(feature: str) -> int:
+    # Stable across processes (unlike hash())
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+
+
+class HashingEmbedder:
+    """Signed feature hashing of unigrams + bigrams; no model download, CPU only"""
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = _TOKEN_RE.findall(text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                h = _hash_feature(feature)
+                vectors[row, h % self.dim] += 1.0 if h >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU sentence-transformers model (optional dependency)"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+_embedder = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        if settings.DOCUMENT_EMBEDDING_MODEL:
+            try:
+                _embedder = SentenceTransformerEmbedder(settings.DOCUMENT_EMBEDDING_MODEL)
+            except Exception as e:
+                logger.warning(f"Falling back to hashing embedder: {e}")
+        if _embedder is None:
+            _embedder = HashingEmbedder()
+    return _embedder
+
+
+# --- Per-user in-memory index (worker-local cache of document_chunks) ---
+
+class _UserIndex:
+    def __init__(self, matrix: np.ndarray, chunks: list):
+        self.matrix = matrix
+        self.chunks = chunks  # [{"content", "title", "document_id"}]
+        self.loaded_at = time.monotonic()
+
+
+_indexes: "OrderedDict[str, _UserIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def invalidate_user_index(user_id: str) -> None:
+    with _indexes_lock:
+        _indexes.pop(user_id, None)
+
+
+def _load_user_index(supabase, user_id: str) -> _UserIndex:
+    embedder = get_embedder()
+    rows, offset, page = [], 0, 1000
+    while True:
+        resp = (
+            supabase.table("document_chunks").select("document_id, title, content, embedding")
+            .eq("user_id", user_id).eq("embedder", embedder.name)
+            .order("document_id").order("chunk_index")
+            .range(offset, offset + page - 1)
+            .execute()
+        )
+        batch = resp.data or []
+        rows.extend(batch)
+        if len(batch) < page:
+            break
+        offset += page
+    if rows:
+        matrix = np.asarray([r["embedding"] for r in rows], dtype=np.float32)
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+    chunks = [{"content": r["content"], "title": r.get("title"), "document_id": r["document_id"]} for r in rows]
+    return _UserIndex(matrix, chunks)
+
+
+def _get_user_index(supabase, user_id: str) -> _UserIndex:
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is not None and time.monotonic() - index.loaded_at < settings.RETRIEVAL_CACHE_TTL_SECONDS:
+            _indexes.move_to_end(user_id)
+            return index
+    index = _load_user_index(supabase, user_id)
+    with _indexes_lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > settings.RETRIEVAL_CACHE_USERS:
+            _indexes.popitem(last=False)
+    return index
+
+
+# --- Indexing and retrieval ---
+
+def index_document(supabase, user_id: str, document_id: str, title: Optional[str], text: str) -> int:
+    """Chunk + embed a document's extracted text into document_chunks. Returns chunk count."""
+    with span("document.index", {"document.chars": len(text or "")}) as sp:
+        chunks = chunk_text(text)
+        sp.set_attribute("document.chunks", len(chunks))
+        if not chunks:
+            return 0
+        embedder = get_embedder()
+        vectors = embedder.embed(chunks)
+        supabase.table("document_chunks").delete().eq("document_id", document_id).execute()
+        supabase.table("document_chunks").insert([
+            {
+                "user_id": user_id,
+                "document_id": document_id,
+                "chunk_index": i,
+                "title": title,
+                "content": chunk,
+                "embedder": embedder.name,
+                "embedding": vector.tolist(),
+            }
+            for i, (chunk, vector) in enumerate(zip(chunks, vectors))
+        ]).execute()
+        invalidate_user_index(user_id)
+        return len(chunks)
+
+
+def retrieve_context(supabase, user_id: str, query: str, top_k: int = None, token_budget: int = None) -> List[dict]:
+    """
+    Top-k document chunks relevant to `query`, trimmed to a token budget.
+    Only the first call per user (or after invalidation/TTL) touches the database.
+    """
+    with span("retrieval.search") as sp:
+        results = _retrieve(supabase, user_id, query, top_k, token_budget)
+        sp.set_attributes({"retrieval.hits": len(results), "retrieval.tokens": sum(estimate_tokens(r["content"]) for r in results)})
+        return results
+
+
+def _retrieve(supabase, user_id: str, query: str, top_k: int = None, token_budget: int = None) -> List[dict]:
+    top_k = top_k or settings.RETRIEVAL_TOP_K
+    token_budget = token_budget or settings.RETRIEVAL_TOKEN_BUDGET
+    index = _get_user_index(supabase, user_id)
+    if not index.chunks or not query.strip():
+        return []
+    q = get_embedder().embed([query])[0]
+    scores = index.matrix @ q
+    k = min(top_k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+
+    results, used = [], 0
+    for i in top:
+        if scores[i] < settings.RETRIEVAL_MIN_SCORE:
+            break
+        chunk = index.chunks[i]
+        cost = estimate_tokens(chunk["content"])
+        if used + cost > token_budget:
+            continue
+        used += cost
+        results.append({**chunk, "score": float(scores[i])})
+    return results
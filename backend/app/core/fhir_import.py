@@ -0,0 +1,384 @@
+# Streaming import of FHIR R4 resources into the medical-history tables
+import json
+import time
+from typing import IO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+
+from app.core.profile_store import bootstrap_onboarding, refresh_completion_score
+
+try:
+    import ijson
+except ImportError:  # ijson is optional: JSON bundles are then parsed in one piece (NDJSON always streams)
+    ijson = None
+
+MAX_REPORTED_ERRORS = 1000
+
+# Raised by iter_resources for a malformed bundle
+INVALID_INPUT_ERRORS = (ValueError,) + ((ijson.JSONError,) if ijson is not None else ())
+
+
+def _text(concept: Optional[dict]) -> Optional[str]:
+    """Display text of a CodeableConcept: .text, else the first coding's display or code"""
+    if not concept:
+        return None
+    if concept.get("text"):
+        return concept["text"].strip()
+    for coding in concept.get("coding") or []:
+        if coding.get("display") or coding.get("code"):
+            return (coding.get("display") or coding["code"]).strip()
+    return None
+
+
+def _code(concept: Optional[dict]) -> Optional[str]:
+    for coding in (concept or {}).get("coding") or []:
+        if coding.get("code"):
+            return coding["code"]
+    return None
+
+
+def _quantity(quantity: Optional[dict]) -> Optional[str]:
+    if not quantity or quantity.get("value") is None:
+        return None
+    comparator = quantity.get("comparator", "")
+    unit = quantity.get("unit") or quantity.get("code") or ""
+    return f"{comparator}{quantity['value']} {unit}".strip()
+
+
+def _date(resource: dict, *fields: str) -> Optional[str]:
+    for field in fields:
+        value = resource.get(field)
+        if isinstance(value, dict):  # Period
+            value = value.get("start")
+        if isinstance(value, str) and len(value) >= 4:
+            return value[:10]
+    return None
+
+
+def map_condition(resource: dict) -> dict:
+    name = _text(resource.get("code"))
+    if not name:
+        raise ValueError("Condition has no code")
+    row = {"name": name}
+    onset = _date(resource, "onsetDateTime", "onsetPeriod", "recordedDate")
+    if onset:
+        row["year_diagnosed"] = int(onset[:4])
+    status = _code(resource.get("clinicalStatus"))
+    if status:
+        row["controlled_status"] = status
+    return row
+
+
+def _timing(dosage: dict) -> Optional[str]:
+    timing = dosage.get("timing") or {}
+    if _text(timing.get("code")):
+        return _text(timing["code"])
+    repeat = timing.get("repeat") or {}
+    if repeat.get("frequency") and repeat.get("periodUnit"):
+        return f"{repeat['frequency']}x per {repeat.get('period', 1)} {repeat['periodUnit']}"
+    return None
+
+
+def map_medication_statement(resource: dict) -> dict:
+    name = _text(resource.get("medicationCodeableConcept")) or (resource.get("medicationReference") or {}).get("display")
+    if not name:
+        raise ValueError("MedicationStatement has no medication")
+    row = {"name": name}
+    dosage = (resource.get("dosage") or [{}])[0]
+    dose = None
+    for dose_and_rate in dosage.get("doseAndRate") or []:
+        dose = _quantity(dose_and_rate.get("doseQuantity"))
+        if dose:
+            break
+    if dose or dosage.get("text"):
+        row["dose"] = dose or dosage["text"]
+    frequency = _timing(dosage)
+    if frequency:
+        row["frequency"] = frequency
+    reason = _text((resource.get("reasonCode") or [None])[0])
+    if reason:
+        row["condition"] = reason
+    since = _date(resource, "effectiveDateTime", "effectivePeriod")
+    if since:
+        row["since"] = since
+    return row
+
+
+def map_allergy_intolerance(resource: dict) -> dict:
+    allergen = _text(resource.get("code"))
+    if not allergen:
+        raise ValueError("AllergyIntolerance has no code")
+    row = {"allergen": allergen}
+    reaction = (resource.get("reaction") or [{}])[0]
+    manifestation = _text((reaction.get("manifestation") or [None])[0])
+    if manifestation:
+        row["reaction_type"] = manifestation
+    severity = reaction.get("severity") or resource.get("criticality")
+    if severity:
+        row["severity"] = severity
+    return row
+
+
+def map_observation(resource: dict) -> Optional[dict]:
+    """Laboratory observations only (vital signs, social history ... are skipped: None)"""
+    categories = {_code(c) for c in resource.get("category") or []}
+    if categories and "laboratory" not in categories:
+        return None
+    name = _text(resource.get("code"))
+    if not name:
+        raise ValueError("Observation has no code")
+    value = (
+        _quantity(resource.get("valueQuantity"))
+        or resource.get("valueString")
+        or _text(resource.get("valueCodeableConcept"))
+    )
+    if value is None and resource.get("valueInteger") is not None:
+        value = str(resource["valueInteger"])
+    row = {"name": name}
+    if value is not None:
+        row["value"] = value
+    date = _date(resource, "effectiveDateTime", "effectivePeriod", "issued")
+    if date:
+        row["date"] = date
+    return row
+
+
+# resourceType -> (table, mapper); a mapper returns the row, None to skip, or raises ValueError
+RESOURCE_MAPPERS: Dict[str, Tuple[str, Callable[[dict], Optional[dict]]]] = {
+    "Condition": ("chronic_conditions", map_condition),
+    "MedicationStatement": ("medications", map_medication_statement),
+    "AllergyIntolerance": ("allergies", map_allergy_intolerance),
+    "Observation": ("lab_values", map_observation),
+}
+
+
+def _norm(value) -> str:
+    return " ".join(str(value or "").lower().split())
+
+
+# Columns that identify "the same record" when deduplicating against existing rows
+DEDUP_KEYS: Dict[str, Tuple[str, ...]] = {
+    "chronic_conditions": ("name",),
+    "medications": ("name", "dose"),
+    "allergies": ("allergen",),
+    "lab_values": ("name", "value", "date"),
+}
+
+
+def _dedup_key(table: str, row: dict) -> tuple:
+    return tuple(_norm(row.get(column)) for column in DEDUP_KEYS[table])
+
+
+def iter_resources(fp: IO[bytes], ndjson: bool = False) -> Iterator[dict]:
+    """
+    Resources from a FHIR Bundle (JSON; entries streamed with ijson when installed)
+    or, with ndjson=True, a bulk-export file with one resource per line (always streamed;
+    an unparseable line yields None so it is reported without stopping the import).
+    A Bundle entry that is not an object, or whose resource is not one, also yields None.
+    """
+    if ndjson:
+        for line in fp:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+        return
+    if ijson is not None:
+        entries = ijson.items(fp, "entry.item", use_float=True)
+    else:
+        bundle = json.load(fp)
+        if not isinstance(bundle, dict):
+            raise ValueError("A FHIR Bundle must be a JSON object")
+        entries = bundle.get("entry") or []
+        if not isinstance(entries, list):
+            raise ValueError("Bundle.entry must be an array")
+    for entry in entries:
+        if not isinstance(entry, dict):
+            yield None
+            continue
+        resource = entry.get("resource")
+        if resource is not None and not isinstance(resource, dict):
+            yield None
+        elif resource:
+            yield resource
+
+
+def is_ndjson(filename: str) -> bool:
+    return filename.lower().endswith((".ndjson", ".jsonl"))
+
+
+def _subject_id(resource: dict) -> Optional[str]:
+    reference = (resource.get("subject") or resource.get("patient") or {}).get("reference") or ""
+    return reference.rsplit("/", 1)[-1] or None
+
+
+def _patient_email(resource: dict) -> Optional[str]:
+    for telecom in resource.get("telecom") or []:
+        if telecom.get("system") == "email" and telecom.get("value"):
+            return telecom["value"].strip().lower()
+    return None
+
+
+class FhirImporter:
+    """
+    Maps FHIR resources to history-table rows and writes them in multi-row inserts
+    of `batch_size`, skipping rows already present for the profile (DEDUP_KEYS) or
+    repeated within the import. Patients are resolved by `user_id` (every resource
+    belongs to that user), by `patient_map` (FHIR Patient id -> user id) or by the
+    email in Patient resources seen earlier in the stream. Completion scores are
+    recomputed once per touched profile in finish().
+    """
+
+    def __init__(self, supabase, user_id: Optional[str] = None, patient_map: Optional[Dict[str, str]] = None,
+                 batch_size: int = 500, dry_run: bool = False):
+        self.supabase = supabase
+        self.user_id = user_id
+        self.patient_map = dict(patient_map or {})
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self._profile_ids: Dict[str, int] = {}  # user id -> medical profile id
+        self._seen: Dict[str, set] = {table: set() for table in DEDUP_KEYS}  # (profile_id, *key)
+        self._loaded_profiles: set = set()
+        self._pending: Dict[str, List[Tuple[int, str, dict]]] = {table: [] for table in DEDUP_KEYS}
+        self._touched: set = set()
+        self._start = time.perf_counter()
+        self.stats = {
+            "resources": 0, "inserted": 0, "duplicates": 0, "skipped": 0, "errors": 0,
+            "batches": 0, "profiles": 0, "seconds": 0.0,
+        }
+        self.inserted_by_table = {table: 0 for table in DEDUP_KEYS}
+        self.errors: List[dict] = []
+
+    def _error(self, index: int, resource_ref: str, message: str) -> None:
+        self.stats["errors"] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"index": index, "resource": resource_ref, "error": message})
+
+    def _profile_id(self, user_id: str) -> int:
+        profile_id = self._profile_ids.get(user_id)
+        if profile_id is None:
+            rows = self.supabase.table("user_medical_profiles").select("id").eq("user_id", user_id).execute().data
+            # Imported patients may never have opened onboarding: create the profile then
+            profile_id = rows[0]["id"] if rows else bootstrap_onboarding(self.supabase, user_id)[0]["id"]
+            self._profile_ids[user_id] = profile_id
+        return profile_id
+
+    def _register_patient(self, resource: dict) -> None:
+        email = _patient_email(resource)
+        if not email or not resource.get("id") or resource["id"] in self.patient_map:
+            return
+        rows = self.supabase.table("profiles").select("id").eq("email", email).execute().data
+        if rows:
+            self.patient_map[resource["id"]] = rows[0]["id"]
+
+    def add(self, index: int, resource: Optional[dict]) -> None:
+        self.stats["resources"] += 1
+        if not isinstance(resource, dict):
+            self._error(index, f"#{index}", "Invalid JSON resource")
+            return
+        resource_type = resource.get("resourceType")
+        resource_ref = f"{resource_type}/{resource.get('id', index)}"
+        if resource_type == "Patient":
+            if self.user_id is None:
+                self._register_patient(resource)
+            return
+        if resource_type not in RESOURCE_MAPPERS:
+            self.stats["skipped"] += 1
+            return
+        table, mapper = RESOURCE_MAPPERS[resource_type]
+        try:
+            row = mapper(resource)
+        except (ValueError, TypeError, KeyError, AttributeError, IndexError) as e:
+            self._error(index, resource_ref, str(e) or type(e).__name__)
+            return
+        if row is None:
+            self.stats["skipped"] += 1
+            return
+
+        user_id = self.user_id or self.patient_map.get(_subject_id(resource) or "")
+        if not user_id:
+            self._error(index, resource_ref, f"Unknown patient {_subject_id(resource)!r}")
+            return
+        try:
+            row["profile_id"] = self._profile_id(user_id)
+        except APIError as e:
+            self._error(index, resource_ref, f"Profile lookup failed: {e.message}")
+            return
+        self._pending[table].append((index, resource_ref, row))
+        if len(self._pending[table]) >= self.batch_size:
+            self._flush(table)
+
+    def _load_existing(self, table: str, profile_ids: List[int], page_size: int = 1000) -> None:
+        columns = ", ".join(("profile_id",) + DEDUP_KEYS[table])
+        offset = 0
+        while True:
+            rows = (
+                self.supabase.table(table).select(columns).in_("profile_id", profile_ids)
+                .order("id").range(offset, offset + page_size - 1)
+                .execute().data or []
+            )
+            self._seen[table].update((r["profile_id"],) + _dedup_key(table, r) for r in rows)
+            if len(rows) < page_size:
+                return
+            offset += page_size
+
+    def _flush(self, table: str) -> None:
+        pending, self._pending[table] = self._pending[table], []
+        if not pending:
+            return
+        new_profiles = sorted({row["profile_id"] for _, _, row in pending} - self._loaded_profiles)
+        if new_profiles:
+            # Existing rows of every table, once per profile, so later batches dedupe in memory
+            for name in DEDUP_KEYS:
+                self._load_existing(name, new_profiles)
+            self._loaded_profiles.update(new_profiles)
+
+        batch = []
+        for index, resource_ref, row in pending:
+            key = (row["profile_id"],) + _dedup_key(table, row)
+            if key in self._seen[table]:
+                self.stats["duplicates"] += 1
+                continue
+            self._seen[table].add(key)
+            batch.append((index, resource_ref, row))
+        if not batch:
+            return
+        self.stats["batches"] += 1
+        if not self.dry_run:
+            try:
+                self.supabase.table(table).insert([row for _, _, row in batch]).execute()
+            except APIError:
+                # One bad row fails the statement: retry row by row to pin the error on it
+                ok = []
+                for index, resource_ref, row in batch:
+                    try:
+                        self.supabase.table(table).insert(row).execute()
+                        ok.append((index, resource_ref, row))
+                    except APIError as e:
+                        self._error(index, resource_ref, e.message)
+                batch = ok
+        self.stats["inserted"] += len(batch)
+        self.inserted_by_table[table] += len(batch)
+        self._touched.update(row["profile_id"] for _, _, row in batch)
+
+    def finish(self) -> dict:
+        """Flush remaining rows, recompute touched profiles' scores once each, return stats"""
+        for table in DEDUP_KEYS:
+            self._flush(table)
+        if not self.dry_run:
+            for profile_id in sorted(self._touched):
+                refresh_completion_score(self.supabase, profile_id=profile_id)
+        self.stats["profiles"] = len(self._touched)
+        elapsed = time.perf_counter() - self._start
+        self.stats["seconds"] = round(elapsed, 2)
+        self.stats["resources_per_second"] = round(self.stats["resources"] / elapsed, 1) if elapsed else 0.0
+        return {**self.stats, "inserted_by_table": self.inserted_by_table, "error_details": self.errors}
+
+
+def import_fhir(supabase, fp: IO[bytes], ndjson: bool = False, **options) -> dict:
+    """Import every resource in `fp` (see iter_resources); options go to FhirImporter"""
+    importer = FhirImporter(supabase, **options)
+    for index, resource in enumerate(iter_resources(fp, ndjson)):
+        importer.add(index, resource)
+    return importer.finish()
@@ -0,0 +1,166 @@
+# Idempotency-Key support for retried POSTs (see migrations/2026-10-09-idempotency-keys.sql)
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+# (user_id, endpoint, key) -> result of the request running in this worker; duplicates
+# arriving at the same worker wait on it instead of polling the table. The result is
+# None when the request failed and was not stored (waiters then claim the key themselves).
+_inflight: Dict[tuple, "asyncio.Future[Optional[Tuple[int, object]]]"] = {}
+
+
+def request_fingerprint(*parts) -> str:
+    """Hash of what makes two requests "the same"; a key reused with another fingerprint is rejected"""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode()
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _claim(supabase, user_id: str, endpoint: str, key: str, fingerprint: str) -> dict:
+    return supabase.rpc("claim_idempotency_key", {
+        "p_user_id": user_id,
+        "p_endpoint": endpoint,
+        "p_key": key,
+        "p_fingerprint": fingerprint,
+        "p_lock_seconds": settings.IDEMPOTENCY_LOCK_SECONDS,
+    }).execute().data
+
+
+def _store(supabase, user_id: str, endpoint: str, key: str, status_code: int, body) -> None:
+    supabase.table("idempotency_keys").update({
+        "status_code": status_code,
+        "response": body,
+        "expires_at": (datetime.utcnow() + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)).isoformat(),
+    }).eq("user_id", user_id).eq("endpoint", endpoint).eq("key", key).execute()
+
+
+def _extend(supabase, user_id: str, endpoint: str, key: str) -> None:
+    supabase.table("idempotency_keys").update({
+        "expires_at": (datetime.utcnow() + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)).isoformat(),
+    }).eq("user_id", user_id).eq("endpoint", endpoint).eq("key", key).is_("status_code", "null").execute()
+
+
+async def _keep_claimed(supabase, scope: tuple) -> None:
+    # A slow handler (OCR + LLM) may outlive IDEMPOTENCY_LOCK_SECONDS; renewing the claim
+    # keeps retries waiting instead of running the request a second time
+    while True:
+        await asyncio.sleep(settings.IDEMPOTENCY_LOCK_SECONDS / 3)
+        try:
+            await run_in_threadpool(_extend, supabase, *scope)
+        except Exception as e:
+            logger.warning(f"Extending idempotency claim failed: {e}")
+
+
+def _release(supabase, user_id: str, endpoint: str, key: str) -> None:
+    supabase.table("idempotency_keys").delete() \
+        .eq("user_id", user_id).eq("endpoint", endpoint).eq("key", key).is_("status_code", "null").execute()
+
+
+def _result(response) -> Tuple[int, object]:
+    if isinstance(response, Response):
+        return response.status_code, json.loads(response.body) if response.body else None
+    return 200, jsonable_encoder(response)
+
+
+def _replay(status_code: int, body) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content=body, headers={"Idempotent-Replayed": "true"})
+
+
+async def idempotent(
+    supabase,
+    key: Optional[str],
+    user_id: str,
+    endpoint: str,
+    fingerprint: str,
+    handler: Callable[[], Awaitable[object]],
+):
+    """
+    Run `handler` at most once per (user, endpoint, Idempotency-Key).
+
+    - No key: just runs the handler
+    - First request with a key: runs it; responses below 500 are stored for
+      IDEMPOTENCY_TTL_SECONDS, 5xx responses and exceptions release the key.
+      The claim is renewed every IDEMPOTENCY_LOCK_SECONDS / 3 while the handler runs,
+      so it only lapses when the worker running it dies
+    - Duplicate while the first is running: waits (up to IDEMPOTENCY_WAIT_SECONDS,
+      then 409) and returns the first request's response
+    - Duplicate after completion: replays the stored response (Idempotent-Replayed header)
+    - Same key with a different request body: 422
+    """
+    if key is None:
+        return await handler()
+    if not 1 <= len(key) <= 255:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} must be 1-255 characters")
+
+    scope = (user_id, endpoint, key)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        local = _inflight.get(scope)
+        if local is not None:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(local), timeout=max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                break
+            if result is not None:
+                return _replay(*result)
+            continue
+
+        claim = await run_in_threadpool(_claim, supabase, user_id, endpoint, key, fingerprint)
+        state = claim["state"]
+        if state == "completed":
+            return _replay(claim["status_code"], claim["response"])
+        if state == "mismatch":
+            raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used for a different request")
+        if state == "claimed":
+            return await _execute(supabase, scope, handler, loop)
+        if loop.time() >= deadline:
+            break
+        await asyncio.sleep(settings.IDEMPOTENCY_POLL_SECONDS)
+    raise HTTPException(status_code=409, detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress")
+
+
+async def _execute(supabase, scope: tuple, handler, loop):
+    user_id, endpoint, key = scope
+    future = loop.create_future()
+    _inflight[scope] = future
+    heartbeat = asyncio.create_task(_keep_claimed(supabase, scope))
+    result = None
+    try:
+        try:
+            response = await handler()
+        finally:
+            heartbeat.cancel()
+        status_code, body = _result(response)
+        if status_code < 500:
+            try:
+                await run_in_threadpool(_store, supabase, user_id, endpoint, key, status_code, body)
+                result = (status_code, body)
+            except Exception as e:
+                # The response is still good; the key is released so a retry runs again
+                logger.warning(f"Storing idempotent response failed: {e}")
+        return response
+    finally:
+        try:
+            if result is None:
+                await run_in_threadpool(_release, supabase, user_id, endpoint, key)
+        finally:
+            _inflight.pop(scope, None)
+            future.set_result(result)
@@ -0,0 +1,214 @@
+# LLM usage ledger and daily token quotas (see migrations/2026-10-11-llm-usage.sql)
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def _today() -> str:
+    return datetime.utcnow().date().isoformat()
+
+
+class UsageLedger:
+    """
+    Per-worker buffer of LLM call records. record() only appends under a lock;
+    a daemon thread writes the buffer through the record_llm_usage RPC every
+    LLM_USAGE_FLUSH_SECONDS, or sooner once LLM_USAGE_BATCH_SIZE records are waiting,
+    so accounting never adds a round trip to the request that made the call.
+    A failed flush keeps the records for the next one (oldest dropped beyond
+    LLM_USAGE_MAX_BUFFER). Records still buffered when a worker dies are lost.
+
+    The ledger also tracks tokens used today per user for quotas: the total from
+    llm_usage_daily (re-read every LLM_QUOTA_REFRESH_SECONDS) plus this worker's
+    records that are not flushed yet. Other workers' calls show up at the next
+    refresh, so a budget can be overshot by roughly one refresh interval of traffic.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffer: deque = deque()
+        self._wake = threading.Event()
+        # user_id -> (day, tokens in llm_usage_daily, monotonic time loaded)
+        self._spent: Dict[str, Tuple[str, int, float]] = {}
+        self.dropped = 0
+
+    def record(
+        self,
+        user_id: str,
+        feature: str,
+        model: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        latency_ms: float = 0,
+        status: str = "ok",
+        cost_usd: Optional[float] = None,
+        first_token_ms: Optional[float] = None,
+    ) -> None:
+        row = {
+            "user_id": user_id,
+            "feature": feature,
+            "model": model,
+            "prompt_tokens": int(prompt_tokens or 0),
+            "completion_tokens": int(completion_tokens or 0),
+            "cost_usd": cost_usd,
+            "latency_ms": round(latency_ms),
+            "first_token_ms": round(first_token_ms) if first_token_ms is not None else None,
+            "status": status,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+        }
+        with self._lock:
+            self._buffer.append(row)
+            while len(self._buffer) > settings.LLM_USAGE_MAX_BUFFER:
+                self._buffer.popleft()
+                self.dropped += 1
+            pending = len(self._buffer)
+        if pending >= settings.LLM_USAGE_BATCH_SIZE:
+            self._wake.set()
+
+    def flush(self, supabase) -> int:
+        """Write buffered records in batches; returns how many were written"""
+        written = 0
+        while True:
+            with self._lock:
+                batch = [self._buffer.popleft() for _ in range(min(len(self._buffer), settings.LLM_USAGE_BATCH_SIZE))]
+            if not batch:
+                return written
+            try:
+                supabase.rpc("record_llm_usage", {"p_rows": batch}).execute()
+            except Exception:
+                with self._lock:
+                    self._buffer.extendleft(reversed(batch))
+                raise
+            self._count_flushed(batch)
+            written += len(batch)
+
+    def _count_flushed(self, batch: list) -> None:
+        # Flushed rows leave the buffer; fold them into the cached totals until the next refresh
+        day = _today()
+        with self._lock:
+            for user_id in [u for u, cached in self._spent.items() if cached[0] != day]:
+                del self._spent[user_id]
+            for row in batch:
+                cached = self._spent.get(row["user_id"])
+                if cached is not None and row["created_at"].startswith(cached[0]):
+                    tokens = row["prompt_tokens"] + row["completion_tokens"]
+                    self._spent[row["user_id"]] = (cached[0], cached[1] + tokens, cached[2])
+
+    def _pending_tokens(self, user_id: str, day: str) -> int:
+        with self._lock:
+            return sum(
+                r["prompt_tokens"] + r["completion_tokens"] for r in self._buffer
+                if r["user_id"] == user_id and r["created_at"].startswith(day)
+            )
+
+    def tokens_today(self, supabase, user_id: str) -> int:
+        """Tokens this user used today (UTC): stored aggregate plus this worker's unflushed records"""
+        day = _today()
+        cached = self._spent.get(user_id)
+        if cached is None or cached[0] != day or time.monotonic() - cached[2] > settings.LLM_QUOTA_REFRESH_SECONDS:
+            rows = (
+                supabase.table("llm_usage_daily").select("prompt_tokens, completion_tokens")
+                .eq("user_id", user_id).eq("day", day).execute().data or []
+            )
+            cached = (day, sum(r["prompt_tokens"] + r["completion_tokens"] for r in rows), time.monotonic())
+            with self._lock:
+                self._spent[user_id] = cached
+        return cached[1] + self._pending_tokens(user_id, day)
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+
+ledger = UsageLedger()
+
+
+def choose_model(supabase, user_id: str, model: str, fallback: Optional[str] = None) -> str:
+    """
+    The model to use for this user's next call. Once LLM_DAILY_TOKEN_BUDGET is used up
+    today the call is downgraded to `fallback` (LLM_QUOTA_ACTION "downgrade" and a
+    fallback given) or rejected with QuotaExceeded.
+    """
+    budget = settings.LLM_DAILY_TOKEN_BUDGET
+    if budget <= 0:
+        return model
+    try:
+        spent = ledger.tokens_today(supabase, user_id)
+    except Exception as e:
+        logger.warning(f"LLM quota lookup failed, allowing the call: {e}")
+        return model
+    if spent < budget:
+        return model
+    if settings.LLM_QUOTA_ACTION == "downgrade" and fallback:
+        return fallback
+    raise QuotaExceeded("Daily AI usage limit reached. Please try again tomorrow.")
+
+
+def usage_summary(supabase, user_id: str, days: int) -> dict:
+    """Per-day, per-model aggregates for the last `days` days plus today's quota state"""
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    rows = (
+        supabase.table("llm_usage_daily").select("*")
+        .eq("user_id", user_id).gte("day", since)
+        .order("day", desc=True).order("model")
+        .execute().data or []
+    )
+    budget = settings.LLM_DAILY_TOKEN_BUDGET
+    used = ledger.tokens_today(supabase, user_id)
+    return {
+        "days": [
+            {**row, "avg_latency_ms": round(row["latency_ms_total"] / row["calls"]) if row["calls"] else 0}
+            for row in rows
+        ],
+        "today_tokens": used,
+        "daily_token_budget": budget or None,
+        "remaining_tokens": max(budget - used, 0) if budget > 0 else None,
+    }
+
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def start_usage_flush(supabase) -> None:
+    """Daemon thread flushing the ledger every LLM_USAGE_FLUSH_SECONDS (or when a batch is full)"""
+    global _thread
+    if _thread is not None:
+        return
+
+    def run():
+        while not _stop.is_set():
+            ledger._wake.wait(settings.LLM_USAGE_FLUSH_SECONDS)
+            ledger._wake.clear()
+            try:
+                ledger.flush(supabase)
+            except Exception as e:
+                logger.warning(f"LLM usage flush failed ({len(ledger)} records kept): {e}")
+                _stop.wait(settings.LLM_USAGE_FLUSH_SECONDS)  # a full buffer must not turn retries into a busy loop
+
+    _stop.clear()
+    _thread = threading.Thread(target=run, name="llm-usage-flush", daemon=True)
+    _thread.start()
+
+
+def stop_usage_flush(supabase) -> None:
+    """Stop the flush thread and write what is still buffered"""
+    global _thread
+    _stop.set()
+    ledger._wake.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
+    try:
+        ledger.flush(supabase)
+    except Exception as e:
+        logger.warning(f"Final LLM usage flush failed, {len(ledger)} records lost: {e}")
@@ -0,0 +1,156 @@
+# Cold storage for messages of idle chats: one zstd-compressed JSON blob per chat (message_archives)
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+import orjson
+import zstandard
+
+from app.core.config import settings
+from app.core.tracing import span
+
+# Explicit columns: generated ones (search_vector) must not be written back on rehydration
+MESSAGE_COLUMNS = "id, chat_id, sender, content, created_at"
+CODEC = "zstd"
+# chats.last_message_preview length; matches chats_track_message() in the chat-summary migration
+PREVIEW_CHARS = 160
+
+_cache: "OrderedDict[tuple, List[dict]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def compress_messages(raw: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=settings.ARCHIVE_ZSTD_LEVEL).compress(raw)
+
+
+def decompress_messages(blob: bytes) -> List[dict]:
+    return orjson.loads(zstandard.ZstdDecompressor().decompress(blob))
+
+
+def _to_bytea(blob: bytes) -> str:
+    # PostgREST takes and returns bytea in Postgres hex format
+    return "\\x" + blob.hex()
+
+
+def _from_bytea(value: str) -> bytes:
+    return bytes.fromhex(value[2:] if value.startswith("\\x") else value)
+
+
+def fetch_hot_messages(supabase, chat_id: str, page_size: int = 1000) -> List[dict]:
+    rows, offset = [], 0
+    while True:
+        batch = (
+            supabase.table("messages").select(MESSAGE_COLUMNS).eq("chat_id", chat_id)
+            .order("created_at").order("id")
+            .range(offset, offset + page_size - 1)
+            .execute().data or []
+        )
+        rows.extend(batch)
+        if len(batch) < page_size:
+            return rows
+        offset += page_size
+
+
+def _read_archive(supabase, chat_id: str) -> Optional[dict]:
+    resp = supabase.table("message_archives").select("*").eq("chat_id", chat_id).execute()
+    return resp.data[0] if resp.data else None
+
+
+def read_archived_messages(supabase, chat_id: str) -> List[dict]:
+    """Archived messages of a chat without touching the LRU (bulk readers such as the export)"""
+    archive = _read_archive(supabase, chat_id)
+    return decompress_messages(_from_bytea(archive["payload"])) if archive else []
+
+
+def load_archived_messages(supabase, chat_id: str, archived_at: str) -> List[dict]:
+    """
+    Archived messages of a chat, oldest first. Decompressed lazily on first read and
+    kept in a small per-worker LRU keyed by (chat_id, archived_at), so re-archiving
+    never serves stale rows.
+    """
+    key = (chat_id, archived_at)
+    with _cache_lock:
+        rows = _cache.get(key)
+        if rows is not None:
+            _cache.move_to_end(key)
+            return rows
+    with span("archive.load", {"chat.id": chat_id}) as sp:
+        rows = read_archived_messages(supabase, chat_id)
+        sp.set_attribute("archive.messages", len(rows))
+    with _cache_lock:
+        _cache[key] = rows
+        while len(_cache) > settings.ARCHIVE_CACHE_CHATS:
+            _cache.popitem(last=False)
+    return rows
+
+
+def _forget(chat_id: str) -> None:
+    with _cache_lock:
+        for key in [k for k in _cache if k[0] == chat_id]:
+            del _cache[key]
+
+
+def merge_messages(archived: List[dict], hot: List[dict]) -> List[dict]:
+    """Archive + hot rows by created_at; a row present in both (interrupted job) counts once"""
+    seen = {m["id"] for m in hot}
+    return sorted([m for m in archived if m["id"] not in seen] + hot, key=lambda m: (m["created_at"], m["id"]))
+
+
+def archive_chat(supabase, chat: dict) -> dict:
+    """
+    Move one chat's hot messages into its archive blob. The blob is written before
+    any row is deleted and only the rows that were read are deleted, so a crash or a
+    message posted mid-archive loses nothing. Returns {"messages", "raw_bytes", "stored_bytes"}.
+    """
+    chat_id = chat["id"]
+    hot = fetch_hot_messages(supabase, chat_id)
+    existing = _read_archive(supabase, chat_id)
+    rows = merge_messages(decompress_messages(_from_bytea(existing["payload"])), hot) if existing else hot
+    if not rows:
+        # Nothing to move, but mark the chat so the job does not pick it up on every run;
+        # readers and rehydrate_chat treat a missing archive row as an empty archive
+        supabase.table("chats").update({"archived_at": datetime.utcnow().isoformat()}).eq("id", chat_id).execute()
+        return {"messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+    raw = orjson.dumps(rows)
+    blob = compress_messages(raw)
+    supabase.table("message_archives").upsert({
+        "chat_id": chat_id,
+        "user_id": chat.get("user_id"),
+        "message_count": len(rows),
+        "first_message_at": rows[0]["created_at"],
+        "last_message_at": rows[-1]["created_at"],
+        "codec": CODEC,
+        "raw_bytes": len(raw),
+        "payload": _to_bytea(blob),
+    }, on_conflict="chat_id").execute()
+    ids = [m["id"] for m in hot]
+    for start in range(0, len(ids), 200):  # keep the id list well under URL limits
+        supabase.table("messages").delete().in_("id", ids[start:start + 200]).execute()
+    # The message trigger ignores rehydrated rows, so the chat summary is written from the full history here
+    supabase.table("chats").update({
+        "archived_at": datetime.utcnow().isoformat(),
+        "message_count": len(rows),
+        "last_message_preview": rows[-1]["content"][:PREVIEW_CHARS],
+        "last_sender": rows[-1]["sender"],
+    }).eq("id", chat_id).execute()
+    _forget(chat_id)
+    return {"messages": len(hot), "raw_bytes": len(raw), "stored_bytes": len(blob)}
+
+
+def rehydrate_chat(supabase, chat_id: str) -> int:
+    """
+    Move an archived chat back to the hot table (called before a chat gets new
+    messages). Idempotent: rows are upserted by id, the archive goes last.
+    """
+    with span("archive.rehydrate", {"chat.id": chat_id}) as sp:
+        archive = _read_archive(supabase, chat_id)
+        rows = decompress_messages(_from_bytea(archive["payload"])) if archive else []
+        for start in range(0, len(rows), 500):
+            supabase.table("messages").upsert(rows[start:start + 500], on_conflict="id").execute()
+        supabase.table("chats").update({"archived_at": None}).eq("id", chat_id).execute()
+        if archive:
+            supabase.table("message_archives").delete().eq("chat_id", chat_id).execute()
+        _forget(chat_id)
+        sp.set_attribute("archive.messages", len(rows))
+        return len(rows)
@@ -0,0 +1,273 @@
+# Free-text onboarding answer parsing, one precompiled parser per profile field
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.profile_scoring import RELATED_FIELDS
+
+_NUMBER = re.compile(r"(\d+(?:[.,]\d+)?)")
+_RANGE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:-|to|–)\s*(\d+(?:\.\d+)?)")
+_YEAR = re.compile(r"\b(19\d{2}|20\d{2})\b")
+_NONE = re.compile(r"^\s*(?:none|no|nope|nothing|n/?a|not applicable|-)\s*\.?\s*$", re.I)
+_LIST_SPLIT = re.compile(r"\s*(?:,|;|\n|\band\b|&)\s*", re.I)
+
+_FEET_INCHES = re.compile(r"(\d)\s*(?:ft|feet|foot|')\s*(?:(\d{1,2}(?:\.\d+)?)\s*(?:in|inches|\"|'')?)?", re.I)
+_METERS = re.compile(r"(\d(?:[.,]\d+)?)\s*m\b", re.I)
+_INCHES = re.compile(r"(\d+(?:\.\d+)?)\s*(?:in|inches|\")", re.I)
+_POUNDS = re.compile(r"(\d+(?:\.\d+)?)\s*(?:lbs?|pounds?)\b", re.I)
+_STONE = re.compile(r"(\d+)\s*(?:st|stone)\b(?:\s*(\d+)\s*(?:lbs?|pounds?)?)?", re.I)
+_PER_WEEK = re.compile(r"(\d+)\s*(?:x|times?|days?|sessions?)?\s*(?:a|per|/|each)?\s*week", re.I)
+_DOSE = re.compile(r"(\d+(?:\.\d+)?\s*(?:mg|mcg|µg|g|ml|iu|units?))\b", re.I)
+_RELATION = re.compile(
+    r"\b(mother|father|mom|dad|sister|brother|grandmother|grandfather|grandma|grandpa|aunt|uncle|son|daughter|parent|sibling)s?\b",
+    re.I,
+)
+_LAB_VALUE = re.compile(r"^(.*?)\s*[:=]?\s*(\d+(?:[.,]\d+)?\s*[%a-zA-Z/µ]*)$")
+
+
+def _text(raw: Any) -> str:
+    return str(raw if raw is not None else "").strip()
+
+
+def _first_number(text: str) -> Optional[float]:
+    rng = _RANGE.search(text)
+    if rng:
+        return (float(rng.group(1)) + float(rng.group(2))) / 2
+    m = _NUMBER.search(text)
+    return float(m.group(1).replace(",", ".")) if m else None
+
+
+def _bounded(value: Optional[float], low: float, high: float, digits: int = 1) -> Optional[float]:
+    if value is None or not low <= value <= high:
+        return None
+    return round(value, digits)
+
+
+def _choice(rules: List[Tuple[str, str]], keep_text: bool = True) -> Callable[[Any], Any]:
+    """First matching pattern wins; unmatched text is kept as typed (trimmed) when keep_text"""
+    compiled = [(re.compile(pattern, re.I), value) for pattern, value in rules]
+
+    def parse(raw: Any) -> Optional[str]:
+        text = _text(raw)
+        if not text:
+            return None
+        for pattern, value in compiled:
+            if pattern.search(text):
+                return value
+        return text[:100] if keep_text else None
+    return parse
+
+
+# --- Scalar columns on user_medical_profiles ---
+
+def parse_age(raw: Any) -> Optional[int]:
+    m = _NUMBER.search(_text(raw))
+    if not m:
+        return None
+    age = int(float(m.group(1).replace(",", ".")))
+    return age if 0 <= age <= 130 else None
+
+
+parse_biological_sex = _choice([
+    (r"\b(?:female|woman|girl)\b|^\s*f\s*$", "female"),
+    (r"\b(?:male|man|boy)\b|^\s*m\s*$", "male"),
+    (r"\b(?:other|intersex|non-?binary|prefer not)\b", "other"),
+], keep_text=False)
+
+
+def parse_height_cm(raw: Any) -> Optional[float]:
+    text = _text(raw)
+    m = _FEET_INCHES.search(text)
+    if m:
+        return _bounded(int(m.group(1)) * 30.48 + float(m.group(2) or 0) * 2.54, 30, 272)
+    m = _METERS.search(text)
+    if m:
+        return _bounded(float(m.group(1).replace(",", ".")) * 100, 30, 272)
+    m = _INCHES.search(text)
+    if m:
+        return _bounded(float(m.group(1)) * 2.54, 30, 272)
+    value = _first_number(text)
+    if value is not None and value < 3:  # bare "1.75" means meters
+        value *= 100
+    return _bounded(value, 30, 272)
+
+
+def parse_weight_kg(raw: Any) -> Optional[float]:
+    text = _text(raw)
+    m = _STONE.search(text)
+    if m:
+        return _bounded((int(m.group(1)) * 14 + int(m.group(2) or 0)) * 0.45359237, 1, 500)
+    m = _POUNDS.search(text)
+    if m:
+        return _bounded(float(m.group(1)) * 0.45359237, 1, 500)
+    return _bounded(_first_number(text), 1, 500)
+
+
+def parse_sleep_duration(raw: Any) -> Optional[float]:
+    return _bounded(_first_number(_text(raw)), 0, 24)
+
+
+# Rules are tried in order: phrases that contain a bare negation ("not sure",
+# "no, I quit") must come before the negation rule
+parse_pregnancy_status = _choice([
+    (r"\b(?:n/?a|not applicable|male)\b", "not_applicable"),
+    (r"\b(?:unsure|maybe|don'?t know|not sure|possibly)\b", "unknown"),
+    (r"\b(?:not|no|never)\b", "not_pregnant"),
+    (r"\b(?:pregnant|yes|expecting)\b", "pregnant"),
+])
+
+parse_smoking_status = _choice([
+    (r"\b(?:former|quit|ex-?smoker|used to|stopped|no longer|anymore)\b", "former"),
+    (r"\b(?:never|non-?smoker|no|don'?t)\b", "never"),
+    (r"\b(?:current|yes|daily|smoke|smoker|cigarettes?|vape)\b", "current"),
+])
+
+parse_alcohol_consumption = _choice([
+    (r"\b(?:none|never|no|don'?t|teetotal|sober)\b", "none"),
+    (r"\b(?:heavy|daily|every day|a lot)\b", "heavy"),
+    (r"\b(?:moderate|weekly|few times a week|regularly)\b", "moderate"),
+    (r"\b(?:occasional(?:ly)?|rarely|socially|sometimes|monthly)\b", "occasional"),
+])
+
+_parse_exercise_words = _choice([
+    (r"\b(?:none|never|no|sedentary)\b", "none"),
+    (r"\b(?:daily|every day)\b", "daily"),
+    (r"\b(?:rarely|occasional(?:ly)?|sometimes)\b", "occasional"),
+])
+
+
+def parse_exercise_frequency(raw: Any) -> Optional[str]:
+    m = _PER_WEEK.search(_text(raw))
+    if m:
+        times = int(m.group(1))
+        if times == 0:
+            return "none"
+        return "1-2x/week" if times <= 2 else "3-4x/week" if times <= 4 else "5+x/week"
+    return _parse_exercise_words(raw)
+
+
+parse_diet_type = _choice([
+    (r"\bvegan\b", "vegan"),
+    (r"\bvegetarian\b", "vegetarian"),
+    (r"\bpescatarian\b", "pescatarian"),
+    (r"\b(?:keto|ketogenic)\b", "keto"),
+    (r"\bpaleo\b", "paleo"),
+    (r"\bgluten[- ]?free\b", "gluten_free"),
+    (r"\bmediterranean\b", "mediterranean"),
+    (r"\bhalal\b", "halal"),
+    (r"\bkosher\b", "kosher"),
+    (r"\b(?:omnivore|everything|normal|regular|balanced|mixed)\b", "omnivore"),
+])
+
+_parse_stress_words = _choice([
+    (r"\b(?:low|little|calm|relaxed|none)\b", "low"),
+    (r"\b(?:moderate|medium|average|some)\b", "moderate"),
+    (r"\b(?:high|very|stressed|a lot|severe)\b", "high"),
+])
+
+
+def parse_stress_level(raw: Any) -> Optional[str]:
+    value = _first_number(_text(raw))
+    if value is not None and 0 <= value <= 10:
+        return "low" if value <= 3 else "moderate" if value <= 6 else "high"
+    return _parse_stress_words(raw)
+
+
+# --- Related tables (one row per listed item) ---
+
+def _item_rows(build_row: Callable[[str], dict]) -> Callable[[Any], Optional[List[dict]]]:
+    """Split a free-text list into rows; structured rows (dicts) pass through"""
+    def parse(raw: Any) -> Optional[List[dict]]:
+        if raw is None or not _text(raw):
+            return None
+        items = raw if isinstance(raw, list) else [raw]
+        rows = []
+        for item in items:
+            if isinstance(item, dict):
+                rows.append(item)
+                continue
+            text = _text(item)
+            if not text or _NONE.match(text):
+                continue
+            rows.extend(build_row(part) for part in _LIST_SPLIT.split(text) if part and not _NONE.match(part))
+        return rows
+    return parse
+
+
+def _strip_year(text: str) -> Tuple[str, Optional[int]]:
+    m = _YEAR.search(text)
+    if not m:
+        return text.strip(" .()"), None
+    return (text[:m.start()] + text[m.end():]).replace("()", "").strip(" .,-()"), int(m.group(1))
+
+
+def _condition_row(text: str) -> dict:
+    name, year = _strip_year(text)
+    row = {"name": name}
+    if year:
+        row["year_diagnosed"] = year
+    return row
+
+
+def _medication_row(text: str) -> dict:
+    m = _DOSE.search(text)
+    if not m:
+        return {"name": text.strip(" .")}
+    return {"name": (text[:m.start()] + text[m.end():]).strip(" .,-"), "dose": m.group(1)}
+
+
+def _surgery_row(text: str) -> dict:
+    surgery, year = _strip_year(text)
+    row = {"surgery": surgery}
+    if year:
+        row["year"] = year
+    return row
+
+
+def _family_row(text: str) -> dict:
+    m = _RELATION.search(text)
+    if not m:
+        return {"disease": text.strip(" .")}
+    disease = re.sub(r"\b(?:my|in|of|from|\(|\))\b", " ", text[:m.start()] + text[m.end():])
+    return {"disease": " ".join(disease.split()).strip(" .,-()"), "relation": m.group(1).lower()}
+
+
+def _lab_row(text: str) -> dict:
+    m = _LAB_VALUE.match(text.strip(" ."))
+    if not m or not m.group(1):
+        return {"name": text.strip(" .")}
+    return {"name": m.group(1).strip(), "value": m.group(2).strip()}
+
+
+FIELD_PARSERS: Dict[str, Callable[[Any], Any]] = {
+    "age": parse_age,
+    "biological_sex": parse_biological_sex,
+    "height_cm": parse_height_cm,
+    "weight_kg": parse_weight_kg,
+    "pregnancy_status": parse_pregnancy_status,
+    "smoking_status": parse_smoking_status,
+    "alcohol_consumption": parse_alcohol_consumption,
+    "exercise_frequency": parse_exercise_frequency,
+    "sleep_duration": parse_sleep_duration,
+    "diet_type": parse_diet_type,
+    "stress_level": parse_stress_level,
+    "chronic_conditions": _item_rows(_condition_row),
+    "medications": _item_rows(_medication_row),
+    "allergies": _item_rows(lambda text: {"allergen": text.strip(" .")}),
+    "surgical_history": _item_rows(_surgery_row),
+    "family_history": _item_rows(_family_row),
+    "lab_values": _item_rows(_lab_row),
+}
+
+
+def parse_answer(field: str, raw: Any) -> Any:
+    """
+    Parsed value for one field, or None when the answer could not be understood.
+    Related fields parse to a list of rows for the table of the same name
+    (an empty list means the user answered "none").
+    """
+    parser = FIELD_PARSERS.get(field)
+    if parser is None:
+        return None
+    if not isinstance(raw, (str, list, dict)) and field not in RELATED_FIELDS:
+        raw = str(raw) if raw is not None else None  # numbers from structured clients
+    return parser(raw)
@@ -0,0 +1,136 @@
+# Patient context digest: a compact, precomputed summary of a user's medical data for LLM prompts
+from datetime import datetime
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.profile_store import PROFILE_FIELDS
+from app.core.tracing import span
+
+MAX_ITEMS = 10  # per history table
+MAX_LABS = 8  # most recent lab values
+MAX_DOCUMENTS = 5  # most recent document titles
+
+# Profile columns whose name carries the unit: label -> suffix
+_UNITS = {"height_cm": ("height", "cm"), "weight_kg": ("weight", "kg"), "sleep_duration": ("sleep", "h")}
+
+_RELATED_COLUMNS = {
+    "chronic_conditions": "name, year_diagnosed, controlled_status",
+    "medications": "name, dose, frequency, condition",
+    "allergies": "allergen, reaction_type, severity",
+    "surgical_history": "surgery, year",
+    "family_history": "disease, relation",
+    "lab_values": "name, value, date",
+}
+
+
+def _join(parts) -> str:
+    return ", ".join(str(p) for p in parts if p not in (None, ""))
+
+
+def _item(main, *details) -> str:
+    extra = _join(details)
+    return f"{main} ({extra})" if extra else str(main)
+
+
+def _section(label: str, items: List[str], limit: int) -> Optional[str]:
+    items = [i for i in items if i]
+    if not items:
+        return None
+    # Sources are fetched with limit + 1 rows, so a longer list only means "there is more"
+    more = "; ..." if len(items) > limit else ""
+    return f"{label}: " + "; ".join(items[:limit]) + more
+
+
+def build_digest(profile: Optional[dict], documents: List[dict]) -> str:
+    """
+    Render a medical profile (with related rows embedded, see fetch_digest_source)
+    and recent documents as a few short lines. Empty string when there is nothing.
+    """
+    lines = []
+    if profile:
+        facts = []
+        for field in PROFILE_FIELDS:
+            value = profile.get(field)
+            if value in (None, ""):
+                continue
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            label, unit = _UNITS.get(field, (field.replace("_", " "), ""))
+            facts.append(f"{label} {value} {unit}".rstrip())
+        if facts:
+            lines.append("Profile: " + "; ".join(facts))
+        related = {table: profile.get(table) or [] for table in _RELATED_COLUMNS}
+        lines.append(_section("Conditions", [
+            _item(r["name"], r.get("year_diagnosed") and f"since {r['year_diagnosed']}", r.get("controlled_status"))
+            for r in related["chronic_conditions"] if r.get("name")
+        ], MAX_ITEMS))
+        lines.append(_section("Medications", [
+            _item(" ".join(str(p) for p in (r["name"], r.get("dose")) if p), r.get("frequency"), r.get("condition") and f"for {r['condition']}")
+            for r in related["medications"] if r.get("name")
+        ], MAX_ITEMS))
+        lines.append(_section("Allergies", [
+            _item(r["allergen"], r.get("reaction_type"), r.get("severity"))
+            for r in related["allergies"] if r.get("allergen")
+        ], MAX_ITEMS))
+        lines.append(_section("Surgeries", [
+            _item(r["surgery"], r.get("year")) for r in related["surgical_history"] if r.get("surgery")
+        ], MAX_ITEMS))
+        lines.append(_section("Family history", [
+            _item(r["disease"], r.get("relation")) for r in related["family_history"] if r.get("disease")
+        ], MAX_ITEMS))
+        lines.append(_section("Recent labs", [
+            _item(" ".join(str(p) for p in (r["name"], r.get("value")) if p), r.get("date"))
+            for r in related["lab_values"] if r.get("name")
+        ], MAX_LABS))
+    lines.append(_section("Documents on file", [
+        _item(d.get("title") or "Document", (d.get("created_at") or "")[:10]) for d in documents
+    ], MAX_DOCUMENTS))
+    digest = "\n".join(line for line in lines if line)
+    if len(digest) > settings.PATIENT_DIGEST_MAX_CHARS:
+        digest = digest[:settings.PATIENT_DIGEST_MAX_CHARS - 3].rstrip() + "..."
+    return digest
+
+
+def fetch_digest_source(supabase, user_id: str) -> tuple:
+    """(medical profile with related rows embedded, recent documents): two round trips"""
+    query = supabase.table("user_medical_profiles").select(
+        ", ".join(["id"] + PROFILE_FIELDS + [f"{table}({columns})" for table, columns in _RELATED_COLUMNS.items()])
+    ).eq("user_id", user_id)
+    for table in _RELATED_COLUMNS:
+        if table == "lab_values":
+            query = query.order("date", desc=True, nullsfirst=False, foreign_table=table).limit(MAX_LABS + 1, foreign_table=table)
+        else:
+            query = query.order("id", foreign_table=table).limit(MAX_ITEMS + 1, foreign_table=table)
+    profiles = query.execute().data
+    documents = (
+        supabase.table("medical_documents").select("title, created_at").eq("user_id", user_id)
+        .order("created_at", desc=True).limit(MAX_DOCUMENTS + 1).execute().data or []
+    )
+    return (profiles[0] if profiles else None), documents
+
+
+def refresh_context_digest(supabase, user_id: str, version: int = 0) -> str:
+    """
+    Rebuild profiles.context_digest from the current data. `version` is the row's
+    context_digest_version when it was read; if a write bumped it meanwhile (see the
+    digest migration's triggers) the result is returned but not stored, so the next
+    read rebuilds it again.
+    """
+    with span("patient_context.refresh") as sp:
+        profile, documents = fetch_digest_source(supabase, user_id)
+        digest = build_digest(profile, documents)
+        supabase.table("profiles").update({
+            "context_digest": digest,
+            "context_digest_at": datetime.utcnow().isoformat(),
+            "context_digest_built_version": version,
+        }).eq("id", user_id).eq("context_digest_version", version).execute()
+        sp.set_attribute("digest.chars", len(digest))
+        return digest
+
+
+def context_digest(supabase, user_row: dict) -> str:
+    """The digest for an already-loaded profiles row; rebuilt (sync DB I/O) only when missing or stale"""
+    version = user_row.get("context_digest_version") or 0
+    if user_row.get("context_digest_built_version") != version:
+        user_row["context_digest"] = refresh_context_digest(supabase, user_row["id"], version)
+    return user_row.get("context_digest") or ""
@@ -1,4 +1,5 @@
 # Profile completion scoring logic for medical onboarding
+import numpy as np
 
 
 CRITICAL_FIELDS = [
@@ -17,6 +18,11 @@ WEIGHTS = {
     'enhancement': 0.2
 }
 
+# Fields stored as rows in a related table of the same name (keyed by profile_id)
+RELATED_FIELDS = [
+    'chronic_conditions', 'medications', 'allergies', 'surgical_history', 'family_history', 'lab_values'
+]
+
 
 def calculate_profile_completion(profile: dict) -> float:
     # Critical fields
@@ -57,3 +63,47 @@ def calculate_profile_completion(profile: dict) -> float:
 
     total_score = critical_score + important_score + enhancement_score
     return round(total_score, 2)
+
+
+def _build_score_table() -> np.ndarray:
+    # Every possible (critical, important, enhancement) filled-count combination,
+    # scored with the exact arithmetic of calculate_profile_completion
+    table = np.zeros((len(CRITICAL_FIELDS) + 1, len(IMPORTANT_FIELDS) + 1, len(ENHANCEMENT_FIELDS) + 1))
+    for c in range(len(CRITICAL_FIELDS) + 1):
+        for i in range(len(IMPORTANT_FIELDS) + 1):
+            for e in range(len(ENHANCEMENT_FIELDS) + 1):
+                critical_score = (c / len(CRITICAL_FIELDS)) * WEIGHTS['critical'] * 100
+                important_score = (i / len(IMPORTANT_FIELDS)) * WEIGHTS['important'] * 100
+                enhancement_score = (e / len(ENHANCEMENT_FIELDS)) * WEIGHTS['enhancement'] * 100
+                table[c, i, e] = round(critical_score + important_score + enhancement_score, 2)
+    return table
+
+
+def _filled_counts(profiles: list, fields: list, related: dict) -> np.ndarray:
+    counts = np.zeros(len(profiles), dtype=np.int64)
+    for field in fields:
+        if field in related:
+            counts += np.asarray(related[field], dtype=bool)
+            continue
+        # Same emptiness rule as calculate_profile_completion; embedded related lists
+        # (fetch_profile_with_related) are read as-is, so [] counts as unanswered
+        counts += np.fromiter(
+            (p.get(field) not in (None, '', []) for p in profiles), dtype=bool, count=len(profiles)
+        )
+    return counts
+
+
+def calculate_profile_completion_batch(profiles: list, related: dict = None) -> np.ndarray:
+    """
+    Score many profiles at once. `related` maps a RELATED_FIELDS name to a boolean
+    array (aligned with `profiles`) telling whether the profile has rows in that table.
+    Returns the same scores calculate_profile_completion gives for each profile with
+    its related fields filled in.
+    """
+    if not profiles:
+        return np.zeros(0)
+    related = related or {}
+    critical = _filled_counts(profiles, CRITICAL_FIELDS, related)
+    important = _filled_counts(profiles, IMPORTANT_FIELDS, related)
+    enhancement = _filled_counts(profiles, ENHANCEMENT_FIELDS, related)
+    return _build_score_table()[critical, important, enhancement]
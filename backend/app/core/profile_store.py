@@ -0,0 +1,103 @@
+# Medical profile reads/writes shared by onboarding and profile editing
+from typing import Optional
+from app.core.profile_scoring import (
+    calculate_profile_completion, CRITICAL_FIELDS, IMPORTANT_FIELDS, ENHANCEMENT_FIELDS, RELATED_FIELDS
+)
+
+PROFILE_FIELDS = [f for f in CRITICAL_FIELDS + IMPORTANT_FIELDS + ENHANCEMENT_FIELDS if f not in RELATED_FIELDS]
+
+# Embed at most one id per related table: enough to know whether the field is filled
+_RELATED_EMBED = ", ".join(f"{table}(id)" for table in RELATED_FIELDS)
+
+
+def fetch_profile_with_related(supabase, user_id: str = None, profile_id=None) -> Optional[dict]:
+    """
+    Fetch a medical profile plus related-table presence in one round trip.
+    Related fields come back as lists (empty when the profile has no rows there).
+    """
+    query = supabase.table("user_medical_profiles").select(f"*, {_RELATED_EMBED}")
+    query = query.eq("id", profile_id) if profile_id is not None else query.eq("user_id", user_id)
+    for table in RELATED_FIELDS:
+        query = query.limit(1, foreign_table=table)
+    resp = query.execute()
+    return resp.data[0] if resp.data else None
+
+
+def strip_related(profile: Optional[dict]) -> Optional[dict]:
+    """Drop the related presence lists before returning a profile to the client"""
+    if profile is None:
+        return None
+    return {k: v for k, v in profile.items() if k not in RELATED_FIELDS}
+
+
+def refresh_completion_score(supabase, user_id: str = None, profile_id=None) -> Optional[dict]:
+    """
+    Recompute profile_completion_score (including related tables) and persist it
+    if it changed. Call after any write to the profile or its related tables.
+    Returns the profile with related lists (see strip_related).
+    """
+    profile = fetch_profile_with_related(supabase, user_id=user_id, profile_id=profile_id)
+    if not profile:
+        return None
+    score = calculate_profile_completion(profile)
+    if profile.get("profile_completion_score") != score:
+        supabase.table("user_medical_profiles").update({"profile_completion_score": score}).eq("id", profile["id"]).execute()
+        profile["profile_completion_score"] = score
+    return profile
+
+
+def write_related_records(supabase, user_id: str, upserts: dict, deletes: dict) -> dict:
+    """
+    Insert/update/delete rows across the related tables in one transaction
+    (bulk_upsert_related RPC, see migrations/2026-10-02-bulk-related-records.sql).
+    Raises postgrest APIError; code P0002 means the profile does not exist.
+    """
+    resp = supabase.rpc("bulk_upsert_related", {
+        "p_user_id": user_id,
+        "p_upserts": {k: v for k, v in upserts.items() if v},
+        "p_deletes": {k: v for k, v in deletes.items() if v},
+    }).execute()
+    return resp.data or {}
+
+
+def bootstrap_onboarding(supabase, user_id: str) -> tuple:
+    """
+    Create or return the medical profile and active onboarding session in one
+    idempotent RPC (see migrations/2026-10-05-onboarding-bootstrap.sql).
+    Returns (profile with related lists, session). Raises postgrest APIError.
+    """
+    resp = supabase.rpc("bootstrap_onboarding", {"p_user_id": user_id}).execute()
+    data = resp.data or {}
+    return data.get("profile"), data.get("session")
+
+
+def stored_completion_score(profile: Optional[dict]) -> float:
+    """Completion score as persisted on the profile row"""
+    if not profile:
+        return 0.0
+    return float(profile.get("profile_completion_score") or 0.0)
+
+
+def fetch_full_profile(supabase, user_id: str, fields: list = None) -> Optional[dict]:
+    """
+    Profile, related records and stored completion score in one round trip
+    (PostgREST resource embedding). `fields` limits both the profile columns and
+    the related tables returned; None returns everything.
+    """
+    wanted = fields or PROFILE_FIELDS + RELATED_FIELDS
+    columns = ["id", "user_id", "profile_completion_score"] + [f for f in wanted if f in PROFILE_FIELDS]
+    tables = [f for f in wanted if f in RELATED_FIELDS]
+    query = supabase.table("user_medical_profiles").select(
+        ", ".join(columns + [f"{table}(*)" for table in tables])
+    ).eq("user_id", user_id)
+    for table in tables:
+        query = query.order("id", foreign_table=table)
+    resp = query.execute()
+    if not resp.data:
+        return None
+    row = resp.data[0]
+    return {
+        "profile": {k: v for k, v in row.items() if k not in RELATED_FIELDS},
+        "records": {table: row.get(table) or [] for table in tables},
+        "completion_score": stored_completion_score(row),
+    }
@@ -0,0 +1,239 @@
+# Streaming medical-record export: a ZIP of NDJSON tables plus document files, produced page by page
+import base64
+import binascii
+import json
+import os
+import zipfile
+from datetime import datetime
+from typing import Iterator, Optional
+
+import httpx
+import orjson
+
+from app.core.config import settings
+from app.core.message_archive import read_archived_messages
+from app.core.profile_scoring import RELATED_FIELDS
+
+DOCUMENTS_BUCKET = "medical_documents"
+
+PROFILE_COLUMNS = "id, email, name, age, gender, phone, emergency_contact, created_at, updated_at"
+
+# Export order; a resume cursor points into this list
+SECTIONS = ["profile", "medical_profile", "onboarding_sessions"] + RELATED_FIELDS + [
+    "chats", "messages", "medical_documents", "files",
+]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(part: int, section: int, key) -> str:
+    raw = json.dumps({"part": part, "section": section, "key": key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Inverse of encode_cursor; raises InvalidCursor. Positions only: every query is still scoped to the user."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not (isinstance(state["part"], int) and 0 <= state["section"] < len(SECTIONS)):
+            raise ValueError
+        return state
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise InvalidCursor("Invalid export cursor")
+
+
+class _Sink:
+    """Write-only stream for ZipFile (non-seekable, so entries use data descriptors); drained after every write batch"""
+
+    def __init__(self):
+        self._chunks = []
+        self.bytes = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self.bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _keyset(query_factory, after, page_size: int) -> Iterator[list]:
+    """Pages of rows ordered by id, strictly after `after`"""
+    while True:
+        query = query_factory().order("id").limit(page_size)
+        if after is not None:
+            query = query.gt("id", after)
+        rows = query.execute().data or []
+        if rows:
+            yield rows
+            after = rows[-1]["id"]
+        if len(rows) < page_size:
+            return
+
+
+def _medical_profile_id(supabase, user_id: str):
+    rows = supabase.table("user_medical_profiles").select("id").eq("user_id", user_id).limit(1).execute().data
+    return rows[0]["id"] if rows else None
+
+
+def _section_pages(supabase, user_id: str, section: str, after, page_size: int) -> Iterator[list]:
+    """Row pages of one NDJSON section (everything except profile, messages and files)"""
+    if section in RELATED_FIELDS:
+        profile_id = _medical_profile_id(supabase, user_id)
+        if profile_id is None:
+            return
+        factory = lambda: supabase.table(section).select("*").eq("profile_id", profile_id)  # noqa: E731
+    elif section == "medical_profile":
+        factory = lambda: supabase.table("user_medical_profiles").select("*").eq("user_id", user_id)  # noqa: E731
+    else:
+        # Large text columns are fine: one page is at most page_size rows
+        factory = lambda: supabase.table(section).select("*").eq("user_id", user_id)  # noqa: E731
+    yield from _keyset(factory, after, page_size)
+
+
+def _chat_messages(supabase, chat: dict, page_size: int) -> Iterator[list]:
+    """Archived messages first (see message_archive), then hot rows by id, each message once"""
+    archived_ids = set()
+    if chat.get("archived_at"):
+        archived = read_archived_messages(supabase, chat["id"])
+        archived_ids = {m["id"] for m in archived}
+        for start in range(0, len(archived), page_size):
+            yield archived[start:start + page_size]
+    for rows in _keyset(lambda: supabase.table("messages").select("*").eq("chat_id", chat["id"]), None, page_size):
+        yield [m for m in rows if m["id"] not in archived_ids]
+
+
+def _storage_path(file_url: str) -> str:
+    return file_url.split(f"/{DOCUMENTS_BUCKET}/")[-1]
+
+
+class _ExportPart:
+    """
+    One ZIP part being written. Each write_* generator yields ZIP bytes as they are
+    produced and returns None when its section is complete, or the key to resume
+    after once the part's byte budget is used up.
+    """
+
+    def __init__(self, supabase, user_id: str):
+        self.supabase = supabase
+        self.user_id = user_id
+        self.sink = _Sink()
+        self.zip = zipfile.ZipFile(self.sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6)
+        self.budget = settings.EXPORT_PART_MAX_MB * 1024 * 1024
+        self.page_size = settings.EXPORT_PAGE_SIZE
+        self.counts = {}
+        self.missing_files = []
+
+    @property
+    def full(self) -> bool:
+        return self.sink.bytes >= self.budget
+
+    def _count(self, section: str, n: int = 1) -> None:
+        self.counts[section] = self.counts.get(section, 0) + n
+
+    def write_profile(self, after):
+        rows = self.supabase.table("profiles").select(PROFILE_COLUMNS).eq("id", self.user_id).execute().data
+        self.zip.writestr("profile.json", orjson.dumps(rows[0] if rows else None, option=orjson.OPT_INDENT_2))
+        yield self.sink.drain()
+
+    def write_rows(self, section: str, after):
+        with self.zip.open(f"{section}.ndjson", "w", force_zip64=True) as entry:
+            for rows in _section_pages(self.supabase, self.user_id, section, after, self.page_size):
+                entry.write(b"".join(orjson.dumps(row) + b"\n" for row in rows))
+                self._count(section, len(rows))
+                yield self.sink.drain()
+                if self.full:
+                    return rows[-1]["id"]
+
+    def write_messages(self, after):
+        # Resumes at chat boundaries; one chat's messages always stay in one part
+        chats = lambda: self.supabase.table("chats").select("id, archived_at").eq("user_id", self.user_id)  # noqa: E731
+        with self.zip.open("messages.ndjson", "w", force_zip64=True) as entry:
+            for page in _keyset(chats, after, self.page_size):
+                for chat in page:
+                    for rows in _chat_messages(self.supabase, chat, self.page_size):
+                        entry.write(b"".join(orjson.dumps(row) + b"\n" for row in rows))
+                        self._count("messages", len(rows))
+                        yield self.sink.drain()
+                    if self.full:
+                        return chat["id"]
+
+    def write_files(self, after):
+        headers = {
+            "Authorization": f"Bearer {settings.SUPABASE_SERVICE_ROLE_KEY}",
+            "apikey": settings.SUPABASE_SERVICE_ROLE_KEY,
+        }
+        docs = lambda: self.supabase.table("medical_documents").select("id, file_url").eq("user_id", self.user_id)  # noqa: E731
+        for page in _keyset(docs, after, self.page_size):
+            for doc in page:
+                if not doc.get("file_url"):
+                    continue
+                path = _storage_path(doc["file_url"])
+                url = f"{settings.SUPABASE_URL}/storage/v1/object/authenticated/{DOCUMENTS_BUCKET}/{path}"
+                with httpx.stream("GET", url, headers=headers, timeout=60) as resp:
+                    if resp.status_code in (400, 404):
+                        self.missing_files.append(doc["id"])
+                        continue
+                    resp.raise_for_status()
+                    name = f"files/{doc['id']}/{os.path.basename(path) or 'document'}"
+                    with self.zip.open(name, "w", force_zip64=True) as entry:
+                        for chunk in resp.iter_bytes(64 * 1024):
+                            entry.write(chunk)
+                            yield self.sink.drain()
+                self._count("files")
+                yield self.sink.drain()
+                if self.full:
+                    return doc["id"]
+
+    def write_section(self, section: str, after):
+        if section == "profile":
+            return (yield from self.write_profile(after))
+        if section == "messages":
+            return (yield from self.write_messages(after))
+        if section == "files":
+            return (yield from self.write_files(after))
+        return (yield from self.write_rows(section, after))
+
+
+def stream_export(supabase, user_id: str, cursor: Optional[str] = None) -> Iterator[bytes]:
+    """
+    Yield one export part as ZIP bytes. Tables are read in keyset pages and files
+    are piped from storage in 64 KB chunks, so memory stays at one page / one chunk
+    whatever the account size. Once EXPORT_PART_MAX_MB of ZIP output has been produced
+    the part ends at the next page (or chat, or file) boundary; its manifest.json then
+    carries `next_cursor`, which requests the following part. Re-requesting a cursor
+    replays the same part, so an interrupted download resumes from its last completed part.
+    """
+    state = decode_cursor(cursor) if cursor else {"part": 1, "section": 0, "key": None}
+    export = _ExportPart(supabase, user_id)
+    next_cursor = None
+    for index in range(state["section"], len(SECTIONS)):
+        after = state["key"] if index == state["section"] else None
+        if export.full:
+            next_cursor = encode_cursor(state["part"] + 1, index, after)
+            break
+        resume_key = yield from export.write_section(SECTIONS[index], after)
+        yield export.sink.drain()
+        if resume_key is not None:
+            next_cursor = encode_cursor(state["part"] + 1, index, resume_key)
+            break
+
+    export.zip.writestr("manifest.json", orjson.dumps({
+        "user_id": user_id,
+        "part": state["part"],
+        "exported_at": datetime.utcnow().isoformat(),
+        "complete": next_cursor is None,
+        "next_cursor": next_cursor,
+        "counts": export.counts,
+        "missing_files": export.missing_files,
+    }, option=orjson.OPT_INDENT_2))
+    export.zip.close()
+    yield export.sink.drain()
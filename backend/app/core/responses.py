@@ -0,0 +1,19 @@
+# Fast JSON responses for large lists
+from typing import Optional, Type
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+
+def fast_json(model: Type[BaseModel], data: dict, response: Optional[Response] = None) -> ORJSONResponse:
+    """
+    Validate `data` once against `model` (pydantic-core, extra row keys ignored)
+    and serialize it with orjson. Returning this from an endpoint skips FastAPI's
+    second response_model validation and the stdlib json encoder. Headers already
+    set on the injected `response` (ETag, Cache-Control) are carried over.
+    """
+    content = model.model_validate(data).model_dump(mode="json")
+    headers = dict(response.headers) if response is not None else None
+    if headers:
+        headers.pop("content-length", None)
+    return ORJSONResponse(content, headers=headers)
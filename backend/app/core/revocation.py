@@ -0,0 +1,146 @@
+# Per-worker mirror of token_revocations so revocation checks never leave memory
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _key(value: str) -> int:
+    # 64-bit digests keep the sets compact; a collision would need ~2^32 revocations
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+def _epoch(timestamp: str) -> float:
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+class RevocationFilter:
+    """
+    Revoked token ids, token families and per-user cutoffs, each with the expiry
+    after which the entry can be forgotten. Incrementally synced from token_revocations.
+
+    Sync is keyed on revoked_at, not id: ids are handed out before commit, so a row
+    committed late can carry a lower id than rows already read. Each sync re-reads
+    TOKEN_REVOCATION_SYNC_OVERLAP_SECONDS before the newest revoked_at seen, which also
+    covers clock skew between the workers that write revoked_at; ids dedupe the overlap.
+    """
+
+    def __init__(self):
+        self._jtis = {}      # key -> expires_at
+        self._families = {}  # key -> expires_at
+        self._users = {}     # key -> (revoked_at, expires_at)
+        self._watermark: Optional[float] = None  # newest revoked_at seen
+        self._seen = {}  # id -> revoked_at, for rows inside the overlap window
+        self._lock = threading.Lock()
+        self.synced_at = 0.0
+
+    def add(self, kind: str, value: str, revoked_at: float, expires_at: float) -> None:
+        key = _key(value)
+        with self._lock:
+            if kind == "jti":
+                self._jtis[key] = expires_at
+            elif kind == "family":
+                self._families[key] = expires_at
+            elif kind == "user":
+                current = self._users.get(key)
+                if current is None or revoked_at > current[0]:
+                    self._users[key] = (revoked_at, expires_at)
+
+    def is_revoked(self, payload: dict) -> bool:
+        jti, family, user_id = payload.get("jti"), payload.get("fam"), payload.get("sub")
+        if jti and _key(jti) in self._jtis:
+            return True
+        if family and _key(family) in self._families:
+            return True
+        if user_id:
+            cutoff = self._users.get(_key(user_id))
+            if cutoff is not None and payload.get("iat", 0) <= cutoff[0]:
+                return True
+        return False
+
+    def _prune(self, now: float) -> None:
+        with self._lock:
+            for table in (self._jtis, self._families):
+                for key in [k for k, exp in table.items() if exp < now]:
+                    del table[key]
+            for key in [k for k, (_, exp) in self._users.items() if exp < now]:
+                del self._users[key]
+
+    def sync(self, supabase, page_size: int = 1000) -> int:
+        """Pull revocations not seen yet; returns how many were added"""
+        added = 0
+        since = None if self._watermark is None else self._watermark - settings.TOKEN_REVOCATION_SYNC_OVERLAP_SECONDS
+        offset = 0
+        while True:
+            query = supabase.table("token_revocations").select("*")
+            if since is None:
+                query = query.gt("expires_at", _iso(time.time()))  # cold start: only entries still in force
+            else:
+                query = query.gte("revoked_at", _iso(since))
+            rows = query.order("revoked_at").order("id").range(offset, offset + page_size - 1).execute().data or []
+            for row in rows:
+                if row["id"] in self._seen:
+                    continue
+                revoked_at = _epoch(row["revoked_at"])
+                self.add(row["kind"], row["value"], revoked_at, _epoch(row["expires_at"]))
+                self._seen[row["id"]] = revoked_at
+                self._watermark = revoked_at if self._watermark is None else max(self._watermark, revoked_at)
+                added += 1
+            if len(rows) < page_size:
+                break
+            offset += page_size
+        if self._watermark is not None:
+            cutoff = self._watermark - settings.TOKEN_REVOCATION_SYNC_OVERLAP_SECONDS
+            self._seen = {i: at for i, at in self._seen.items() if at >= cutoff}
+        self._prune(time.time())
+        self.synced_at = time.time()
+        return added
+
+    def __len__(self) -> int:
+        return len(self._jtis) + len(self._families) + len(self._users)
+
+
+revocations = RevocationFilter()
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def start_revocation_sync(supabase) -> None:
+    """Initial load, then a daemon thread re-syncing every TOKEN_REVOCATION_SYNC_SECONDS"""
+    global _thread
+    if _thread is not None:
+        return
+    try:
+        revocations.sync(supabase)
+    except Exception as e:
+        logger.warning(f"Initial token revocation sync failed: {e}")
+
+    def run():
+        while not _stop.wait(settings.TOKEN_REVOCATION_SYNC_SECONDS):
+            try:
+                revocations.sync(supabase)
+            except Exception as e:
+                logger.warning(f"Token revocation sync failed: {e}")
+
+    _stop.clear()
+    _thread = threading.Thread(target=run, name="revocation-sync", daemon=True)
+    _thread.start()
+
+
+def stop_revocation_sync() -> None:
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
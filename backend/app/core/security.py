@@ -1,8 +1,15 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
+import hashlib
+import threading
+import time
+import uuid
+import jwt
+from jwt import PyJWTError
 from passlib.context import CryptContext
 from app.core.config import settings
+from app.core.revocation import revocations
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -18,9 +25,17 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password[:72])
 
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    """Create JWT access token"""
+def _claims(data: dict) -> dict:
+    # jti identifies the token for revocation; float iat orders it against logout-all cutoffs
     to_encode = data.copy()
+    to_encode.setdefault("jti", str(uuid.uuid4()))
+    to_encode.setdefault("iat", time.time())
+    return to_encode
+
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
+    """Create JWT access token (pass "fam" to tie it to a refresh-token family)"""
+    to_encode = _claims(data)
     
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -33,8 +48,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 
 def create_refresh_token(data: dict) -> str:
-    """Create JWT refresh token"""
-    to_encode = data.copy()
+    """Create JWT refresh token (pass "jti" and "fam" when it is tracked in refresh_tokens)"""
+    to_encode = _claims(data)
     expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     
     to_encode.update({"exp": expire, "type": "refresh"})
@@ -42,10 +57,46 @@ def create_refresh_token(data: dict) -> str:
     return encoded_jwt
 
 
+# Verified-token LRU: hash(token) -> (payload, exp). Clients reuse one access
+# token for its whole lifetime, so repeat requests skip signature verification.
+_token_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+
+def _token_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def clear_token_cache() -> None:
+    with _token_cache_lock:
+        _token_cache.clear()
+
+
 def decode_token(token: str) -> dict:
-    """Decode and verify JWT token"""
+    """Decode and verify JWT token; revoked tokens decode to None"""
+    key = _token_key(token)
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            payload, exp = cached
+            if exp > now:
+                _token_cache.move_to_end(key)
+                return None if revocations.is_revoked(payload) else dict(payload)
+            del _token_cache[key]
+
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
-    except JWTError:
+    except PyJWTError:
+        return None
+
+    exp = payload.get("exp")
+    if settings.TOKEN_CACHE_SIZE > 0 and isinstance(exp, (int, float)):
+        with _token_cache_lock:
+            _token_cache[key] = (payload, exp)
+            _token_cache.move_to_end(key)
+            while len(_token_cache) > settings.TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    if revocations.is_revoked(payload):
         return None
+    return dict(payload)
@@ -0,0 +1,74 @@
+# Production server helpers: worker sizing and the uvicorn worker class used by gunicorn
+import os
+from typing import Optional
+
+from uvicorn.workers import UvicornWorker
+
+
+class ProductionUvicornWorker(UvicornWorker):
+    """Uvicorn worker pinned to uvloop + httptools (both ship with uvicorn[standard])"""
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            value = f.read().strip().split()[0]
+    except (OSError, IndexError):
+        return None
+    if value == "max":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def available_cpus() -> int:
+    """CPUs usable by this process, honoring affinity and cgroup quotas"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    # cgroup v2: "<quota> <period>"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        quota = _read_int("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period = _read_int("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if quota and period and quota > 0:
+            cpus = min(cpus, max(1, quota // period))
+    return max(1, cpus)
+
+
+def available_memory_mb() -> Optional[int]:
+    """Memory limit of the container (cgroup) or host, in MB"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        limit = _read_int(path)
+        # cgroup v1 reports a huge number when unlimited
+        if limit and limit < 1 << 60:
+            return limit // (1024 * 1024)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def compute_worker_count(
+    override: Optional[int] = None,
+    worker_memory_mb: int = 512,
+    max_workers: int = 8,
+) -> int:
+    """
+    Number of gunicorn workers: 2 * CPU + 1, capped by how many workers fit in memory.
+    An explicit override (WEB_CONCURRENCY) always wins.
+    """
+    if override:
+        return max(1, override)
+    by_cpu = 2 * available_cpus() + 1
+    memory_mb = available_memory_mb()
+    by_memory = memory_mb // worker_memory_mb if memory_mb and worker_memory_mb > 0 else by_cpu
+    return max(1, min(by_cpu, by_memory, max_workers))
@@ -0,0 +1,84 @@
+# Refresh-token families: issue, rotate and revoke (see migrations/2026-10-07-refresh-token-families.sql)
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.core.config import settings
+from app.core.revocation import revocations
+from app.core.security import create_access_token, create_refresh_token
+
+
+def _refresh_expiry() -> datetime:
+    return datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+
+
+def _ttl_seconds() -> float:
+    # Longest lifetime of any token a revocation can cover
+    return max(settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
+def _token_pair(user_id: str, email: str, family_id: str, jti: str) -> dict:
+    return {
+        "access_token": create_access_token(data={"sub": user_id, "email": email, "fam": family_id}),
+        "refresh_token": create_refresh_token(data={"sub": user_id, "jti": jti, "fam": family_id}),
+    }
+
+
+def issue_token_pair(supabase, user_id: str, email: str, family_id: Optional[str] = None) -> dict:
+    """Start a token family (one per login) and return its first access/refresh pair"""
+    family_id = family_id or str(uuid.uuid4())
+    jti = str(uuid.uuid4())
+    supabase.table("refresh_tokens").insert({
+        "jti": jti,
+        "family_id": family_id,
+        "user_id": user_id,
+        "expires_at": _refresh_expiry().isoformat(),
+    }).execute()
+    return _token_pair(user_id, email, family_id, jti)
+
+
+def rotate_refresh_token(supabase, payload: dict) -> dict:
+    """
+    Consume a refresh token and issue the next pair of its family in one RPC.
+    Returns the RPC result; on status "rotated" it also carries "tokens".
+    A "reused" result means the family was revoked server-side; it is applied
+    to this worker's filter right away instead of waiting for the next sync.
+    """
+    new_jti = str(uuid.uuid4())
+    result = supabase.rpc("rotate_refresh_token", {
+        "p_jti": payload["jti"],
+        "p_new_jti": new_jti,
+        "p_expires_at": _refresh_expiry().isoformat(),
+        "p_grace_seconds": settings.REFRESH_REUSE_GRACE_SECONDS,
+    }).execute().data or {"status": "unknown"}
+    if result["status"] == "rotated":
+        result["tokens"] = _token_pair(result["user_id"], result["email"], result["family_id"], new_jti)
+    elif result["status"] == "reused":
+        revocations.add("family", result["family_id"], time.time(), time.time() + _ttl_seconds())
+    return result
+
+
+def _record_revocation(supabase, kind: str, value: str) -> None:
+    now = time.time()
+    supabase.table("token_revocations").insert({
+        "kind": kind,
+        "value": value,
+        "revoked_at": datetime.utcfromtimestamp(now).isoformat() + "+00:00",
+        "expires_at": (datetime.utcnow() + timedelta(seconds=_ttl_seconds())).isoformat(),
+    }).execute()
+    revocations.add(kind, value, now, now + _ttl_seconds())
+
+
+def revoke_family(supabase, family_id: str) -> None:
+    """Log out one session: its refresh tokens and the access tokens issued with them"""
+    supabase.table("refresh_tokens").update({"revoked_at": datetime.utcnow().isoformat()}) \
+        .eq("family_id", family_id).is_("revoked_at", "null").execute()
+    _record_revocation(supabase, "family", family_id)
+
+
+def revoke_user_tokens(supabase, user_id: str) -> None:
+    """Log out everywhere: every token of the user issued up to now"""
+    supabase.table("refresh_tokens").update({"revoked_at": datetime.utcnow().isoformat()}) \
+        .eq("user_id", user_id).is_("revoked_at", "null").execute()
+    _record_revocation(supabase, "user", user_id)
@@ -0,0 +1,452 @@
+# Lightweight OpenTelemetry-style tracing: spans, W3C traceparent, head sampling, pluggable exporters
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+import httpx
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "error")
+
+    sampled = True
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = "ok"
+        self.error = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict) -> None:
+        self.attributes.update(attributes)
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.status = "error"
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if _processor is not None:
+                _processor.on_end(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NonRecordingSpan:
+    """Stand-in for spans of unsampled traces: keeps the trace id for propagation, records nothing"""
+    __slots__ = ("trace_id", "span_id")
+
+    sampled = False
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    def set_attribute(self, key, value) -> None:
+        pass
+
+    def set_attributes(self, attributes) -> None:
+        pass
+
+    def record_exception(self, exc) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+_current: ContextVar = ContextVar("current_span", default=None)
+
+
+def current_span():
+    return _current.get()
+
+
+def _new_trace_id() -> str:
+    return os.urandom(16).hex()
+
+
+def _start(name: str, parent, attributes: Optional[dict], sampled: Optional[bool] = None):
+    if parent is not None:
+        if not parent.sampled:
+            return parent  # whole trace is unsampled; children are free
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+    trace_id = _new_trace_id()
+    if sampled is None:
+        sampled = _processor is not None and random.random() < settings.TRACE_SAMPLE_RATE
+    if not sampled:
+        return _NonRecordingSpan(trace_id, os.urandom(8).hex())
+    return Span(name, trace_id, None, attributes)
+
+
+@contextmanager
+def span(name: str, attributes: Optional[dict] = None):
+    """
+    Time a block as a child of the current span (or a new, sampled-or-not root).
+    Usable from sync and async code alike; exceptions are recorded and re-raised.
+    """
+    parent = _current.get()
+    if _processor is None and parent is None:
+        yield _NOOP
+        return
+    s = _start(name, parent, attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.record_exception(e)
+        raise
+    finally:
+        _current.reset(token)
+        if s is not parent:
+            s.end()
+
+
+def start_span(name: str, attributes: Optional[dict] = None):
+    """
+    Child of the current span that is NOT made current; the caller must end() it.
+    For async generators, where a span held across yields would leak into the consumer.
+    """
+    parent = _current.get()
+    if _processor is None and parent is None:
+        return _NOOP
+    return _start(name, parent, attributes)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator form of span() for sync and async functions"""
+    def decorator(func: Callable):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_NOOP = _NonRecordingSpan("0" * 32, "0" * 16)
+
+
+# --- W3C trace context ---
+
+def parse_traceparent(value: Optional[str]):
+    """(trace_id, parent_span_id, sampled) from a traceparent header, or None"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def traceparent() -> Optional[str]:
+    s = _current.get()
+    if s is None or s is _NOOP:
+        return None
+    return f"00-{s.trace_id}-{s.span_id}-{'01' if s.sampled else '00'}"
+
+
+def inject_headers(headers: dict) -> dict:
+    """Add traceparent for the current span to outgoing request headers"""
+    value = traceparent()
+    if value:
+        headers["traceparent"] = value
+    return headers
+
+
+# --- Exporters ---
+
+class SpanExporter(ABC):
+    @abstractmethod
+    def export(self, spans: List[Span]) -> None:
+        ...
+
+    def shutdown(self) -> None:
+        pass
+
+
+class ConsoleSpanExporter(SpanExporter):
+    """One log line per span (offline debugging)"""
+
+    def export(self, spans: List[Span]) -> None:
+        for s in spans:
+            attrs = " ".join(f"{k}={v}" for k, v in s.attributes.items())
+            logger.info(f"trace={s.trace_id[:8]} span={s.name} {s.duration_ms:.1f}ms status={s.status} {attrs}".rstrip())
+
+
+class FileSpanExporter(SpanExporter):
+    """Append spans as JSON lines to a local file"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for s in spans:
+                f.write(json.dumps(s.to_dict(), default=str) + "\n")
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPHttpSpanExporter(SpanExporter):
+    """OTLP/HTTP JSON (e.g. http://otel-collector:4318/v1/traces); no SDK dependency"""
+
+    def __init__(self, endpoint: str, service_name: str):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.client = httpx.Client(timeout=10)
+
+    def export(self, spans: List[Span]) -> None:
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "app.core.tracing"},
+                "spans": [{
+                    "traceId": s.trace_id,
+                    "spanId": s.span_id,
+                    "parentSpanId": s.parent_id or "",
+                    "name": s.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns),
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                    "status": {"code": 2, "message": s.error} if s.status == "error" else {"code": 1},
+                } for s in spans],
+            }],
+        }]}
+        self.client.post(self.endpoint, json=body).raise_for_status()
+
+    def shutdown(self) -> None:
+        self.client.close()
+
+
+# name -> factory; register_exporter() adds more (e.g. a vendor SDK bridge)
+EXPORTERS: Dict[str, Callable[[], SpanExporter]] = {
+    "console": ConsoleSpanExporter,
+    "file": lambda: FileSpanExporter(settings.TRACE_FILE_PATH),
+    "otlp": lambda: OTLPHttpSpanExporter(settings.TRACE_OTLP_ENDPOINT, settings.TRACE_SERVICE_NAME),
+}
+
+
+def register_exporter(name: str, factory: Callable[[], SpanExporter]) -> None:
+    EXPORTERS[name] = factory
+
+
+class BatchSpanProcessor:
+    """Finished spans go to a bounded queue; a daemon thread exports them in batches"""
+
+    def __init__(self, exporters: List[SpanExporter], max_queue: int, batch_size: int, flush_seconds: float):
+        self.exporters = exporters
+        self.queue: "queue.Queue[Span]" = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def on_end(self, s: Span) -> None:
+        try:
+            self.queue.put_nowait(s)
+        except queue.Full:
+            self.dropped += 1  # never block a request on telemetry
+
+    def _drain(self) -> List[Span]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch: List[Span]) -> None:
+        for exporter in self.exporters:
+            try:
+                exporter.export(batch)
+            except Exception as e:
+                logger.warning(f"Span export via {type(exporter).__name__} failed: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            deadline = time.monotonic() + self.flush_seconds
+            while self.queue.qsize() < self.batch_size and time.monotonic() < deadline and not self._stop.is_set():
+                self._stop.wait(0.05)
+            batch = self._drain()
+            if batch:
+                self._export(batch)
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.flush_seconds + 1)
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._export(batch)
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+_processor: Optional[BatchSpanProcessor] = None
+
+
+def configure_tracing() -> None:
+    """Start exporting spans if TRACE_EXPORTERS names any exporter (call once per worker)"""
+    global _processor
+    names = [n.strip() for n in (settings.TRACE_EXPORTERS or "").split(",") if n.strip()]
+    if not names or _processor is not None:
+        return
+    unknown = [n for n in names if n not in EXPORTERS]
+    if unknown:
+        raise ValueError(f"Unknown trace exporters: {', '.join(unknown)}")
+    _processor = BatchSpanProcessor(
+        [EXPORTERS[n]() for n in names],
+        max_queue=settings.TRACE_MAX_QUEUE,
+        batch_size=settings.TRACE_BATCH_SIZE,
+        flush_seconds=settings.TRACE_FLUSH_SECONDS,
+    )
+
+
+def shutdown_tracing() -> None:
+    global _processor
+    if _processor is not None:
+        _processor.shutdown()
+        _processor = None
+
+
+# --- Instrumentation ---
+
+class TracingMiddleware:
+    """Root span per HTTP request; honours an incoming traceparent and echoes it back"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket") or _processor is None:
+            await self.app(scope, receive, send)
+            return
+        incoming = parse_traceparent(Headers(scope=scope).get("traceparent"))
+        if incoming:
+            trace_id, parent_id, sampled = incoming
+            root = Span("request", trace_id, parent_id) if sampled else _NonRecordingSpan(trace_id, parent_id)
+        else:
+            root = _start("request", None, None)
+        root.set_attributes({"http.method": scope.get("method", "WS"), "http.target": scope["path"]})
+        token = _current.set(root)
+
+        async def send_traced(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                MutableHeaders(raw=message["headers"]).append("traceparent", traceparent())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        except BaseException as e:
+            root.record_exception(e)
+            raise
+        finally:
+            route = scope.get("route")
+            if root.sampled:
+                root.name = f"{scope.get('method', 'WS')} {getattr(route, 'path', scope['path'])}"
+            _current.reset(token)
+            root.end()
+
+
+def instrument_httpx_client(client: httpx.Client, name: str, system: str) -> httpx.Client:
+    """Wrap a sync httpx client's send() so every call becomes a child span"""
+    if getattr(client, "_traced", False):
+        return client
+    original_send = client.send
+
+    def send(request: httpx.Request, **kwargs):
+        if _processor is None:
+            return original_send(request, **kwargs)
+        try:
+            request_bytes = len(request.content)
+        except httpx.RequestNotRead:  # streamed upload body
+            request_bytes = int(request.headers.get("content-length", 0))
+        with span(f"{name} {request.method} {request.url.path}", {
+            "peer.service": system,
+            "http.method": request.method,
+            "http.request_bytes": request_bytes,
+        }) as s:
+            inject_headers(request.headers)
+            response = original_send(request, **kwargs)
+            s.set_attribute("http.status_code", response.status_code)
+            if response.headers.get("content-length"):
+                s.set_attribute("http.response_bytes", int(response.headers["content-length"]))
+            return response
+
+    client.send = send
+    client._traced = True
+    return client
+
+
+def instrument_supabase(client) -> None:
+    """Spans for every PostgREST (table/rpc) and Storage call made through a supabase client"""
+    instrument_httpx_client(client.postgrest.session, "supabase", "postgrest")
+    instrument_httpx_client(client.storage._client, "supabase.storage", "storage")
@@ -0,0 +1,90 @@
+"""
+Move messages of idle chats into compressed cold storage (message_archives)
+Run with: python -m app.jobs.archive_messages [--idle-days 90] [--page-size 200] [--limit N] [--dry-run]
+
+Scans hot chats whose last message is older than --idle-days in keyset pages
+(idx_chats_hot_last_message), archives each one with archive_chat and prints
+throughput: chats/s, messages/s, raw vs. stored bytes and compression ratio.
+Safe to re-run or interrupt; see archive_chat for the ordering guarantees.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.core.database import get_supabase
+from app.core.message_archive import archive_chat
+
+
+def iter_idle_chats(supabase, cutoff: str, page_size: int):
+    """Yield pages of hot chats idle since before `cutoff`, ordered by id (keyset pagination)"""
+    last_id = None
+    while True:
+        query = (
+            supabase.table("chats").select("id, user_id, last_message_at")
+            .is_("archived_at", "null").lt("last_message_at", cutoff)
+            .order("id").limit(page_size)
+        )
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data or []
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]["id"]
+        if len(rows) < page_size:
+            return
+
+
+def compact(supabase, idle_days: int, page_size: int = 200, limit: int = None, dry_run: bool = False) -> dict:
+    cutoff = (datetime.utcnow() - timedelta(days=idle_days)).isoformat()
+    stats = {"chats": 0, "messages": 0, "raw_bytes": 0, "stored_bytes": 0, "errors": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    for chats in iter_idle_chats(supabase, cutoff, page_size):
+        for chat in chats:
+            if limit is not None and stats["chats"] >= limit:
+                break
+            stats["chats"] += 1
+            if dry_run:
+                continue
+            try:
+                result = archive_chat(supabase, chat)
+            except Exception as e:
+                stats["errors"] += 1
+                print(f"chat {chat['id']}: {e}")
+                continue
+            for key in ("messages", "raw_bytes", "stored_bytes"):
+                stats[key] += result[key]
+        if limit is not None and stats["chats"] >= limit:
+            break
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive messages of idle chats into compressed cold storage")
+    parser.add_argument("--idle-days", type=int, default=settings.ARCHIVE_IDLE_DAYS)
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=None, help="archive at most this many chats")
+    parser.add_argument("--dry-run", action="store_true", help="count candidate chats without archiving")
+    parser.add_argument("--json", action="store_true", help="print metrics as one JSON object")
+    args = parser.parse_args()
+
+    stats = compact(get_supabase(), args.idle_days, args.page_size, args.limit, args.dry_run)
+    seconds = stats["seconds"] or 1e-9
+    stats["chats_per_second"] = round(stats["chats"] / seconds, 1)
+    stats["messages_per_second"] = round(stats["messages"] / seconds, 1)
+    stats["compression_ratio"] = round(stats["raw_bytes"] / stats["stored_bytes"], 2) if stats["stored_bytes"] else None
+    if args.json:
+        print(json.dumps(stats))
+        return
+    verb = "Found" if args.dry_run else "Archived"
+    print(f"{verb} {stats['chats']} chats / {stats['messages']} messages in {stats['seconds']}s "
+          f"({stats['chats_per_second']} chats/s, {stats['messages_per_second']} msg/s), {stats['errors']} errors")
+    if stats["stored_bytes"]:
+        print(f"Raw {stats['raw_bytes']} bytes -> stored {stats['stored_bytes']} bytes (x{stats['compression_ratio']})")
+
+
+if __name__ == "__main__":
+    main()
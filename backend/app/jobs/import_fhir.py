@@ -0,0 +1,64 @@
+"""
+Import external medical history from FHIR into the history tables
+Run with: python -m app.jobs.import_fhir FILE [FILE ...] [--user-id UUID] [--patient-map map.csv]
+                                         [--batch-size 500] [--dry-run] [--json]
+
+FILE is a FHIR Bundle (.json) or a bulk-export NDJSON file (.ndjson). Condition,
+MedicationStatement, AllergyIntolerance and laboratory Observation resources go to
+chronic_conditions, medications, allergies and lab_values (see app/core/fhir_import.py).
+Patients: --user-id assigns everything to one user; otherwise FHIR Patient ids are
+resolved through --patient-map (CSV: fhir_patient_id,user_id) or the email of Patient
+resources earlier in the input (list Patient files first). Rows already present are
+skipped; completion scores are recomputed once per touched profile at the end.
+"""
+import argparse
+import csv
+import json
+
+from app.core.database import get_supabase
+from app.core.fhir_import import FhirImporter, is_ndjson, iter_resources
+
+
+def load_patient_map(path: str) -> dict:
+    with open(path, newline="") as f:
+        return {row[0].strip(): row[1].strip() for row in csv.reader(f) if len(row) >= 2 and not row[0].startswith("#")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import FHIR Conditions, medications, allergies and lab results")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--user-id", help="assign every resource to this user")
+    parser.add_argument("--patient-map", help="CSV of fhir_patient_id,user_id")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="map and deduplicate without writing")
+    parser.add_argument("--json", action="store_true", help="print the report as one JSON object")
+    args = parser.parse_args()
+
+    importer = FhirImporter(
+        get_supabase(),
+        user_id=args.user_id,
+        patient_map=load_patient_map(args.patient_map) if args.patient_map else None,
+        batch_size=args.batch_size,
+        dry_run=args.dry_run,
+    )
+    index = 0
+    for path in args.files:
+        with open(path, "rb") as fp:
+            for resource in iter_resources(fp, is_ndjson(path)):
+                importer.add(index, resource)
+                index += 1
+    report = importer.finish()
+
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"{report['resources']} resources in {report['seconds']}s ({report['resources_per_second']}/s): "
+          f"{report['inserted']} inserted in {report['batches']} batches, {report['duplicates']} duplicates, "
+          f"{report['skipped']} skipped, {report['errors']} errors; {report['profiles']} profiles rescored")
+    print("Inserted: " + ", ".join(f"{table} {n}" for table, n in report["inserted_by_table"].items()))
+    for error in report["error_details"]:
+        print(f"  #{error['index']} {error['resource']}: {error['error']}")
+
+
+if __name__ == "__main__":
+    main()
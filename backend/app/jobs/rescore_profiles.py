@@ -0,0 +1,113 @@
+"""
+Bulk recompute user_medical_profiles.profile_completion_score
+Run with: python -m app.jobs.rescore_profiles [--page-size 1000] [--dry-run] [--verify]
+
+Streams profiles in keyset pages, loads related-table existence for each page
+with one range query per table, scores the page with
+calculate_profile_completion_batch and writes the scores back in one upsert.
+--verify checks every page against the scalar calculate_profile_completion.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.core.database import get_supabase
+from app.core.profile_scoring import (
+    calculate_profile_completion, calculate_profile_completion_batch, RELATED_FIELDS
+)
+from app.core.profile_store import PROFILE_FIELDS
+
+PROFILE_COLUMNS = ["id", "user_id"] + PROFILE_FIELDS
+
+
+def iter_profile_pages(supabase, page_size: int):
+    """Yield pages of profiles ordered by id (keyset pagination)"""
+    last_id = None
+    while True:
+        query = supabase.table("user_medical_profiles").select(",".join(PROFILE_COLUMNS)).order("id").limit(page_size)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.execute().data or []
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]["id"]
+        if len(rows) < page_size:
+            return
+
+
+def fetch_related_presence(supabase, profiles: list, page_size: int) -> dict:
+    """For each related table, a bool array telling which profiles in the page have rows"""
+    ids = [p["id"] for p in profiles]
+    first_id, last_id = ids[0], ids[-1]
+    related = {}
+    for table in RELATED_FIELDS:
+        present = set()
+        offset = 0
+        while True:
+            rows = (
+                supabase.table(table).select("profile_id")
+                .gte("profile_id", first_id).lte("profile_id", last_id)
+                .order("profile_id")
+                .range(offset, offset + page_size - 1)
+                .execute().data or []
+            )
+            present.update(r["profile_id"] for r in rows)
+            if len(rows) < page_size:
+                break
+            offset += page_size
+        related[table] = np.fromiter((i in present for i in ids), dtype=bool, count=len(ids))
+    return related
+
+
+def verify_page(profiles: list, related: dict, scores: np.ndarray) -> int:
+    """Count profiles where the batch score differs from the scalar one"""
+    mismatches = 0
+    for k, profile in enumerate(profiles):
+        merged = dict(profile)
+        for table, present in related.items():
+            merged[table] = True if present[k] else None
+        if calculate_profile_completion(merged) != scores[k]:
+            mismatches += 1
+    return mismatches
+
+
+def rescore(supabase, page_size: int = 1000, dry_run: bool = False, verify: bool = False) -> dict:
+    stats = {"profiles": 0, "pages": 0, "mismatches": 0, "seconds": 0.0}
+    start = time.perf_counter()
+    for profiles in iter_profile_pages(supabase, page_size):
+        related = fetch_related_presence(supabase, profiles, page_size)
+        scores = calculate_profile_completion_batch(profiles, related)
+        if verify:
+            stats["mismatches"] += verify_page(profiles, related, scores)
+        if not dry_run:
+            supabase.table("user_medical_profiles").upsert(
+                [
+                    {"id": p["id"], "user_id": p["user_id"], "profile_completion_score": float(score)}
+                    for p, score in zip(profiles, scores)
+                ],
+                on_conflict="id",
+            ).execute()
+        stats["profiles"] += len(profiles)
+        stats["pages"] += 1
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute profile completion scores for all profiles")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="score without writing")
+    parser.add_argument("--verify", action="store_true", help="check batch scores against the scalar scorer")
+    args = parser.parse_args()
+
+    stats = rescore(get_supabase(), args.page_size, args.dry_run, args.verify)
+    rate = stats["profiles"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"Scored {stats['profiles']} profiles in {stats['pages']} pages, {stats['seconds']}s ({rate:.0f}/s)")
+    if args.verify:
+        print(f"Scalar parity mismatches: {stats['mismatches']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.http_client import close_http_client
+from app.core.compression import CompressionMiddleware
+from app.core.tracing import TracingMiddleware, configure_tracing, shutdown_tracing
+from app.core.revocation import start_revocation_sync, stop_revocation_sync
+from app.core.llm_usage import start_usage_flush, stop_usage_flush
+from app.core.database import get_supabase
+import anyio.to_thread
 
-from app.api.v1 import auth, ai_assistant, document_digitizing
+from app.api.v1 import auth, ai_assistant, document_digitizing, search, export
 from app.api.onboarding import router as onboarding_router
 from app.api.profile_edit import router as profile_edit_router
 
@@ -41,6 +48,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large payloads (extracted_text-heavy document lists, long chats)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_SIZE,
+    gzip_level=settings.GZIP_LEVEL,
+    brotli_quality=settings.BROTLI_QUALITY,
+)
+
+# Outermost, so the request span covers compression and every other middleware
+app.add_middleware(TracingMiddleware)
+
+
+@app.on_event("startup")
+async def configure_worker_pools():
+    """Size this worker's threadpool (used by sync endpoints) from settings"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.WORKER_THREADPOOL_SIZE
+    configure_tracing()
+    start_revocation_sync(get_supabase())
+    start_usage_flush(get_supabase())
+
+
+@app.on_event("shutdown")
+async def close_worker_pools():
+    await close_http_client()
+    shutdown_tracing()
+    stop_revocation_sync()
+    stop_usage_flush(get_supabase())
+
+
 # Include routers
 
 app.include_router(
@@ -53,6 +89,16 @@ app.include_router(
     prefix=f"{settings.API_V1_PREFIX}/ai",
     tags=["AI Medical Assistant"]
 )
+app.include_router(
+    search.router,
+    prefix=f"{settings.API_V1_PREFIX}/search",
+    tags=["Search"]
+)
+app.include_router(
+    export.router,
+    prefix=f"{settings.API_V1_PREFIX}/export",
+    tags=["Export"]
+)
 
 
 @app.get("/")
@@ -5,6 +5,7 @@
 # user_medical_profiles table fields:
 # id, user_id, age, biological_sex, height_cm, weight_kg, pregnancy_status, smoking_status, alcohol_consumption,
 # exercise_frequency, sleep_duration, diet_type, stress_level, profile_completion_score
+# (profile_completion_score is maintained on every write, see app/core/profile_store.py)
 
 # chronic_conditions table fields:
 # id, profile_id, name, year_diagnosed, controlled_status
@@ -10,6 +10,9 @@ class ChatResponse(BaseModel):
     title: Optional[str]
     created_at: datetime
     last_message_at: Optional[datetime]
+    last_message_preview: Optional[str] = None
+    last_sender: Optional[str] = None
+    message_count: int = 0
 
 class MessageCreate(BaseModel):
     chat_id: str
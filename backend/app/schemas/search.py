@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+
+class SearchHit(BaseModel):
+    kind: str  # "document" | "message"
+    id: str
+    chat_id: Optional[str]
+    title: Optional[str]
+    snippet: str  # matches wrapped in <mark></mark>
+    rank: float
+    created_at: datetime
+
+class SearchResponse(BaseModel):
+    query: str
+    total: int
+    limit: int
+    offset: int
+    hits: List[SearchHit]
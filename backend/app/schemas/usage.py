@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import date
+
+class UsageDay(BaseModel):
+    day: date
+    model: str
+    calls: int
+    errors: int
+    prompt_tokens: int
+    completion_tokens: int
+    cost_usd: float
+    avg_latency_ms: int
+
+class UsageResponse(BaseModel):
+    days: List[UsageDay]
+    today_tokens: int
+    daily_token_budget: Optional[int]  # None when quotas are off
+    remaining_tokens: Optional[int]
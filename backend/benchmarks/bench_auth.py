@@ -0,0 +1,43 @@
+"""
+Auth-dependency overhead per request: decode_token with and without the verified-token cache
+
+Run from backend/:
+    python benchmarks/bench_auth.py --iterations 50000
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings requires these; the benchmark never talks to Supabase or OpenRouter
+for name in ("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY", "OPENROUTER_MODEL", "OPENROUTER_API_KEY"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("JWT_SECRET_KEY", "bench-secret")
+
+from app.core.security import create_access_token, decode_token, clear_token_cache  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=50000)
+    args = parser.parse_args()
+
+    token = create_access_token({"sub": "00000000-0000-0000-0000-000000000000", "email": "bench@example.com"})
+
+    def cold():
+        clear_token_cache()
+        decode_token(token)
+
+    def warm():
+        decode_token(token)
+
+    decode_token(token)
+    for label, fn in (("verify every request", cold), ("cached", warm)):
+        seconds = timeit.timeit(fn, number=args.iterations)
+        print(f"{label:>22}: {seconds / args.iterations * 1e6:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
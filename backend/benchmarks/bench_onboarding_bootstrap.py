@@ -0,0 +1,63 @@
+"""
+Concurrent first-time onboarding bootstrap against a running API
+
+Run from backend/ against a server (python run.py) for a user that exists in
+`profiles` but has no medical profile / onboarding session yet:
+    python benchmarks/bench_onboarding_bootstrap.py --user-id <uuid> --concurrency 32
+
+All requests fire at once (as the app does when a screen mounts twice). Every
+response must carry the same profile id and session id; a second pass checks
+that GET /onboarding/profile answers without creating anything.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+
+
+async def _fire(base_url: str, user_id: str, concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        start = asyncio.Event()
+
+        async def one():
+            await start.wait()
+            t0 = time.perf_counter()
+            resp = await client.post("/api/v1/onboarding/bootstrap", params={"user_id": user_id})
+            return resp, time.perf_counter() - t0
+
+        tasks = [asyncio.create_task(one()) for _ in range(concurrency)]
+        await asyncio.sleep(0.1)
+        start.set()
+        results = await asyncio.gather(*tasks)
+        read = await client.get("/api/v1/onboarding/profile", params={"user_id": user_id})
+    return results, read
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    results, read = asyncio.run(_fire(args.base_url, args.user_id, args.concurrency))
+    errors = [r for r, _ in results if r.status_code != 200]
+    ok = [r.json() for r, _ in results if r.status_code == 200]
+    profile_ids = {body["profile"]["id"] for body in ok}
+    session_ids = {body["session"]["id"] for body in ok}
+    latencies = sorted(t for _, t in results)
+
+    print(f"requests:     {len(results)} ({len(errors)} errors)")
+    print(f"p50 / max ms: {latencies[len(latencies) // 2] * 1000:.1f} / {latencies[-1] * 1000:.1f}")
+    print(f"profile ids:  {sorted(profile_ids)}")
+    print(f"session ids:  {sorted(session_ids)}")
+    print(f"GET profile:  {read.status_code}")
+    if errors or len(profile_ids) != 1 or len(session_ids) != 1 or read.status_code != 200:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+PDF text extraction: OCR every page (previous behaviour) vs. text layer first, OCR fallback
+
+Needs poppler-utils and tesseract (both in the Dockerfile). Run from backend/:
+    python benchmarks/bench_pdf_extraction.py --corpus path/to/pdfs
+    python benchmarks/bench_pdf_extraction.py --digital 10 --scanned 10 --pages 3
+
+Without --corpus a mixed corpus is generated: "digital" PDFs carry a real text
+layer (lab-report style lines), "scanned" ones are the same pages rendered to
+images. Prints per-strategy time, pages/s, the method mix and how similar the
+extracted text of both strategies is.
+"""
+import argparse
+import difflib
+import glob
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from app.api.v1.document_digitizing import _ocr_image, extract_pdf_pages  # noqa: E402
+
+LINES = [
+    "Hemoglobin            13.8 g/dL       13.0 - 17.0",
+    "Total Leucocyte Count  7600 /cumm     4000 - 10000",
+    "Platelet Count        2.45 lakh/cumm  1.50 - 4.10",
+    "Fasting Glucose       104 mg/dL       70 - 100",
+    "HbA1c                 6.1 %           4.0 - 5.6",
+    "Serum Creatinine      0.9 mg/dL       0.7 - 1.3",
+    "TSH                   2.8 uIU/mL      0.4 - 4.0",
+    "LDL Cholesterol       128 mg/dL       < 100",
+]
+
+
+def page_lines(doc: int, page: int) -> list:
+    return [f"Patient report {doc} - page {page}"] + LINES
+
+
+def digital_pdf(doc: int, pages: int) -> bytes:
+    """Minimal PDF with a Courier text layer (keeps the table columns), one content stream per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>"]
+    kids = []
+    for page in range(1, pages + 1):
+        ops = ["BT /F1 11 Tf 14 TL 50 780 Td"] + [
+            "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") '"
+            for line in page_lines(doc, page)
+        ] + ["ET"]
+        stream = "\n".join(ops).encode()
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out, offsets = io.BytesIO(), []
+    out.write(b"%PDF-1.4\n")
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode())
+        out.write(body if isinstance(body, bytes) else body.encode())
+        out.write(b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def scanned_pdf(doc: int, pages: int) -> bytes:
+    """Image-only PDF: the same pages rendered at 150 dpi, no text layer"""
+    images = []
+    for page in range(1, pages + 1):
+        image = Image.new("L", (1240, 1754), 255)
+        draw = ImageDraw.Draw(image)
+        for i, line in enumerate(page_lines(doc, page)):
+            draw.text((100, 120 + i * 40), line, fill=0)
+        images.append(image)
+    out = io.BytesIO()
+    images[0].save(out, format="PDF", save_all=True, append_images=images[1:], resolution=150)
+    return out.getvalue()
+
+
+def ocr_all_pages(pdf_path: str) -> str:
+    # The previous extract_text_from_pdf_path: rasterize everything, OCR everything
+    from pdf2image import convert_from_path
+    return "".join(_ocr_image(image, page) for page, image in enumerate(convert_from_path(pdf_path), start=1))
+
+
+def build_corpus(directory: str, digital: int, scanned: int, pages: int) -> list:
+    paths = []
+    for kind, count, make in (("digital", digital, digital_pdf), ("scanned", scanned, scanned_pdf)):
+        for doc in range(count):
+            path = os.path.join(directory, f"{kind}-{doc:03d}.pdf")
+            with open(path, "wb") as f:
+                f.write(make(doc, pages))
+            paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", help="directory of PDFs (default: generate a mixed corpus)")
+    parser.add_argument("--digital", type=int, default=10)
+    parser.add_argument("--scanned", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = sorted(glob.glob(os.path.join(args.corpus, "*.pdf"))) if args.corpus else \
+            build_corpus(tmp, args.digital, args.scanned, args.pages)
+        if not paths:
+            sys.exit("no PDFs found")
+
+        baseline_s, layered_s, similarity, methods, page_ms = 0.0, 0.0, [], {"text": 0, "ocr": 0}, []
+        for path in paths:
+            start = time.perf_counter()
+            baseline = ocr_all_pages(path)
+            baseline_s += time.perf_counter() - start
+
+            start = time.perf_counter()
+            pages = extract_pdf_pages(path)
+            layered_s += time.perf_counter() - start
+
+            for page in pages:
+                methods[page["method"]] += 1
+                page_ms.append((page["method"], page["ms"]))
+            text = "".join(p["text"] for p in pages)
+            similarity.append(difflib.SequenceMatcher(None, " ".join(baseline.split()), " ".join(text.split())).ratio())
+            print(f"{os.path.basename(path):32s} " + " ".join(f"p{p['page']}:{p['method']}:{p['ms']:.0f}ms" for p in pages))
+
+    total_pages = sum(methods.values())
+    print()
+    print(f"{len(paths)} PDFs, {total_pages} pages ({methods['text']} text layer, {methods['ocr']} OCR)")
+    print(f"OCR every page:     {baseline_s:7.2f}s  {total_pages / baseline_s:6.1f} pages/s")
+    print(f"Text layer first:   {layered_s:7.2f}s  {total_pages / layered_s:6.1f} pages/s  (x{baseline_s / layered_s:.1f})")
+    for method in ("text", "ocr"):
+        times = [ms for m, ms in page_ms if m == method]
+        if times:
+            print(f"  {method:4s} pages: median {statistics.median(times):.1f} ms, max {max(times):.1f} ms")
+    print(f"Text similarity vs. OCR-only: mean {statistics.mean(similarity):.3f}, min {min(similarity):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+CPU per response for large chat histories: per-row models + FastAPI encoding vs. fast_json (orjson)
+
+Run from backend/:
+    python benchmarks/bench_serialization.py --messages 5000 --repeat 20
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from app.core.responses import fast_json  # noqa: E402
+from app.schemas.chat import MessageListResponse, MessageResponse  # noqa: E402
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def make_rows(n: int) -> list:
+    return [
+        {
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "chat_id": "11111111-1111-1111-1111-111111111111",
+            "sender": "ai" if i % 2 else "user",
+            "content": "Your HbA1c of 6.1% is in the prediabetic range. " * 8,
+            "created_at": "2026-10-01T12:00:00.000000+00:00",
+        }
+        for i in range(n)
+    ]
+
+
+def old_path(rows: list, field) -> bytes:
+    # What get_messages did before: a model per row, then FastAPI re-validates
+    # against response_model and encodes with jsonable_encoder + stdlib json
+    model = MessageListResponse(messages=[MessageResponse(**row) for row in rows])
+    content = asyncio.run(serialize_response(field=field, response_content=model))
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def new_path(rows: list, field) -> bytes:
+    return fast_json(MessageListResponse, {"messages": rows}).body
+
+
+def timed(fn, *args, repeat: int):
+    start = time.process_time()
+    for _ in range(repeat):
+        result = fn(*args)
+    return (time.process_time() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.messages)
+    field = create_response_field(name="response", type_=MessageListResponse)
+    print(f"{args.messages} messages, CPU seconds per response")
+    for label, fn in (("per-row models + json", old_path), ("fast_json (orjson)", new_path)):
+        seconds, body = timed(fn, rows, field, repeat=args.repeat)
+        print(f"{label:>24}: {seconds * 1000:8.2f} ms  ({len(body) / 1024:.0f} KiB)")
+
+    seconds, compressed = timed(gzip.compress, body, 6, repeat=args.repeat)
+    print(f"{'gzip level 6':>24}: {seconds * 1000:8.2f} ms  ({len(compressed) / 1024:.0f} KiB)")
+    if brotli is not None:
+        seconds, compressed = timed(lambda b: brotli.compress(b, quality=4), body, repeat=args.repeat)
+        print(f"{'brotli quality 4':>24}: {seconds * 1000:8.2f} ms  ({len(compressed) / 1024:.0f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
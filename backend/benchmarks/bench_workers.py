@@ -0,0 +1,100 @@
+"""
+Throughput vs. worker count for the production profile (gunicorn_conf.py)
+
+Run from backend/ with the usual .env in place:
+    python benchmarks/bench_workers.py --workers 1 2 4 --path /api/v1/auth/me \
+        --header "Authorization: Bearer <token>"
+
+For every worker count a fresh gunicorn is started with WEB_CONCURRENCY set,
+hammered with --concurrency clients for --duration seconds, and stopped with
+SIGTERM (which also exercises the graceful drain).
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+async def _wait_ready(base_url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/health")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError("server did not become ready")
+
+
+async def _load(url: str, headers: dict, concurrency: int, duration: float):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    resp = await client.get(url, headers=headers)
+                    if resp.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def run(workers: int, args) -> dict:
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(args.port), DEBUG="false")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn_conf.py", "app.main:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    headers = dict(h.split(": ", 1) for h in args.header)
+    try:
+        asyncio.run(_wait_ready(base_url))
+        latencies, errors = asyncio.run(_load(f"{base_url}{args.path}", headers, args.concurrency, args.duration))
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=60)
+    latencies.sort()
+    return {
+        "workers": workers,
+        "rps": len(latencies) / args.duration,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--header", action="append", default=[])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--port", type=int, default=18000)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for n in args.workers:
+        r = run(n, args)
+        print(f"{r['workers']:>8} {r['rps']:>10.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
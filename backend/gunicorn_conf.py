@@ -0,0 +1,36 @@
+"""
+Production server profile
+Run with: gunicorn -c gunicorn_conf.py app.main:app
+
+Worker count is derived from CPU/memory (override with WEB_CONCURRENCY),
+workers run uvloop + httptools, are recycled after MAX_REQUESTS requests to
+contain OCR memory growth, and drain in-flight requests for GRACEFUL_TIMEOUT
+seconds on SIGTERM.
+"""
+from app.core.config import settings
+from app.core.server import compute_worker_count
+
+bind = f"0.0.0.0:{settings.PORT}"
+worker_class = "app.core.server.ProductionUvicornWorker"
+workers = compute_worker_count(
+    override=settings.WEB_CONCURRENCY,
+    worker_memory_mb=settings.WORKER_MEMORY_MB,
+    max_workers=settings.MAX_WORKERS,
+)
+
+# Worker recycling
+max_requests = settings.MAX_REQUESTS
+max_requests_jitter = settings.MAX_REQUESTS_JITTER
+
+# Graceful drain on SIGTERM / timeouts
+graceful_timeout = settings.GRACEFUL_TIMEOUT
+timeout = settings.WORKER_TIMEOUT
+keepalive = settings.KEEPALIVE
+
+accesslog = "-"
+errorlog = "-"
+loglevel = "debug" if settings.DEBUG else "info"
+
+
+def on_starting(server):
+    server.log.info(f"Starting {workers} workers (max_requests={max_requests}, graceful_timeout={graceful_timeout}s)")
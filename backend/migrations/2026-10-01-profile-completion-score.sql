@@ -0,0 +1,11 @@
+-- Migration: Persist profile completion score
+-- The API now maintains user_medical_profiles.profile_completion_score on every write
+-- (onboarding answers, profile edits, related-table inserts/deletes) and reads it back
+-- instead of recomputing on each request.
+
+ALTER TABLE user_medical_profiles ADD COLUMN IF NOT EXISTS profile_completion_score NUMERIC(5,2) NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN user_medical_profiles.profile_completion_score IS 'Completion score (0-100) including related tables, maintained by the API';
+
+-- Backfill existing rows after running this migration:
+--   python -m app.jobs.rescore_profiles
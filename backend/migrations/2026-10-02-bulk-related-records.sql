@@ -0,0 +1,100 @@
+-- Migration: Bulk upsert/delete for medical-history related tables
+-- Used by POST /profile/bulk-upsert and POST /profile/bulk-delete.
+-- Resolves profile_id once and writes every table with one INSERT / UPDATE / DELETE
+-- statement each; the whole call runs in a single transaction.
+--
+-- p_upserts: {"medications": [{"name": "...", "dose": "..."}, {"id": 7, "dose": "..."}], ...}
+--            rows without "id" are inserted, rows with "id" update only the keys they carry
+-- p_deletes: {"medications": [7, 8], ...}
+-- Returns:   {"records": {"medications": [<inserted and updated rows>]}, "deleted": {"medications": [7, 8]}}
+
+CREATE OR REPLACE FUNCTION bulk_upsert_related(p_user_id UUID, p_upserts JSONB DEFAULT '{}', p_deletes JSONB DEFAULT '{}')
+RETURNS JSONB AS $$
+DECLARE
+    v_profile_id user_medical_profiles.id%TYPE;
+    v_table TEXT;
+    v_rows JSONB;
+    v_new JSONB;
+    v_existing JSONB;
+    v_cols TEXT;
+    v_set TEXT;
+    v_inserted JSONB;
+    v_updated JSONB;
+    v_deleted JSONB;
+    v_records JSONB := '{}'::jsonb;
+    v_deleted_ids JSONB := '{}'::jsonb;
+BEGIN
+    SELECT id INTO v_profile_id FROM user_medical_profiles WHERE user_id = p_user_id;
+    IF v_profile_id IS NULL THEN
+        RAISE EXCEPTION 'Profile not found' USING ERRCODE = 'P0002';
+    END IF;
+
+    FOREACH v_table IN ARRAY ARRAY['chronic_conditions', 'medications', 'allergies', 'surgical_history', 'family_history', 'lab_values'] LOOP
+        -- Deletes
+        IF jsonb_array_length(COALESCE(p_deletes -> v_table, '[]'::jsonb)) > 0 THEN
+            EXECUTE format(
+                'WITH del AS (
+                    DELETE FROM %1$I
+                    WHERE profile_id = $1
+                      AND id IN (SELECT (jsonb_populate_record(NULL::%1$I, jsonb_build_object(''id'', x))).id FROM jsonb_array_elements($2) AS x)
+                    RETURNING id
+                )
+                SELECT COALESCE(jsonb_agg(id), ''[]'') FROM del', v_table)
+            INTO v_deleted USING v_profile_id, p_deletes -> v_table;
+            v_deleted_ids := v_deleted_ids || jsonb_build_object(v_table, v_deleted);
+        END IF;
+
+        v_rows := COALESCE(p_upserts -> v_table, '[]'::jsonb);
+        IF jsonb_array_length(v_rows) = 0 THEN
+            CONTINUE;
+        END IF;
+
+        -- Only real columns that appear in the payload (also keeps identifiers safe)
+        SELECT string_agg(quote_ident(c.column_name), ', '),
+               string_agg(format('%1$I = CASE WHEN j.doc ? %2$L THEN s.%1$I ELSE t.%1$I END', c.column_name, c.column_name), ', ')
+        INTO v_cols, v_set
+        FROM information_schema.columns c
+        WHERE c.table_schema = 'public' AND c.table_name = v_table
+          AND c.column_name NOT IN ('id', 'profile_id')
+          AND EXISTS (SELECT 1 FROM jsonb_array_elements(v_rows) r WHERE r ? c.column_name);
+        IF v_cols IS NULL THEN
+            CONTINUE;
+        END IF;
+
+        SELECT COALESCE(jsonb_agg(r) FILTER (WHERE NOT r ? 'id'), '[]'),
+               COALESCE(jsonb_agg(r) FILTER (WHERE r ? 'id'), '[]')
+        INTO v_new, v_existing
+        FROM jsonb_array_elements(v_rows) r;
+
+        v_inserted := '[]'::jsonb;
+        IF jsonb_array_length(v_new) > 0 THEN
+            EXECUTE format(
+                'WITH ins AS (
+                    INSERT INTO %1$I (profile_id, %2$s)
+                    SELECT $1, %2$s FROM jsonb_populate_recordset(NULL::%1$I, $2)
+                    RETURNING *
+                )
+                SELECT COALESCE(jsonb_agg(to_jsonb(ins)), ''[]'') FROM ins', v_table, v_cols)
+            INTO v_inserted USING v_profile_id, v_new;
+        END IF;
+
+        v_updated := '[]'::jsonb;
+        IF jsonb_array_length(v_existing) > 0 THEN
+            EXECUTE format(
+                'WITH upd AS (
+                    UPDATE %1$I t SET %2$s
+                    FROM jsonb_array_elements($2) AS j(doc)
+                    CROSS JOIN LATERAL jsonb_populate_record(NULL::%1$I, j.doc) AS s
+                    WHERE t.id = s.id AND t.profile_id = $1
+                    RETURNING t.*
+                )
+                SELECT COALESCE(jsonb_agg(to_jsonb(upd)), ''[]'') FROM upd', v_table, v_set)
+            INTO v_updated USING v_profile_id, v_existing;
+        END IF;
+
+        v_records := v_records || jsonb_build_object(v_table, v_inserted || v_updated);
+    END LOOP;
+
+    RETURN jsonb_build_object('records', v_records, 'deleted', v_deleted_ids);
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,90 @@
+-- Migration: Full-text search over documents and chat messages
+-- Used by GET /api/v1/search
+
+-- Stored tsvector columns (kept in sync by Postgres) + GIN indexes
+ALTER TABLE medical_documents ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', COALESCE(title, '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(extracted_text, '')), 'B')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS idx_medical_documents_search ON medical_documents USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_medical_documents_user_id ON medical_documents(user_id);
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('english', COALESCE(content, ''))) STORED;
+CREATE INDEX IF NOT EXISTS idx_messages_search ON messages USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_chats_user_id ON chats(user_id);
+
+-- medical_documents.user_id was TEXT while uploads used a placeholder id; documents are now
+-- owned by the authenticated user, so store it as UUID and compare it without casts (a cast
+-- column cannot use idx_medical_documents_user_id). Placeholder rows belong to no account.
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'medical_documents' AND column_name = 'user_id') <> 'uuid' THEN
+        ALTER TABLE medical_documents ALTER COLUMN user_id DROP NOT NULL;
+        ALTER TABLE medical_documents ALTER COLUMN user_id TYPE UUID USING (
+            CASE WHEN user_id ~* '^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}$' THEN user_id::UUID END
+        );
+    END IF;
+END $$;
+
+-- Ranked, highlighted, paginated search scoped to one user.
+-- p_scope: 'all' | 'documents' | 'messages'. Highlights are computed only for the returned page.
+CREATE OR REPLACE FUNCTION search_user_content(
+    p_user_id UUID,
+    p_query TEXT,
+    p_scope TEXT DEFAULT 'all',
+    p_limit INTEGER DEFAULT 20,
+    p_offset INTEGER DEFAULT 0
+)
+RETURNS TABLE (
+    kind TEXT,
+    id TEXT,
+    chat_id TEXT,
+    title TEXT,
+    snippet TEXT,
+    rank REAL,
+    created_at TIMESTAMPTZ,
+    total_count BIGINT
+) AS $$
+    WITH q AS (
+        SELECT websearch_to_tsquery('english', p_query) AS query
+    ),
+    -- ids keep their own types so the final joins use the primary keys
+    hits AS (
+        SELECT 'document'::TEXT AS kind, d.id AS doc_id, NULL::UUID AS msg_id, NULL::UUID AS chat_id, d.title,
+               ts_rank_cd(d.search_vector, q.query) AS rank, d.created_at
+        FROM medical_documents d, q
+        WHERE p_scope IN ('all', 'documents')
+          AND d.user_id = p_user_id
+          AND d.search_vector @@ q.query
+        UNION ALL
+        SELECT 'message', NULL, m.id, m.chat_id, c.title,
+               ts_rank_cd(m.search_vector, q.query), m.created_at
+        FROM messages m
+        JOIN chats c ON c.id = m.chat_id, q
+        WHERE p_scope IN ('all', 'messages')
+          AND c.user_id = p_user_id
+          AND m.search_vector @@ q.query
+    ),
+    page AS (
+        SELECT hits.*, COUNT(*) OVER () AS total_count
+        FROM hits
+        ORDER BY rank DESC, created_at DESC
+        LIMIT p_limit OFFSET p_offset
+    )
+    SELECT page.kind, COALESCE(page.doc_id, page.msg_id)::TEXT, page.chat_id::TEXT, page.title,
+           ts_headline('english',
+                       -- a document without OCR text (NULL) highlights its title instead of returning NULL
+                       CASE WHEN page.kind = 'document' THEN COALESCE(d.extracted_text, d.title, '')
+                            ELSE COALESCE(m.content, '') END,
+                       q.query,
+                       'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=30, MinWords=10'),
+           page.rank, page.created_at, page.total_count
+    FROM page
+    CROSS JOIN q
+    LEFT JOIN medical_documents d ON d.id = page.doc_id
+    LEFT JOIN messages m ON m.id = page.msg_id
+    ORDER BY page.rank DESC, page.created_at DESC;
+$$ LANGUAGE sql STABLE;
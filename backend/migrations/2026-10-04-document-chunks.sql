@@ -0,0 +1,19 @@
+-- Migration: Per-user retrieval index over digitized documents
+-- Filled after POST /documents/upload (app/core/document_index.py) and read by the AI assistant.
+
+CREATE TABLE IF NOT EXISTS document_chunks (
+    id BIGSERIAL PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    document_id UUID NOT NULL REFERENCES medical_documents(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    title TEXT,
+    content TEXT NOT NULL,
+    embedder TEXT NOT NULL,          -- e.g. 'hashing-1024'; vectors from different embedders are never mixed
+    embedding REAL[] NOT NULL,       -- L2-normalized
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE (document_id, chunk_index)
+);
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_user ON document_chunks(user_id, embedder);
+
+COMMENT ON TABLE document_chunks IS 'Chunked OCR text + embeddings per user, loaded into worker memory for retrieval';
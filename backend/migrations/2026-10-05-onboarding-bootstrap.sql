@@ -0,0 +1,73 @@
+-- Migration: Idempotent onboarding bootstrap
+-- Used by POST /onboarding/bootstrap and POST /onboarding/start. Creates (or returns)
+-- the user's medical profile and active onboarding session in one call; concurrent
+-- first-time calls converge on the same rows through ON CONFLICT (user_id).
+-- GET /onboarding/profile only calls it when the user has no profile yet.
+
+-- Step 1: Merge duplicate rows left behind by the old select-then-insert flow
+-- The most complete profile (oldest on ties) is kept; related records of the
+-- duplicates move to it before the duplicates go
+DO $$
+DECLARE
+    v_table TEXT;
+BEGIN
+    CREATE TEMP TABLE dup_profiles ON COMMIT DROP AS
+    SELECT id AS dup_id, keep_id
+    FROM (
+        SELECT id,
+               FIRST_VALUE(id) OVER (PARTITION BY user_id ORDER BY profile_completion_score DESC, id) AS keep_id
+        FROM user_medical_profiles
+    ) ranked
+    WHERE id <> keep_id;
+
+    FOREACH v_table IN ARRAY ARRAY['chronic_conditions', 'medications', 'allergies', 'surgical_history', 'family_history', 'lab_values'] LOOP
+        EXECUTE format('UPDATE %I t SET profile_id = d.keep_id FROM dup_profiles d WHERE t.profile_id = d.dup_id', v_table);
+    END LOOP;
+    DELETE FROM user_medical_profiles p USING dup_profiles d WHERE p.id = d.dup_id;
+END $$;
+
+-- Keep the active session (oldest first) per user
+DELETE FROM onboarding_sessions s
+USING (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY is_active DESC, id) AS rn
+    FROM onboarding_sessions
+) ranked
+WHERE s.id = ranked.id AND ranked.rn > 1;
+
+-- Step 2: One profile and one session per user (the ON CONFLICT targets)
+CREATE UNIQUE INDEX IF NOT EXISTS user_medical_profiles_user_id_key ON user_medical_profiles (user_id);
+CREATE UNIQUE INDEX IF NOT EXISTS onboarding_sessions_user_id_key ON onboarding_sessions (user_id);
+
+-- Step 3: Bootstrap function
+-- Returns: {"profile": {..., "chronic_conditions": [{"id": ...}] or [], ...}, "session": {...}}
+-- Related lists hold at most one id, matching fetch_profile_with_related in the API.
+-- A finished (inactive) session is reopened, as the old GET did by inserting a new one.
+CREATE OR REPLACE FUNCTION bootstrap_onboarding(p_user_id UUID)
+RETURNS JSONB AS $$
+DECLARE
+    v_profile user_medical_profiles%ROWTYPE;
+    v_session onboarding_sessions%ROWTYPE;
+    v_related JSONB := '{}'::jsonb;
+    v_table TEXT;
+    v_ids JSONB;
+BEGIN
+    INSERT INTO user_medical_profiles (user_id) VALUES (p_user_id)
+    ON CONFLICT (user_id) DO NOTHING;
+    SELECT * INTO v_profile FROM user_medical_profiles WHERE user_id = p_user_id;
+
+    INSERT INTO onboarding_sessions (user_id, is_active) VALUES (p_user_id, TRUE)
+    ON CONFLICT (user_id) DO UPDATE SET is_active = TRUE
+    WHERE NOT onboarding_sessions.is_active;
+    SELECT * INTO v_session FROM onboarding_sessions WHERE user_id = p_user_id;
+
+    FOREACH v_table IN ARRAY ARRAY['chronic_conditions', 'medications', 'allergies', 'surgical_history', 'family_history', 'lab_values'] LOOP
+        EXECUTE format(
+            'SELECT COALESCE(jsonb_agg(jsonb_build_object(''id'', id)), ''[]'') FROM (SELECT id FROM %I WHERE profile_id = $1 LIMIT 1) r',
+            v_table)
+        INTO v_ids USING v_profile.id;
+        v_related := v_related || jsonb_build_object(v_table, v_ids);
+    END LOOP;
+
+    RETURN jsonb_build_object('profile', to_jsonb(v_profile) || v_related, 'session', to_jsonb(v_session));
+END;
+$$ LANGUAGE plpgsql;
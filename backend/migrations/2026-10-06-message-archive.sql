@@ -0,0 +1,26 @@
+-- Migration: Hot/cold tiering for chat messages
+-- app/jobs/archive_messages.py moves the messages of chats idle for ARCHIVE_IDLE_DAYS
+-- into one zstd-compressed JSON blob per chat and deletes the hot rows.
+-- GET /ai/chats/{chat_id}/messages merges the archive back in on read, and posting to
+-- an archived chat restores its rows to `messages` first (app/core/message_archive.py).
+-- Archived messages are not covered by full-text search until the chat is rehydrated.
+
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS archived_at TIMESTAMPTZ;
+
+CREATE TABLE IF NOT EXISTS message_archives (
+    chat_id UUID PRIMARY KEY REFERENCES chats(id) ON DELETE CASCADE,
+    user_id UUID,
+    message_count INTEGER NOT NULL,
+    first_message_at TIMESTAMPTZ,
+    last_message_at TIMESTAMPTZ,
+    codec TEXT NOT NULL DEFAULT 'zstd',
+    raw_bytes INTEGER NOT NULL,
+    payload BYTEA NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Candidate scan for the archive job: only hot chats, by idleness
+CREATE INDEX IF NOT EXISTS idx_chats_hot_last_message ON chats(last_message_at) WHERE archived_at IS NULL;
+
+-- History/page reads of the (now bounded) hot table
+CREATE INDEX IF NOT EXISTS idx_messages_chat_created ON messages(chat_id, created_at);
@@ -0,0 +1,79 @@
+-- Migration: Refresh-token rotation with token families and revocation log
+-- Every login starts a family; each refresh consumes its refresh token (jti) and
+-- issues the next one in the same family. Presenting an already-used refresh token
+-- again revokes the whole family (token theft). Revocations are appended to
+-- token_revocations, which every API worker mirrors in memory (app/core/revocation.py)
+-- so access-token checks never query the database.
+
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    jti UUID PRIMARY KEY,
+    family_id UUID NOT NULL,
+    user_id UUID NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    issued_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL,
+    used_at TIMESTAMPTZ,
+    revoked_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family ON refresh_tokens(family_id);
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires ON refresh_tokens(expires_at);
+
+-- kind: 'jti' (one token), 'family' (one login), 'user' (tokens issued before revoked_at)
+-- Rows are only needed until every token they cover has expired (expires_at).
+CREATE TABLE IF NOT EXISTS token_revocations (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL CHECK (kind IN ('jti', 'family', 'user')),
+    value TEXT NOT NULL,
+    revoked_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_token_revocations_expires ON token_revocations(expires_at);
+-- Workers sync by revoked_at (app/core/revocation.py)
+CREATE INDEX IF NOT EXISTS idx_token_revocations_revoked ON token_revocations(revoked_at);
+
+-- Consume p_jti and issue p_new_jti in the same family, atomically.
+-- Returns {"status": "rotated", "user_id", "family_id", "email"} or a status of
+-- "unknown" | "expired" | "revoked" | "raced" (used within p_grace_seconds, e.g. two
+-- app tabs refreshing at once) | "reused" (family revoked).
+CREATE OR REPLACE FUNCTION rotate_refresh_token(p_jti UUID, p_new_jti UUID, p_expires_at TIMESTAMPTZ, p_grace_seconds INTEGER DEFAULT 10)
+RETURNS JSONB AS $$
+DECLARE
+    v_token refresh_tokens%ROWTYPE;
+    v_email TEXT;
+BEGIN
+    UPDATE refresh_tokens SET used_at = NOW()
+    WHERE jti = p_jti AND used_at IS NULL AND revoked_at IS NULL AND expires_at > NOW()
+    RETURNING * INTO v_token;
+
+    IF NOT FOUND THEN
+        SELECT * INTO v_token FROM refresh_tokens WHERE jti = p_jti;
+        IF NOT FOUND THEN
+            RETURN jsonb_build_object('status', 'unknown');
+        ELSIF v_token.revoked_at IS NOT NULL THEN
+            RETURN jsonb_build_object('status', 'revoked', 'user_id', v_token.user_id, 'family_id', v_token.family_id);
+        ELSIF v_token.used_at IS NULL THEN
+            RETURN jsonb_build_object('status', 'expired', 'user_id', v_token.user_id, 'family_id', v_token.family_id);
+        ELSIF v_token.used_at > NOW() - make_interval(secs => p_grace_seconds) THEN
+            RETURN jsonb_build_object('status', 'raced', 'user_id', v_token.user_id, 'family_id', v_token.family_id);
+        END IF;
+
+        UPDATE refresh_tokens SET revoked_at = NOW()
+        WHERE family_id = v_token.family_id AND revoked_at IS NULL;
+        INSERT INTO token_revocations (kind, value, expires_at)
+        SELECT 'family', v_token.family_id::text, MAX(expires_at)
+        FROM refresh_tokens WHERE family_id = v_token.family_id;
+        RETURN jsonb_build_object('status', 'reused', 'user_id', v_token.user_id, 'family_id', v_token.family_id);
+    END IF;
+
+    SELECT email INTO v_email FROM profiles WHERE id = v_token.user_id;
+    INSERT INTO refresh_tokens (jti, family_id, user_id, expires_at)
+    VALUES (p_new_jti, v_token.family_id, v_token.user_id, p_expires_at);
+    RETURN jsonb_build_object('status', 'rotated', 'user_id', v_token.user_id, 'family_id', v_token.family_id, 'email', v_email);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Housekeeping (e.g. daily via pg_cron): drop rows no live token depends on
+CREATE OR REPLACE FUNCTION prune_expired_tokens()
+RETURNS VOID AS $$
+    DELETE FROM refresh_tokens WHERE expires_at < NOW();
+    DELETE FROM token_revocations WHERE expires_at < NOW();
+$$ LANGUAGE sql;
@@ -0,0 +1,88 @@
+-- Migration: Precomputed patient context digest for the AI assistant
+-- A compact text summary of the medical profile, history tables and recent documents
+-- (app/core/patient_context.py). The chat path reads it with the profiles row it already
+-- loads, instead of querying seven tables on every turn.
+-- Writes never rebuild it: triggers on the source tables (profile columns the digest shows,
+-- any history or document change) bump profiles.context_digest_version, and the next chat
+-- message rebuilds the digest when context_digest_built_version is behind (NULL = never
+-- built). A build that raced with a write is not stored, so it cannot hide the newer data.
+
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS context_digest TEXT;
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS context_digest_at TIMESTAMPTZ;
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS context_digest_version INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE profiles ADD COLUMN IF NOT EXISTS context_digest_built_version INTEGER;
+
+-- `changed` is the statement's transition table (new rows, or old rows for DELETE)
+CREATE OR REPLACE FUNCTION mark_context_digest_stale() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'medical_documents' THEN
+        -- medical_documents.user_id may be TEXT or UUID
+        UPDATE profiles SET context_digest_version = context_digest_version + 1
+        WHERE id IN (
+            SELECT DISTINCT user_id::TEXT::UUID FROM changed
+            WHERE user_id::TEXT ~* '^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}$'
+        );
+    ELSIF TG_TABLE_NAME = 'user_medical_profiles' THEN
+        UPDATE profiles SET context_digest_version = context_digest_version + 1
+        WHERE id IN (SELECT DISTINCT user_id FROM changed);
+    ELSE
+        UPDATE profiles p SET context_digest_version = p.context_digest_version + 1
+        FROM (
+            SELECT DISTINCT m.user_id FROM user_medical_profiles m
+            WHERE m.id IN (SELECT profile_id FROM changed)
+        ) owners
+        WHERE p.id = owners.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Profile updates: row-level because a trigger limited to columns (UPDATE OF) cannot
+-- have a transition table. Only the columns the digest shows count; score writes from
+-- refresh_completion_score and the rescore job do not make the digest stale.
+CREATE OR REPLACE FUNCTION mark_profile_digest_stale() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE profiles SET context_digest_version = context_digest_version + 1 WHERE id = NEW.user_id;
+    RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['user_medical_profiles', 'chronic_conditions', 'medications', 'allergies',
+                             'surgical_history', 'family_history', 'lab_values', 'medical_documents'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_digest_ins', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_digest_upd', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', t || '_digest_del', t);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS changed '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION mark_context_digest_stale()', t || '_digest_ins', t);
+        IF t = 'user_medical_profiles' THEN
+            EXECUTE format('CREATE TRIGGER %I AFTER UPDATE OF age, biological_sex, height_cm, weight_kg, '
+                           'pregnancy_status, smoking_status, alcohol_consumption, exercise_frequency, '
+                           'sleep_duration, diet_type, stress_level ON %I FOR EACH ROW '
+                           'EXECUTE FUNCTION mark_profile_digest_stale()', t || '_digest_upd', t);
+        ELSE
+            EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING NEW TABLE AS changed '
+                           'FOR EACH STATEMENT EXECUTE FUNCTION mark_context_digest_stale()', t || '_digest_upd', t);
+        END IF;
+        EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS changed '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION mark_context_digest_stale()', t || '_digest_del', t);
+    END LOOP;
+END;
+$$;
+
+-- profiles.updated_at feeds the /auth/me ETag: digest bookkeeping (version bumps and
+-- rebuilds) is not a profile change, so it no longer touches updated_at
+DROP TRIGGER IF EXISTS update_profiles_updated_at ON profiles;
+CREATE TRIGGER update_profiles_updated_at BEFORE UPDATE ON profiles
+    FOR EACH ROW
+    WHEN ((to_jsonb(OLD) - ARRAY['updated_at', 'context_digest', 'context_digest_at',
+                                 'context_digest_version', 'context_digest_built_version'])
+          IS DISTINCT FROM
+          (to_jsonb(NEW) - ARRAY['updated_at', 'context_digest', 'context_digest_at',
+                                 'context_digest_version', 'context_digest_built_version']))
+    EXECUTE FUNCTION update_updated_at_column();
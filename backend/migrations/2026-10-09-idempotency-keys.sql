@@ -0,0 +1,58 @@
+-- Migration: Idempotency-Key store for retried POSTs (app/core/idempotency.py)
+-- One row per (user, endpoint, key). While the first request runs, status_code is NULL
+-- and expires_at is a short lock renewed by the running worker; a crashed worker's lock
+-- simply expires. Once the request completes its response is stored and replayed to
+-- retries until expires_at. Keys belong to the authenticated user and go with the account.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id UUID NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    endpoint TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    status_code INTEGER,
+    response JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (user_id, endpoint, key)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_at);
+
+-- Claim a key in one statement sequence. Returns {"state": "claimed"} for the caller
+-- that must execute the request, otherwise "in_flight", "mismatch" (same key, different
+-- request body) or "completed" with status_code and response to replay.
+CREATE OR REPLACE FUNCTION claim_idempotency_key(
+    p_user_id UUID, p_endpoint TEXT, p_key TEXT, p_fingerprint TEXT, p_lock_seconds INTEGER
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_row idempotency_keys%ROWTYPE;
+BEGIN
+    DELETE FROM idempotency_keys
+    WHERE user_id = p_user_id AND endpoint = p_endpoint AND key = p_key AND expires_at < NOW();
+
+    INSERT INTO idempotency_keys (user_id, endpoint, key, fingerprint, expires_at)
+    VALUES (p_user_id, p_endpoint, p_key, p_fingerprint, NOW() + make_interval(secs => p_lock_seconds))
+    ON CONFLICT DO NOTHING;
+    IF FOUND THEN
+        RETURN jsonb_build_object('state', 'claimed');
+    END IF;
+
+    SELECT * INTO v_row FROM idempotency_keys
+    WHERE user_id = p_user_id AND endpoint = p_endpoint AND key = p_key;
+    IF NOT FOUND THEN
+        -- Released between our insert attempt and this read: let the client retry
+        RETURN jsonb_build_object('state', 'in_flight');
+    ELSIF v_row.fingerprint <> p_fingerprint THEN
+        RETURN jsonb_build_object('state', 'mismatch');
+    ELSIF v_row.status_code IS NULL THEN
+        RETURN jsonb_build_object('state', 'in_flight');
+    END IF;
+    RETURN jsonb_build_object('state', 'completed', 'status_code', v_row.status_code, 'response', v_row.response);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Housekeeping (e.g. hourly via pg_cron)
+CREATE OR REPLACE FUNCTION prune_idempotency_keys()
+RETURNS VOID AS $$
+    DELETE FROM idempotency_keys WHERE expires_at < NOW();
+$$ LANGUAGE sql;
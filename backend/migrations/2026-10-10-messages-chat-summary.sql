@@ -0,0 +1,53 @@
+-- Migration: Denormalized chat list (last-message preview, sender and count on chats)
+-- GET /ai/chats returns these columns, so the chat list needs no per-chat message reads.
+-- A trigger on messages keeps them current for every insert path (REST, WebSocket, imports)
+-- and also owns chats.last_message_at, so the API no longer updates chats after each message.
+-- Rows re-inserted by rehydrating an archived chat (app/core/message_archive.py) are not
+-- new messages: the trigger skips chats whose archived_at is still set, and archive_chat
+-- writes the summary itself from the full history it has just archived.
+-- message_count is the chat's total, hot and archived; archiving never lowers it.
+-- Requires 2026-10-06-message-archive.sql (chats.archived_at, message_archives).
+
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS last_message_preview TEXT;
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS last_sender TEXT;
+ALTER TABLE chats ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0;
+
+-- Keep in sync with PREVIEW_CHARS in app/core/message_archive.py
+CREATE OR REPLACE FUNCTION chats_track_message() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE chats SET
+        message_count = message_count + 1,
+        last_message_at = GREATEST(last_message_at, NEW.created_at),
+        last_message_preview = CASE WHEN last_message_at IS NULL OR NEW.created_at >= last_message_at
+            THEN left(NEW.content, 160) ELSE last_message_preview END,
+        last_sender = CASE WHEN last_message_at IS NULL OR NEW.created_at >= last_message_at
+            THEN NEW.sender ELSE last_sender END
+    WHERE id = NEW.chat_id AND archived_at IS NULL;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS messages_track_chat ON messages;
+CREATE TRIGGER messages_track_chat
+    AFTER INSERT ON messages
+    FOR EACH ROW EXECUTE FUNCTION chats_track_message();
+
+-- Backfill: hot messages plus archive counts; archived chats get their preview when next archived or posted to
+WITH hot AS (
+    SELECT DISTINCT ON (chat_id) chat_id, content, sender,
+           COUNT(*) OVER (PARTITION BY chat_id) AS n
+    FROM messages
+    ORDER BY chat_id, created_at DESC, id DESC
+)
+UPDATE chats c SET
+    message_count = COALESCE(hot.n, 0) + COALESCE(a.message_count, 0),
+    last_message_preview = left(hot.content, 160),
+    last_sender = hot.sender
+FROM chats c2
+LEFT JOIN hot ON hot.chat_id = c2.id
+LEFT JOIN message_archives a ON a.chat_id = c2.id
+WHERE c.id = c2.id AND (hot.chat_id IS NOT NULL OR a.chat_id IS NOT NULL);
+
+-- GET /ai/chats: the user's chats, most recent first
+CREATE INDEX IF NOT EXISTS idx_chats_user_last_message ON chats(user_id, last_message_at DESC NULLS LAST);
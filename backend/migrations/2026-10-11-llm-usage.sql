@@ -0,0 +1,89 @@
+-- Migration: LLM usage ledger and per-user daily aggregates
+-- Every chat completion and document explanation is recorded by app/core/llm_usage.py:
+-- model, prompt/completion tokens, cost (when the provider reports it) and latency.
+-- Workers buffer records in memory and write them in batches through record_llm_usage(),
+-- which appends to the ledger and folds the same rows into llm_usage_daily in one statement.
+-- llm_usage_daily serves GET /ai/usage and the daily token quota (LLM_DAILY_TOKEN_BUDGET).
+-- Both tables belong to the authenticated user and go with the account.
+
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id BIGSERIAL PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    feature TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cost_usd NUMERIC(12, 6),
+    latency_ms INTEGER NOT NULL,
+    first_token_ms INTEGER,
+    status TEXT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_usage_user_created ON llm_usage(user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS llm_usage_daily (
+    user_id UUID NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    model TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    cost_usd NUMERIC(14, 6) NOT NULL DEFAULT 0,
+    latency_ms_total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, model)
+);
+
+-- One batch: [{"user_id", "feature", "model", "prompt_tokens", "completion_tokens", "cost_usd",
+--              "latency_ms", "first_token_ms", "status", "created_at"}, ...]. Returns the row count.
+CREATE OR REPLACE FUNCTION record_llm_usage(p_rows JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    WITH r AS (
+        SELECT * FROM jsonb_to_recordset(p_rows) AS x(
+            user_id UUID, feature TEXT, model TEXT, prompt_tokens INTEGER, completion_tokens INTEGER,
+            cost_usd NUMERIC, latency_ms INTEGER, first_token_ms INTEGER, status TEXT, created_at TIMESTAMPTZ
+        )
+        -- an account deleted before its buffered usage was flushed must not fail the whole batch
+        WHERE EXISTS (SELECT 1 FROM profiles p WHERE p.id = x.user_id)
+    ), ledger AS (
+        INSERT INTO llm_usage (user_id, feature, model, prompt_tokens, completion_tokens, cost_usd,
+                               latency_ms, first_token_ms, status, created_at)
+        SELECT user_id, feature, model, prompt_tokens, completion_tokens, cost_usd,
+               latency_ms, first_token_ms, status, created_at
+        FROM r
+    )
+    INSERT INTO llm_usage_daily AS d (user_id, day, model, calls, errors, prompt_tokens,
+                                      completion_tokens, cost_usd, latency_ms_total)
+    SELECT user_id, (created_at AT TIME ZONE 'UTC')::date, model, COUNT(*),
+           COUNT(*) FILTER (WHERE status <> 'ok'), SUM(prompt_tokens), SUM(completion_tokens),
+           COALESCE(SUM(cost_usd), 0), SUM(latency_ms)
+    FROM r
+    GROUP BY 1, 2, 3
+    ON CONFLICT (user_id, day, model) DO UPDATE SET
+        calls = d.calls + EXCLUDED.calls,
+        errors = d.errors + EXCLUDED.errors,
+        prompt_tokens = d.prompt_tokens + EXCLUDED.prompt_tokens,
+        completion_tokens = d.completion_tokens + EXCLUDED.completion_tokens,
+        cost_usd = d.cost_usd + EXCLUDED.cost_usd,
+        latency_ms_total = d.latency_ms_total + EXCLUDED.latency_ms_total;
+    RETURN jsonb_array_length(p_rows);
+END;
+$$;
+
+-- Housekeeping: per-call rows are kept p_days; the daily aggregates are kept
+CREATE OR REPLACE FUNCTION prune_llm_usage(p_days INTEGER DEFAULT 90)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_deleted INTEGER;
+BEGIN
+    DELETE FROM llm_usage WHERE created_at < NOW() - make_interval(days => p_days);
+    GET DIAGNOSTICS v_deleted = ROW_COUNT;
+    RETURN v_deleted;
+END;
+$$;
@@ -0,0 +1,6 @@
+-- Migration: Remember related fields answered with "none"
+-- An answer like "no allergies" parses to an empty list, which leaves nothing to store in
+-- the related table; without a marker the onboarding flow kept asking the same question.
+-- app/api/onboarding.py adds such fields here and _next_question skips them.
+
+ALTER TABLE onboarding_sessions ADD COLUMN IF NOT EXISTS answered_none TEXT[] NOT NULL DEFAULT '{}';
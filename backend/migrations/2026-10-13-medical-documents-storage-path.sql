@@ -0,0 +1,17 @@
+-- Migration: One medical_documents row per stored object
+-- POST /documents/process is idempotent on the storage path: a repeated call returns the
+-- document already created for that path instead of inserting a duplicate. Rows from
+-- before this column stay NULL, except that the oldest row per file URL is backfilled.
+
+ALTER TABLE medical_documents ADD COLUMN IF NOT EXISTS storage_path TEXT;
+
+UPDATE medical_documents d SET storage_path = first.path
+FROM (
+    SELECT DISTINCT ON (file_url) id, substring(file_url FROM '/storage/v1/object/public/[^/]+/(.+)$') AS path
+    FROM medical_documents
+    WHERE file_url IS NOT NULL
+    ORDER BY file_url, created_at, id
+) first
+WHERE d.id = first.id AND d.storage_path IS NULL AND first.path IS NOT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS medical_documents_storage_path_key ON medical_documents (storage_path);
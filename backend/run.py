@@ -1,10 +1,15 @@
 """
-Development server runner
-Run with: python run.py
+Server runner
+Run with: python run.py          (development, auto-reload, single process)
+          python run.py --prod   (production profile, see gunicorn_conf.py)
 """
+import os
+import sys
 import uvicorn
 
 if __name__ == "__main__":
+    if "--prod" in sys.argv:
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn_conf.py", "app.main:app"])
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
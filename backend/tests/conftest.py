@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Settings are read at import time; tests never reach these services
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test.service.key")
+os.environ.setdefault("OPENROUTER_MODEL", "test-model")
+os.environ.setdefault("OPENROUTER_API_KEY", "test-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,44 @@
+import io
+import json
+
+import pytest
+
+from app.core import fhir_import
+from app.core.fhir_import import iter_resources
+
+CONDITION = {"resourceType": "Condition", "id": "c1", "code": {"text": "Asthma"}}
+
+
+@pytest.fixture(params=["ijson", "json"])
+def parser(request, monkeypatch):
+    # Bundles are streamed with ijson when installed and parsed with json otherwise
+    if request.param == "json":
+        monkeypatch.setattr(fhir_import, "ijson", None)
+    elif fhir_import.ijson is None:
+        pytest.skip("ijson not installed")
+    return request.param
+
+
+def _bundle(entries) -> io.BytesIO:
+    return io.BytesIO(json.dumps({"resourceType": "Bundle", "entry": entries}).encode())
+
+
+def test_malformed_bundle_entries_yield_none(parser):
+    entries = [{"resource": CONDITION}, "oops", 7, None, {"resource": "oops"}, {"resource": [1]}, {"fullUrl": "x"}]
+
+    assert list(iter_resources(_bundle(entries))) == [CONDITION, None, None, None, None, None]
+
+
+def test_malformed_entries_are_reported_per_record(parser):
+    importer = fhir_import.FhirImporter(supabase=None, user_id="u1")
+    for index, resource in enumerate(iter_resources(_bundle(["oops", {"resource": 1}]))):
+        importer.add(index, resource)
+
+    assert importer.stats["resources"] == 2
+    assert [e["error"] for e in importer.errors] == ["Invalid JSON resource"] * 2
+
+
+def test_ndjson_lines_that_are_not_objects_are_reported():
+    lines = io.BytesIO(b'{"resourceType": "Condition"}\n[1, 2]\nnot json\n')
+
+    assert list(iter_resources(lines, ndjson=True)) == [{"resourceType": "Condition"}, [1, 2], None]
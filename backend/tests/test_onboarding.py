@@ -0,0 +1,213 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+from postgrest.exceptions import APIError
+
+from app.api import onboarding
+from app.api.onboarding import OnboardingAnswerRequest, _next_question, submit_answer
+from app.core.onboarding_parsers import parse_answer
+from app.core.profile_scoring import CRITICAL_FIELDS, ENHANCEMENT_FIELDS, IMPORTANT_FIELDS, RELATED_FIELDS
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, db, table):
+        self.db, self.table, self.payload = db, table, None
+
+    def select(self, *args):
+        return self
+
+    def update(self, payload):
+        self.payload = payload
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def execute(self):
+        if self.table == "onboarding_sessions":
+            if self.payload is not None:
+                self.db.session.update(self.payload)
+            return _Result([dict(self.db.session)])
+        return _Result([{"id": 1}])
+
+
+class FakeSupabase:
+    def __init__(self, session):
+        self.session = session
+
+    def table(self, name):
+        return _Query(self, name)
+
+
+def _profile(missing=()):
+    profile = {"id": 1, "user_id": "u1", "profile_completion_score": 50.0}
+    for field in CRITICAL_FIELDS + IMPORTANT_FIELDS + ENHANCEMENT_FIELDS:
+        if field not in missing:
+            profile[field] = [{"id": 1}] if field in RELATED_FIELDS else "x"
+    for field in missing:
+        profile[field] = [] if field in RELATED_FIELDS else None
+    return profile
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """Profile state behind the fakes; related writes are captured"""
+    state = {"profile": _profile(missing=("allergies", "family_history")), "related_writes": []}
+    monkeypatch.setattr(onboarding, "fetch_profile_with_related", lambda *a, **k: state["profile"])
+    monkeypatch.setattr(onboarding, "refresh_completion_score", lambda *a, **k: state["profile"])
+    monkeypatch.setattr(onboarding, "write_related_records", lambda sb, uid, upserts, deletes: state["related_writes"].append(upserts))
+    return state
+
+
+def test_next_question_skips_fields_answered_none():
+    profile = _profile(missing=("allergies", "family_history"))
+    assert _next_question(profile) == "allergies"
+    assert _next_question(profile, ["allergies"]) == "family_history"
+    assert _next_question(profile, ["allergies", "family_history"]) is None
+
+
+def test_none_answer_to_related_field_advances_the_session(stored):
+    supabase = FakeSupabase({"user_id": "u1", "is_active": True, "current_step": "allergies", "answered_none": []})
+
+    result = submit_answer(OnboardingAnswerRequest(user_id="u1", answer={"response": "none"}), supabase)
+
+    assert stored["related_writes"] == []  # nothing to insert for "none"
+    assert result["next_question"] == "family_history"
+    assert supabase.session["answered_none"] == ["allergies"]
+    assert supabase.session["current_step"] == "family_history"
+
+
+def test_none_answers_accumulate_until_onboarding_has_no_question_left(stored):
+    supabase = FakeSupabase({"user_id": "u1", "is_active": True, "current_step": "allergies", "answered_none": []})
+
+    submit_answer(OnboardingAnswerRequest(user_id="u1", answer={"response": "no"}), supabase)
+    result = submit_answer(OnboardingAnswerRequest(user_id="u1", answer={"response": "none"}), supabase)
+
+    assert supabase.session["answered_none"] == ["allergies", "family_history"]
+    assert result["next_question"] is None
+
+
+class _Rpc:
+    def __init__(self, calls, data=None, error=None):
+        self.calls, self.data, self.error = calls, data, error
+
+    def rpc(self, name, params):
+        self.calls.append((name, params))
+        return self
+
+    def execute(self):
+        if self.error is not None:
+            raise self.error
+        return _Result(self.data)
+
+
+def test_bootstrap_is_one_rpc_and_starts_at_the_first_unanswered_field():
+    calls = []
+    profile = _profile(missing=("age", "allergies"))
+    session = {"user_id": "u1", "is_active": True, "current_step": None, "answered_none": []}
+    supabase = _Rpc(calls, data={"profile": profile, "session": session})
+
+    result = onboarding.bootstrap("u1", supabase)
+
+    assert calls == [("bootstrap_onboarding", {"p_user_id": "u1"})]
+    assert result["next_question"] == "age"
+    assert result["completion_score"] == 50.0
+    assert "allergies" not in result["profile"]  # related lists are stripped from the response
+
+
+def test_bootstrap_resumes_the_stored_step():
+    session = {"user_id": "u1", "is_active": True, "current_step": "weight_kg"}
+    supabase = _Rpc([], data={"profile": _profile(), "session": session})
+
+    assert onboarding.bootstrap("u1", supabase)["next_question"] == "weight_kg"
+
+
+@pytest.mark.parametrize("code, status", [("23503", 404), ("42883", 400)])
+def test_bootstrap_maps_rpc_errors(code, status):
+    supabase = _Rpc([], error=APIError({"message": "boom", "code": code, "hint": None, "details": None}))
+
+    with pytest.raises(HTTPException) as exc:
+        onboarding.bootstrap("u1", supabase)
+    assert exc.value.status_code == status
+
+
+class BootstrapDatabase:
+    """
+    bootstrap_onboarding() statement by statement: each INSERT ... ON CONFLICT (user_id)
+    is atomic (the unique index), and other callers may run between statements
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles, self.sessions = [], []
+
+    def rpc(self, name, params):
+        assert name == "bootstrap_onboarding"
+        user_id = params["p_user_id"]
+        with self.lock:
+            if not any(p["user_id"] == user_id for p in self.profiles):
+                self.profiles.append({"id": len(self.profiles) + 1, "user_id": user_id, "profile_completion_score": 0.0})
+        time.sleep(0.001)
+        with self.lock:
+            profile = next(p for p in self.profiles if p["user_id"] == user_id)
+            session = next((s for s in self.sessions if s["user_id"] == user_id), None)
+            if session is None:
+                session = {"id": len(self.sessions) + 1, "user_id": user_id, "is_active": True, "current_step": None}
+                self.sessions.append(session)
+            elif not session["is_active"]:
+                session["is_active"] = True
+        related = {field: [] for field in RELATED_FIELDS}
+        return _Rpc([], data={"profile": {**profile, **related}, "session": dict(session)})
+
+
+def test_concurrent_first_bootstraps_create_one_profile_and_one_session():
+    db = BootstrapDatabase()
+    start = threading.Barrier(16)
+
+    def first_visit(_):
+        start.wait()
+        return onboarding.bootstrap("u1", db)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(first_visit, range(16)))
+
+    assert len(db.profiles) == 1
+    assert len(db.sessions) == 1
+    assert {r["profile"]["id"] for r in results} == {1}
+    assert {r["session"]["id"] for r in results} == {1}
+
+
+def test_get_profile_bootstraps_a_user_without_a_profile(monkeypatch):
+    # Clients that only ever call GET /onboarding/profile keep working
+    db = BootstrapDatabase()
+    monkeypatch.setattr(onboarding, "fetch_profile_with_related", lambda *a, **k: None)
+
+    result = onboarding.get_profile("u1", db)
+
+    assert len(db.profiles) == 1 and len(db.sessions) == 1
+    assert result["next_question"] == CRITICAL_FIELDS[0]
+    assert result["completion_score"] == 0.0
+
+
+@pytest.mark.parametrize("field, raw, expected", [
+    ("pregnancy_status", "not sure", "unknown"),
+    ("pregnancy_status", "I don't know", "unknown"),
+    ("pregnancy_status", "no", "not_pregnant"),
+    ("pregnancy_status", "not pregnant", "not_pregnant"),
+    ("pregnancy_status", "yes", "pregnant"),
+    ("smoking_status", "No, I quit", "former"),
+    ("smoking_status", "I don't smoke anymore", "former"),
+    ("smoking_status", "no", "never"),
+    ("smoking_status", "never smoked", "never"),
+    ("smoking_status", "yes, daily", "current"),
+])
+def test_choice_parsers_check_specific_phrases_before_negations(field, raw, expected):
+    assert parse_answer(field, raw) == expected
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from app.core.profile_scoring import (
+    CRITICAL_FIELDS, ENHANCEMENT_FIELDS, IMPORTANT_FIELDS, RELATED_FIELDS,
+    calculate_profile_completion, calculate_profile_completion_batch,
+)
+
+COLUMN_VALUES = {
+    'age': 42, 'biological_sex': 'female', 'height_cm': 170, 'weight_kg': 65.5,
+    'pregnancy_status': 'not_pregnant', 'smoking_status': 'never', 'alcohol_consumption': 'occasional',
+    'exercise_frequency': 'weekly', 'sleep_duration': 7, 'diet_type': 'vegetarian', 'stress_level': 'low',
+}
+COLUMN_FIELDS = [f for f in CRITICAL_FIELDS + IMPORTANT_FIELDS + ENHANCEMENT_FIELDS if f not in RELATED_FIELDS]
+
+
+def _profiles():
+    rng = np.random.default_rng(7)
+    profiles = [
+        {},  # empty
+        {field: None for field in COLUMN_FIELDS},  # every column NULL
+        {field: '' for field in COLUMN_FIELDS},
+        {'id': 3},  # related-only: filled in through `related` below
+        dict(COLUMN_VALUES),
+        {'age': 0, 'sleep_duration': 0},  # falsy but answered
+    ]
+    for _ in range(200):
+        profiles.append({
+            field: rng.choice([COLUMN_VALUES[field], None, ''])
+            for field in COLUMN_FIELDS if rng.random() < 0.8
+        })
+    return profiles
+
+
+def _related(n):
+    rng = np.random.default_rng(11)
+    related = {field: rng.random(n) < 0.5 for field in RELATED_FIELDS}
+    for field in RELATED_FIELDS:
+        related[field][0] = False  # the empty profile stays empty
+        related[field][3] = True  # the related-only profile has every table
+    return related
+
+
+def test_batch_matches_scalar_with_related_presence():
+    profiles = _profiles()
+    related = _related(len(profiles))
+    scores = calculate_profile_completion_batch(profiles, related)
+
+    for k, profile in enumerate(profiles):
+        merged = dict(profile)
+        for field, present in related.items():
+            merged[field] = [{'id': 1}] if present[k] else []
+        assert scores[k] == calculate_profile_completion(merged), profile
+
+    assert scores[0] == 0
+    assert scores[3] == calculate_profile_completion({field: [{'id': 1}] for field in RELATED_FIELDS})
+
+
+def test_batch_matches_scalar_with_embedded_related_lists():
+    # Profiles read through fetch_profile_with_related carry related rows as lists
+    profiles = _profiles()
+    related = _related(len(profiles))
+    for k, profile in enumerate(profiles):
+        for field, present in related.items():
+            profile[field] = [{'id': 1}] if present[k] else []
+
+    scores = calculate_profile_completion_batch(profiles)
+
+    assert list(scores) == [calculate_profile_completion(p) for p in profiles]
+
+
+@pytest.mark.parametrize('profiles', [[], [{}], [dict(COLUMN_VALUES, **{f: [{'id': 1}] for f in RELATED_FIELDS})]])
+def test_batch_edge_cases(profiles):
+    assert list(calculate_profile_completion_batch(profiles)) == [calculate_profile_completion(p) for p in profiles]
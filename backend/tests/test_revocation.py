@@ -0,0 +1,77 @@
+import time
+from datetime import datetime, timezone
+
+from app.core.revocation import RevocationFilter
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+class _Query:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, *args):
+        return self
+
+    def gt(self, column, value):
+        return _Query([r for r in self.rows if r[column] > value])
+
+    def gte(self, column, value):
+        return _Query([r for r in self.rows if r[column] >= value])
+
+    def order(self, column):
+        return _Query(sorted(self.rows, key=lambda r: r[column]))
+
+    def range(self, start, end):
+        return _Query(self.rows[start:end + 1])
+
+    def execute(self):
+        return type("Result", (), {"data": self.rows})()
+
+
+class FakeSupabase:
+    """token_revocations with only the rows committed so far"""
+
+    def __init__(self):
+        self.committed = []
+
+    def commit(self, row_id, kind, value, revoked_at):
+        self.committed.append({
+            "id": row_id, "kind": kind, "value": value,
+            "revoked_at": _iso(revoked_at), "expires_at": _iso(time.time() + 900),
+        })
+
+    def table(self, name):
+        assert name == "token_revocations"
+        return _Query(list(self.committed))
+
+
+def test_late_commit_with_lower_id_is_still_applied():
+    now = time.time()
+    supabase = FakeSupabase()
+    revocations = RevocationFilter()
+
+    # id 1 was handed out first but its transaction commits after id 2 was synced
+    supabase.commit(2, "jti", "token-b", now)
+    assert revocations.sync(supabase) == 1
+    supabase.commit(1, "jti", "token-a", now - 5)
+
+    assert revocations.sync(supabase) == 1
+    assert revocations.is_revoked({"jti": "token-a"})
+    assert revocations.is_revoked({"jti": "token-b"})
+
+
+def test_overlap_window_rows_are_not_added_twice():
+    now = time.time()
+    supabase = FakeSupabase()
+    revocations = RevocationFilter()
+    supabase.commit(1, "user", "u1", now - 10)
+    supabase.commit(2, "family", "f1", now)
+
+    assert revocations.sync(supabase, page_size=1) == 2
+    assert revocations.sync(supabase, page_size=1) == 0
+    supabase.commit(3, "jti", "t3", now + 1)
+    assert revocations.sync(supabase, page_size=1) == 1
+    assert len(revocations) == 3
@@ -0,0 +1,8 @@
+import 'dart:math';
+
+final _random = Random.secure();
+
+/// Random 128-bit hex key for the `Idempotency-Key` header. Create one per
+/// user action and reuse it when retrying that action, so the server runs it once.
+String newIdempotencyKey() =>
+    List.generate(16, (_) => _random.nextInt(256).toRadixString(16).padLeft(2, '0')).join();
@@ -7,8 +7,8 @@ class ChatRepository {
 
   Future<List<ChatMessageModel>> fetchMessages(String chatId) =>
       _service.fetchMessages(chatId);
-  Future<void> sendMessage(String chatId, String content) =>
-      _service.sendMessage(chatId, content);
+  Future<void> sendMessage(String chatId, String content, {required String idempotencyKey}) =>
+      _service.sendMessage(chatId, content, idempotencyKey: idempotencyKey);
   Future<String> createChat([String? title]) => _service.createChat(title);
   Future<void> deleteChat(String chatId) => _service.deleteChat(chatId);
 }
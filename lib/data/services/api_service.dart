@@ -17,10 +17,10 @@ class ApiService {
     }
   }
 
-  /// Get medical profile and completion score
+  /// Get (creating on first use) medical profile, onboarding session and completion score
   Future<Map<String, dynamic>> getMedicalProfile(String userId) async {
-    final response = await _dio.get(
-      '/onboarding/profile',
+    final response = await _dio.post(
+      '/onboarding/bootstrap',
       queryParameters: {'user_id': userId},
     );
     return response.data;
@@ -11,10 +11,12 @@ class ChatService {
     return data.map((e) => ChatMessageModel.fromJson(e)).toList();
   }
 
-  Future<void> sendMessage(String chatId, String content) async {
+  /// Pass the same [idempotencyKey] when retrying a send so the message is stored once.
+  Future<void> sendMessage(String chatId, String content, {required String idempotencyKey}) async {
     await _dio.post(
       '/ai/chats/$chatId/messages',
       data: {'chat_id': chatId, 'content': content, 'sender': 'user'},
+      options: Options(headers: {'Idempotency-Key': idempotencyKey}),
     );
   }
 
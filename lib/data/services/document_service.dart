@@ -1,5 +1,6 @@
 import 'package:dio/dio.dart';
 import '../../core/config/api_config.dart';
+import 'storage_service.dart';
 
 class DocumentService {
   Future<void> deleteDocument(String docId) async {
@@ -8,17 +9,31 @@ class DocumentService {
 
   final Dio _dio;
 
-  DocumentService([Dio? dio])
-    : _dio =
-          dio ??
-          Dio(
-            BaseOptions(
-              baseUrl: ApiConfig.baseUrl,
-              connectTimeout: ApiConfig.connectTimeout,
-              receiveTimeout: ApiConfig.receiveTimeout,
-              headers: {'Content-Type': 'application/json'},
-            ),
-          );
+  DocumentService([Dio? dio]) : _dio = dio ?? _authorizedDio();
+
+  // Document endpoints are scoped to the signed-in user
+  static Dio _authorizedDio() {
+    final dio = Dio(
+      BaseOptions(
+        baseUrl: ApiConfig.baseUrl,
+        connectTimeout: ApiConfig.connectTimeout,
+        receiveTimeout: ApiConfig.receiveTimeout,
+        headers: {'Content-Type': 'application/json'},
+      ),
+    );
+    dio.interceptors.add(
+      InterceptorsWrapper(
+        onRequest: (options, handler) async {
+          final token = await StorageService.getAccessToken();
+          if (token != null) {
+            options.headers['Authorization'] = 'Bearer $token';
+          }
+          return handler.next(options);
+        },
+      ),
+    );
+    return dio;
+  }
 
   Future<List<dynamic>> listDocuments() async {
     final response = await _dio.get('/documents/list');
@@ -30,16 +45,22 @@ class DocumentService {
     return response.data as Map<String, dynamic>;
   }
 
+  /// Pass the same [idempotencyKey] when retrying an upload so the document is created once.
   Future<Map<String, dynamic>> uploadDocument({
     required String filePath,
     required String fileName,
     required String userId,
+    required String idempotencyKey,
   }) async {
     final formData = FormData.fromMap({
       'file': await MultipartFile.fromFile(filePath, filename: fileName),
       'user_id': userId,
     });
-    final response = await _dio.post('/documents/upload', data: formData);
+    final response = await _dio.post(
+      '/documents/upload',
+      data: formData,
+      options: Options(headers: {'Idempotency-Key': idempotencyKey}),
+    );
     return response.data as Map<String, dynamic>;
   }
 }
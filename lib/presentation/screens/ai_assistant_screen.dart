@@ -2,6 +2,7 @@ import 'package:flutter/material.dart';
 import 'package:flutter_riverpod/flutter_riverpod.dart';
 import '../../providers/chat_provider.dart';
 import '../../data/models/chat_message.dart';
+import '../../core/utils/idempotency_key.dart';
 
 class ChatMessage {
   final String sender; // 'user' or 'ai'
@@ -28,6 +29,10 @@ class _AiAssistantScreenState extends ConsumerState<AiAssistantScreen> {
   List<ChatMessageModel> _messages = [];
   bool _isLoading = false;
   bool _initLoading = true;
+  // Key of the last send that failed; resending the same text reuses it so the
+  // server stores the message once even if the failed request actually landed
+  String? _pendingText;
+  String? _pendingKey;
 
   @override
   void initState() {
@@ -39,6 +44,8 @@ class _AiAssistantScreenState extends ConsumerState<AiAssistantScreen> {
     setState(() {
       _initLoading = true;
       _messages = [];
+      _pendingText = null;
+      _pendingKey = null;
     });
     final repo = ref.read(chatRepositoryProvider);
     final chatId = await repo.createChat();
@@ -51,13 +58,19 @@ class _AiAssistantScreenState extends ConsumerState<AiAssistantScreen> {
   Future<void> _sendMessage() async {
     final text = _controller.text.trim();
     if (text.isEmpty || _chatId == null) return;
+    if (_pendingText != text) {
+      _pendingText = text;
+      _pendingKey = newIdempotencyKey();
+    }
     setState(() {
       _isLoading = true;
       _controller.clear();
     });
     final repo = ref.read(chatRepositoryProvider);
     try {
-      await repo.sendMessage(_chatId!, text);
+      await repo.sendMessage(_chatId!, text, idempotencyKey: _pendingKey!);
+      _pendingText = null;
+      _pendingKey = null;
       // Wait a short moment to ensure AI message is stored
       await Future.delayed(const Duration(milliseconds: 600));
       final msgs = await repo.fetchMessages(_chatId!);
@@ -90,6 +103,8 @@ class _AiAssistantScreenState extends ConsumerState<AiAssistantScreen> {
     } catch (e) {
       setState(() {
         _isLoading = false;
+        // Put the text back so the user can retry the same send
+        if (_pendingText != null) _controller.text = _pendingText!;
       });
       ScaffoldMessenger.of(
         context,
@@ -1,6 +1,7 @@
 import 'package:flutter/material.dart';
 import 'package:file_picker/file_picker.dart';
 import '../../../data/services/document_service.dart';
+import '../../../core/utils/idempotency_key.dart';
 import 'dart:async';
 
 class DocumentDigitizingScreen extends StatefulWidget {
@@ -16,6 +17,8 @@ class _DocumentDigitizingScreenState extends State<DocumentDigitizingScreen> {
   String? _selectedFilePath;
   bool _isUploading = false;
   String? _uploadStatus;
+  // One key per picked file, reused when the upload of that file is retried
+  String? _uploadKey;
 
   List<dynamic> _documents = [];
   Map<String, dynamic>? _selectedDocument;
@@ -79,6 +82,7 @@ class _DocumentDigitizingScreenState extends State<DocumentDigitizingScreen> {
         _selectedFileName = result.files.single.name;
         _selectedFilePath = result.files.single.path;
         _uploadStatus = null;
+        _uploadKey = newIdempotencyKey();
       });
     }
   }
@@ -96,6 +100,7 @@ class _DocumentDigitizingScreenState extends State<DocumentDigitizingScreen> {
         filePath: _selectedFilePath!,
         fileName: _selectedFileName!,
         userId: userId,
+        idempotencyKey: _uploadKey ??= newIdempotencyKey(),
       );
       setState(() {
         _uploadStatus = 'Upload successful!';